@@ -98,6 +98,8 @@ param.resolve_path.search_paths+=[_root_path,_package_path]
 # alternative would be an import hook, which would only run on
 # attempting to import Image etc.
 
+from topo.misc.util import alias_module
+
 try:
     import Image
 except ImportError:
@@ -107,17 +109,9 @@ except ImportError:
     sys.modules['ImageOps']=ImageOps
     sys.modules['ImageDraw']=ImageDraw
     sys.modules['ImageFont']=ImageFont
-
-# ImageTk is completely optional
-try:
-    import ImageTk
-except ImportError:
-    try:
-        from PIL import ImageTk  # pyflakes:ignore (try/except import)
-        import sys
-        sys.modules['ImageTk']=ImageTk
-    except ImportError:
-        pass
+    # ImageTk is completely optional, and imports Tkinter, so it is
+    # only imported if used (e.g. by the GUI)
+    alias_module('ImageTk','PIL.ImageTk')
 
 
 # CEBALERT: can we move these pickle support functions elsewhere?  In
@@ -215,21 +209,32 @@ sys.modules['topo.numbergen.basic']=numbergen
 # imagen used to be part of topo; import its files at their former locations
 # for backwards compatibility and set the time function to be topo.sim.time()
 import imagen as pattern
-import imagen.random, imagen.image, imagen.patterncoordinator
 sys.modules['topo.base.boundingregion']=pattern.boundingregion
 sys.modules['topo.base.sheetcoords']=pattern.sheetcoords
 sys.modules['topo.base.patterngenerator']=pattern.patterngenerator
 sys.modules['topo.misc.patternfn']=pattern.patternfn
 sys.modules['topo.pattern']=pattern
 sys.modules['topo.pattern.basic']=pattern
-sys.modules['topo.pattern.random']=pattern.random
-sys.modules['topo.pattern.patterncoordinator']=pattern.patterncoordinator
-sys.modules['topo.pattern.image']=pattern.image
-sys.modules['topo.pattern.rds']=imagen.random
 pattern.Translator.time_fn = sim.time
 
-from topo.misc.featurecoordinators import feature_coordinators
-imagen.patterncoordinator.PatternCoordinator.feature_coordinators.update(feature_coordinators)
+# The remaining imagen modules are only imported when first used
+# (e.g. as pattern.random.GaussianCloud), keeping startup fast for
+# simulations that do not need them.
+from topo.misc.util import LazyModule, after_import
+for _name,_aliases in [('random',['topo.pattern.random','topo.pattern.rds']),
+                       ('image',['topo.pattern.image']),
+                       ('patterncoordinator',['topo.pattern.patterncoordinator'])]:
+    if not hasattr(pattern,_name):
+        setattr(pattern,_name,LazyModule('imagen.'+_name))
+    for _alias in _aliases:
+        alias_module(_alias,'imagen.'+_name)
+del _name,_aliases,_alias
+
+def _add_feature_coordinators(patterncoordinator):
+    from topo.misc.featurecoordinators import feature_coordinators
+    patterncoordinator.PatternCoordinator.feature_coordinators.update(feature_coordinators)
+
+after_import('imagen.patterncoordinator',_add_feature_coordinators)
 
 
 def about(display=True):
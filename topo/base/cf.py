@@ -18,7 +18,9 @@ CFProjection.
 """
 
 
+import sys
 from copy import copy
+from collections import OrderedDict
 import numpy as np
 
 import param
@@ -35,6 +37,7 @@ from functionfamily import ResponseFn,DotProduct
 from functionfamily import CoordinateMapperFn,IdentityMF
 from projection import Projection,ProjectionSheet
 from sheetview import CFView, CFStack
+from topo.misc.memuse import object_bytes, unique_nbytes, add_usage
 
 
 def simple_vectorize(fn,num_outputs=1,output_type=object,doc=''):
@@ -671,6 +674,7 @@ class CFProjection(Projection):
         vectorized_create_cf = simple_vectorize(self._create_cf)
         self.cfs = vectorized_create_cf(*self._generate_coords())
         self.flatcfs = list(self.cfs.flat)
+        self._cf_memory = None
 
 
     def _create_cf(self,x,y):
@@ -853,11 +857,40 @@ class CFProjection(Projection):
 
     def n_bytes(self):
         # Could also count the input_sheet_slice
-        rows,cols=self.cfs.shape
-        return super(CFProjection,self).n_bytes() + \
-               sum([cf.weights.nbytes +
-                    cf.mask.nbytes
-                    for cf,i in CFIter(self,ignore_sheet_mask=True)()])
+        cf_usage = self._cf_memory_usage()
+        return super(CFProjection,self).n_bytes() + cf_usage['weights'] + cf_usage['masks']
+
+
+    def _cf_memory_usage(self):
+        """
+        Return the bytes taken by the ConnectionFields, by category.
+
+        Computed on the first call and then cached until the CFs are
+        recreated or resized, since they do not otherwise change size.
+        Arrays shared between CFs (e.g. masks, or the weights of a
+        SharedWeightCFProjection) are counted once.
+        """
+        usage = getattr(self,'_cf_memory',None)
+        if usage is None:
+            cfs = [cf for cf in self.flatcfs if cf is not None]
+            usage = self._cf_memory = OrderedDict([
+                ('weights',unique_nbytes(cf.weights for cf in cfs)),
+                ('masks',unique_nbytes(cf.mask for cf in cfs)),
+                ('slices',unique_nbytes(cf.input_sheet_slice for cf in cfs)),
+                ('python',sum(object_bytes(cf) for cf in cfs) +
+                          sys.getsizeof(self.flatcfs) + self.cfs.nbytes)])
+        return usage
+
+
+    def memory_usage(self):
+        """
+        Extends Projection.memory_usage() with the weights, masks,
+        slices and Python objects of the ConnectionFields.  These are
+        counted on the first call and cached until the CFs are
+        recreated or resized, so that later calls take time
+        independent of the number of units.
+        """
+        return add_usage(super(CFProjection,self).memory_usage(),self._cf_memory_usage())
 
 
     def n_conns(self):
@@ -914,6 +947,7 @@ class CFIter(object):
     def __init__(self,cfprojection,active_units_mask=False,ignore_sheet_mask=False):
 
         self.flatcfs = cfprojection.flatcfs
+        self.dest = cfprojection.dest
         self.activity = cfprojection.dest.activity
         self.mask = cfprojection.dest.mask
         self.cf_type = cfprojection.cf_type
@@ -970,12 +1004,43 @@ class CFIter(object):
         return np.logical_and(sheet_mask,active_units_mask)
 
 
+    def get_unit_indices(self,skip_inactive=None):
+        """
+        Return an int32 array of the flat indices of the units to be
+        processed: those not excluded by the sheet mask (unless
+        ignore_sheet_mask is True), and, if skip_inactive is True,
+        whose activity is nonzero.  By default, inactive units are
+        skipped if active_units_mask is True and the sheet allows it.
+
+        While the destination sheet is learning (see
+        ProjectionSheet.learn), the indices are computed only once
+        and shared by all of its projections, as the activity does
+        not change.
+        """
+        if skip_inactive is None:
+            skip_inactive = self.allow_skip_non_responding_units and self.active_units_mask
+        key = (bool(skip_inactive),self.ignore_sheet_mask)
+
+        cache = getattr(self.dest,'_unit_indices_cache',None)
+        if cache is not None and key in cache:
+            return cache[key]
+
+        mask = self.get_sheet_mask()
+        if skip_inactive:
+            mask = np.logical_and(mask,self.activity)
+        indices = np.flatnonzero(mask).astype(np.int32)
+
+        if cache is not None:
+            cache[key] = indices
+        return indices
+
+
     def __call__(self):
-        mask = self.get_overall_mask()
-        for i,cf in enumerate(self.flatcfs):
+        flatcfs = self.flatcfs
+        for i in self.get_unit_indices():
+            cf = flatcfs[i]
             if cf is not None:
-                if mask.flat[i]:
-                    yield cf,i
+                yield cf,i
 
 
 # PRALERT: CFIter Alias for backwards compatability with user code
@@ -1098,6 +1163,7 @@ class ResizableCFProjection(CFProjection):
                                        mask=mask_template,
                                        output_fns=output_fns,
                                        min_matrix_radius=self.min_matrix_radius)
+        self._cf_memory = None
 
 
     def change_density(self, new_wt_density):
@@ -103,6 +103,10 @@ class GeneratorSheet(Sheet):
             # are  discarded to save memory).
             self.warning('Pattern generator {0} returned None. Unable to generate Activity pattern.'.format(self.input_generator.name))
         else:
+            # generate() is usually called from a FunctionEvent rather
+            # than via input_event(), so the activity must be detached
+            # from any saved state here.
+            self.detach_state()
             self.activity[:] = ac
 
             if self.apply_output_fns:
@@ -203,6 +207,7 @@ class ChannelGeneratorSheet(GeneratorSheet):
             # are  discarded to save memory).
             self.warning('Pattern generator {0} returned None. Unable to generate Activity pattern.'.format(self.input_generator.name))
         else:
+            self.detach_state()
             self.activity[:] = channels_dict.items()[0][1]
 
             if self.apply_output_fns:
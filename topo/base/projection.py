@@ -16,6 +16,7 @@ from dataviews.collector import AttrTree
 from sheet import Sheet
 from simulation import EPConnection
 from functionfamily import TransferFn
+from topo.misc.memuse import object_bytes, unique_nbytes
 
 class SheetMask(param.Parameterized):
     """
@@ -317,9 +318,20 @@ class Projection(EPConnection):
     def state_push(self):
         """
         Push the current activity state onto the stack.
+
+        As for Sheet.state_push(), only a reference is saved; the
+        array is copied by detach_state() before it is next modified.
         """
+        self.__saved_activity.append(self.activity)
 
-        self.__saved_activity.append(array(self.activity))
+
+    def detach_state(self):
+        """
+        Replace the activity array by a private copy if it is still
+        the one saved by the most recent state_push().
+        """
+        if self.__saved_activity and self.activity is self.__saved_activity[-1]:
+            self.activity = array(self.activity)
 
 
     def get_projection_view(self, timestamp):
@@ -341,6 +353,23 @@ class Projection(EPConnection):
         return rows*cols
 
 
+    def memory_usage(self):
+        """
+        Return an OrderedDict of the bytes of memory taken by this
+        Projection, by category: its Python object ('python'), its
+        activity array, and any arrays saved by state_push()
+        ('state').
+
+        Unlike n_bytes(), this is meant to be accurate and cheap
+        enough to call during a run; subclasses storing weights or
+        other significant data should extend it, in time independent
+        of the number of units where possible.
+        """
+        return OrderedDict([('python',object_bytes(self)),
+                            ('activity',self.activity.nbytes),
+                            ('state',unique_nbytes(self.__saved_activity,exclude=[self.activity]))])
+
+
     def n_conns(self):
         """
         Return the size of this projection, in number of connections.
@@ -512,8 +541,15 @@ class ProjectionSheet(Sheet):
             self.activity=tmp_dict[priority][0].activity_group[1](self.activity,tmp_activity)
 
         if self.apply_output_fns:
-            for of in self.output_fns:
-                of(self.activity)
+            if getattr(self.simulation,'_active_profiler',None) is None:
+                for of in self.output_fns:
+                    of(self.activity)
+            else:
+                # Only needed (and so only built) when profiling
+                activity_nbytes = lambda: self.activity.nbytes
+                for of in self.output_fns:
+                    self._timed((self.name,of.name),'output_fn',
+                                activity_nbytes,of,self.activity)
 
         self.send_output(src_port='Activity',data=self.activity)
 
@@ -541,12 +577,17 @@ class ProjectionSheet(Sheet):
         Called from self.process_current_time() _after_ activity has
         been propagated.
         """
-        for proj in self.in_connections:
-            if not isinstance(proj,Projection):
-                self.debug("Skipping non-Projection "+proj.name)
-            else:
-                proj.learn()
-                proj.apply_learn_output_fns()
+        self._unit_indices_cache = {}
+        try:
+            for proj in self.in_connections:
+                if not isinstance(proj,Projection):
+                    self.debug("Skipping non-Projection "+proj.name)
+                else:
+                    self._timed((self.name,proj.name),'learn',proj.n_bytes,proj.learn)
+                    self._timed((self.name,proj.name),'apply_learn_output_fns',proj.n_bytes,
+                                proj.apply_learn_output_fns)
+        finally:
+            self._unit_indices_cache = None
 
 
     def present_input(self,input_activity,conn):
@@ -557,7 +598,7 @@ class ProjectionSheet(Sheet):
         The sheet's own activity is not calculated until activate()
         is called.
         """
-        conn.activate(input_activity)
+        self._timed((self.name,conn.name),'activate',conn.n_bytes,conn.activate,input_activity)
 
 
     def projections(self,name=None):
@@ -642,6 +683,15 @@ class ProjectionSheet(Sheet):
         for p in self.projections().values(): p.state_pop()
 
 
+    def detach_state(self):
+        """
+        Subclasses Sheet detach_state to also detach projection activities.
+        """
+        super(ProjectionSheet, self).detach_state()
+        for p in self.in_connections:
+            if isinstance(p,Projection): p.detach_state()
+
+
     def n_bytes(self):
         """
         Estimate the memory bytes taken by this Sheet and its Projections.
@@ -25,6 +25,7 @@ from numpy import float64
 import param
 
 from simulation import EventProcessor
+from topo.misc.memuse import unique_nbytes
 
 from functionfamily import TransferFn
 
@@ -231,8 +232,12 @@ class Sheet(EventProcessor,SheetCoordinateSystem):  # pylint: disable-msg=W0223
         values of all connection weights, if any, because
         plasticity can be turned off explicitly.  Thus this method
         is intended only for shorter-term state.
+
+        The activity array is saved copy-on-write: only a reference
+        is pushed, and the array is copied by detach_state() when the
+        sheet is next about to modify it.
         """
-        self.__saved_activity.append(array(self.activity))
+        self.__saved_activity.append(self.activity)
         EventProcessor.state_push(self)
         for of in self.output_fns:
             if hasattr(of,'state_push'):
@@ -252,6 +257,26 @@ class Sheet(EventProcessor,SheetCoordinateSystem):  # pylint: disable-msg=W0223
                 of.state_pop()
 
 
+    def detach_state(self):
+        """
+        Replace the activity array by a private copy if it is still
+        the one saved by the most recent state_push().
+        """
+        if self.__saved_activity and self.activity is self.__saved_activity[-1]:
+            self.activity = array(self.activity)
+
+
+    def memory_usage(self):
+        """
+        Extends EventProcessor.memory_usage() with the activity array
+        and any arrays saved by state_push() ('state').
+        """
+        usage = super(Sheet,self).memory_usage()
+        usage['activity'] = self.activity.nbytes
+        usage['state'] = unique_nbytes(self.__saved_activity,exclude=[self.activity])
+        return usage
+
+
     def activity_len(self):
         """Return the number of items that have been saved by state_push()."""
         return len(self.__saved_activity)
@@ -55,8 +55,10 @@ import param
 from copy import copy, deepcopy
 import time
 import bisect
+from collections import OrderedDict
 
 from topo.misc.attrdict import AttrDict
+from topo.misc.memuse import object_bytes
 
 #: Default path to the current simulation, from main
 #: Only to be used by script_repr(), to allow it to generate
@@ -110,6 +112,20 @@ class EventProcessor(param.Parameterized):
 
         self.simulation = None
 
+    def _timed(self,name,operation,nbytes,fn,*args):
+        """
+        Call fn(*args), recording the time taken as the given
+        operation of the named component if the simulation is
+        profiling components (see Simulation.profile_components).
+        The name may be a tuple, e.g. (sheet name, projection name),
+        to avoid building strings when not profiling.  nbytes should
+        be a callable estimating the bytes touched.
+        """
+        profiler = getattr(self.simulation,'_active_profiler',None)
+        if profiler is None:
+            return fn(*args)
+        return profiler.timed((name,operation),nbytes,fn,*args)
+
     def _port_match(self,key,portlist):
         """
         Returns True if the given key matches any port on the given list.
@@ -223,6 +239,36 @@ class EventProcessor(param.Parameterized):
         raise NotImplementedError
 
 
+    def detach_state(self):
+        """
+        Ensure that no state is still shared with the state_push() stack.
+
+        Subclasses whose state_push() saves references to their
+        current arrays rather than copies (i.e. copy-on-write) should
+        replace any such array by a private copy here.  The Simulation
+        calls this method before delivering an event to this
+        EventProcessor and before calling process_current_time(), so
+        that only state that is actually modified after a push is ever
+        copied. (By default, does nothing.)
+        """
+        pass
+
+
+    def memory_usage(self):
+        """
+        Return an OrderedDict of the bytes of memory taken by this
+        EventProcessor, by category (e.g. 'activity', 'state', or
+        'python' for the Python objects themselves).  Incoming
+        Projections report their own memory_usage().
+
+        Subclasses storing significant amounts of data should extend
+        this, taking time independent of the number of units where
+        possible, so that it can be called during a run (see
+        topo.misc.memuse.memory_usage()).
+        """
+        return OrderedDict([('python',object_bytes(self))])
+
+
     def process_current_time(self):
         """
         Called by the simulation before advancing the simulation
@@ -445,7 +491,9 @@ class EPConnectionEvent(Event):
         self.conn = conn
 
     def __call__(self,sim):
-        self.conn.dest.input_event(self.conn,self.data)
+        dest = self.conn.dest
+        dest.detach_state()
+        dest.input_event(self.conn,self.data)
 
     def __repr__(self):
         return "EPConnectionEvent(time="+`self.time`+",conn="+`self.conn`+")"
@@ -579,15 +627,20 @@ class PeriodicEventSequence(EventSequence):
         # Find the timed length of the sequence
         seq_length = sum(e.time for e in self.sequence)
 
+        # A copy is rescheduled rather than this event itself, so that
+        # events already on the queue are never modified; this allows
+        # Simulation.event_push() to save the queue without copying
+        # every event.
+        next_ev = copy(self)
         if seq_length < self.period:
             # If the sequence is shorter than the period, then reschedule
             # the sequence to occur again after the period
-            self.time += self.period
+            next_ev.time += self.period
         else:
             # If the sequence is longer than the period, then
             # reschedule to start after the sequence ends.
-            self.time += seq_length
-        sim.enqueue_event(self)
+            next_ev.time += seq_length
+        sim.enqueue_event(next_ev)
 
     def __repr__(self):
         return 'PeriodicEventSequence(%s,%s,%s)' % (`self.time`,`self.period`,`self.sequence`)
@@ -891,6 +944,30 @@ class Simulation(param.Parameterized,OptionalSingleton):
         'timestr'.
         """)
 
+    autotune_kernels = param.Boolean(default=False,doc="""
+        Whether to choose the fastest available backend (e.g. weave or
+        Cython) for the functions of each CF projection by timing them
+        at the start of the first run(); see topo.misc.kernels.autotune.
+        Choices are cached on disk by projection geometry, so only
+        projections of new shapes are timed in later runs.""")
+
+    profile_components = param.Boolean(default=False,doc="""
+        Whether to record the time taken by each EventProcessor's
+        process_current_time(), each projection's activate(), learn()
+        and apply_learn_output_fns(), and each sheet output function
+        while running; see profile_report().""")
+
+    profile_interval = param.Number(default=1.0,bounds=(0,None),inclusive_bounds=(False,True),doc="""
+        Length of simulation time over which the component timings are
+        summed to form the time series in the profiler (e.g. one
+        iteration).""")
+
+    threads = param.Integer(default=None,allow_None=True,bounds=(1,None),doc="""
+        Number of threads to be used by the OpenMP-parallel loops over
+        CFs in optimized components (see topo.misc.inlinec), applied
+        at the start of each run().  If None, the OpenMP default is
+        used (normally one thread per core, or OMP_NUM_THREADS).""")
+
     eps_to_start = []
 
     name = param.Parameter(constant=False)
@@ -1016,6 +1093,9 @@ class Simulation(param.Parameterized,OptionalSingleton):
         self._instantiated_model = False
         self.model = None
 
+        self.profiler = None
+        self._active_profiler = None
+
         if self.register:
             # Indicate that no specific name has been set
             self.name=params.get('name')
@@ -1282,6 +1362,34 @@ class Simulation(param.Parameterized,OptionalSingleton):
 
         self.eps_to_start=[]
 
+        if self.threads is not None and self.threads != getattr(self,'_threads_set',None):
+            from topo.misc.inlinec import set_openmp_threads
+            set_openmp_threads(self.threads)
+            self._threads_set = self.threads
+
+        # Kernel self-tests are not run on import (being slow); the
+        # results are recorded in the kernel cache for later runs
+        if not getattr(self,'_kernels_tested',False):
+            from topo.misc import kernels
+            if kernels.self_test_on_use:
+                kernels.self_test_used(self)
+            self._kernels_tested = True
+
+        if self.autotune_kernels and not getattr(self,'_autotuned',False):
+            from topo.misc import kernels
+            kernels.autotune(self)
+            self._autotuned = True
+
+        if self.profile_components:
+            if getattr(self,'profiler',None) is None:
+                from topo.misc.profiling import ComponentProfiler
+                self.profiler = ComponentProfiler(interval=self.profile_interval)
+            self._active_profiler = self.profiler
+            self.profiler.set_time(self.time())
+        else:
+            self._active_profiler = None
+        profiler = self._active_profiler
+
         stop_time = min(self.time() + duration, until)
         # Use time.until if it is between the current time and stop_time.
         # This ensures self.time.until act only as a 'soft' limit
@@ -1309,13 +1417,21 @@ class Simulation(param.Parameterized,OptionalSingleton):
                     did_event = False
                     #self.debug("Time to sleep; next event time: %s",self.timestr(self.events[0].time))
                     for ep in self._event_processors.values():
-                        ep.process_current_time()
+                        ep.detach_state()
+                        if profiler is None:
+                            ep.process_current_time()
+                        else:
+                            profiler.timed((ep.name,'process_current_time'),
+                                           getattr(ep,'n_bytes',lambda: 0),
+                                           ep.process_current_time)
 
                 # Set the time to the frontmost event.  Bear in mind
                 # that the front event may have been changed by the
                 # .process_current_time() calls.
                 if self.events[0].time > self.time():
                     self.sleep(self.events[0].time - self.time())
+                    if profiler is not None:
+                        profiler.set_time(self.time())
 
             else:
                 # Pop and call the event at the head of the queue.
@@ -1381,6 +1497,12 @@ class Simulation(param.Parameterized,OptionalSingleton):
         (saved using event_push()).  Each EventProcessor is also asked
         to save its own state.  This operation is useful for testing
         something while being able to roll back to the original state.
+
+        EventProcessors may save their state copy-on-write (see
+        EventProcessor.detach_state()), so that a push only records
+        references, and arrays are copied only when they are first
+        modified after the push.  state_pop() then simply swaps the
+        saved references back in.
         """
         if self.eps_to_start != []:
             self.run(0.0)
@@ -1411,10 +1533,10 @@ class Simulation(param.Parameterized,OptionalSingleton):
         Same as state_push(), but does not ask EventProcessors to save
         their state.
         """
-        # CBALERT: does it make more sense to put the original events onto the
-        # stack, and replace self.events with the copies? Not sure this makes
-        # any practical difference currently.
-        self._events_stack.append((self.time(),[copy(event) for event in self.events]))
+        # Events are never modified once they are on the queue (see
+        # PeriodicEventSequence), so only the list itself needs to be
+        # copied.
+        self._events_stack.append((self.time(),list(self.events)))
 
 
     def event_pop(self):
@@ -1498,6 +1620,19 @@ class Simulation(param.Parameterized,OptionalSingleton):
         return [c for c in set(conns)]
 
 
+    def profile_report(self):
+        """
+        Print a table of the number of calls, total and mean time, and
+        estimated bytes touched per call for each profiled component
+        operation (see profile_components), most expensive first, and
+        return its rows.
+        """
+        if getattr(self,'profiler',None) is None:
+            self.message("No profiling data; set profile_components=True before running.")
+            return []
+        return self.profiler.report()
+
+
     def script_repr(self,imports=[],prefix="    "):
         """
         Return a nearly runnable script recreating this simulation.
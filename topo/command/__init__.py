@@ -31,6 +31,7 @@ import param
 from param.parameterized import ParameterizedFunction, ParamOverrides
 from param import normalize_path
 
+import numpy
 import imagen, numbergen
 from collections import OrderedDict
 
@@ -38,13 +39,11 @@ import topo
 from topo.base.sheet import Sheet
 from topo.base.projection import ProjectionSheet
 from topo.sheet import GeneratorSheet
-from topo.misc.util import MultiFile
+from topo.misc.util import MultiFile, after_import
 from topo.misc.picklemain import PickleMain
 from topo.misc.snapshots import PicklableClassAttributes
 from topo.misc.genexamples import generate as _generate
 
-from featuremapper import PatternDrivenAnalysis
-
 
 
 def generate_example(target):
@@ -710,6 +709,24 @@ class run_batch(ParameterizedFunction):
        set to 'all' then a script repr is saved for all time values.
        Saving is disabled entirely if set to None.""")
 
+    memory_log_interval = param.Number(default=None,allow_None=True,bounds=(0,None),
+                                       inclusive_bounds=(False,True),doc="""
+       If not None, the memory taken by each sheet and projection, and
+       the resident set size of the process, are appended to a
+       .memory.log file in JSON format every memory_log_interval units
+       of simulation time (see topo.misc.memuse.log_memory).""")
+
+    analysis_processes = param.Integer(default=0,bounds=(0,None),doc="""
+       If greater than zero, analysis_fn is run asynchronously: at each
+       of the times, the process is forked and analysis_fn runs in the
+       child, on a copy-on-write snapshot of the simulation's state,
+       while training continues in the parent.  At most
+       analysis_processes analyses run at once (training waits for
+       the oldest to finish if necessary).  The output of each is
+       added to the .out file when it finishes, and failures are
+       counted as errors (see topo.misc.asyncanalysis).  Analysis is
+       synchronous on platforms without os.fork.""")
+
     def _truncate(self,p,s):
         """
         If s is greater than the max_name_length parameter, truncate it
@@ -827,6 +844,11 @@ class run_batch(ParameterizedFunction):
         if not isinstance(times,list):
             times=[t*times for t in [0,50,100,500,1000,2000,3000,4000,5000,10000]]
 
+        from topo.misc.asyncanalysis import AnalysisWorkers, fork_available
+        analysis_workers = None
+        if p.analysis_processes > 0 and fork_available():
+            analysis_workers = AnalysisWorkers(p.analysis_processes,metadata_dir)
+
         # Run script in main
         error_count = 0
         initial_warning_count = param.parameterized.warning_count
@@ -838,10 +860,23 @@ class run_batch(ParameterizedFunction):
             print_sizes()
             topo.sim.name=simname
 
+            if p.memory_log_interval is not None:
+                from topo.base.simulation import PeriodicEventSequence,FunctionEvent
+                from topo.misc.memuse import log_memory
+                topo.sim.enqueue_event(PeriodicEventSequence(
+                    topo.sim.time(),topo.sim.convert_to_time_type(p.memory_log_interval),
+                    [FunctionEvent(0,log_memory,simpath+".memory.log")]))
+
+            if analysis_workers is not None:
+                print "Running analysis asynchronously in up to %d processes." % p.analysis_processes
+
             # Run each segment, doing the analysis and saving the script state each time
             for run_to in times:
                 topo.sim.run(run_to - topo.sim.time())
-                p.analysis_fn()
+                if analysis_workers is None:
+                    p.analysis_fn()
+                else:
+                    analysis_workers.start(p.analysis_fn,"at time %s" % topo.sim.timestr())
                 normalize_path.prefix = metadata_dir
                 if p.save_script_repr == 'first'  and run_to == times[0]:
                     save_script_repr()
@@ -850,6 +885,9 @@ class run_batch(ParameterizedFunction):
                 elif p.save_script_repr == 'all':
                     save_script_repr()
                 normalize_path.prefix = dirpath
+                # Per-interval component timings, if profiling (see Simulation.profile_components)
+                if getattr(topo.sim,'profiler',None) is not None:
+                    topo.sim.profiler.save(simpath+".profile.json")
                 elapsedtime=time.time()-starttime
                 param.Parameterized(name="run_batch").message(
                     "Elapsed real time %02d:%02d." % (int(elapsedtime/60),int(elapsedtime%60)))
@@ -863,6 +901,10 @@ class run_batch(ParameterizedFunction):
             traceback.print_exc(file=sys.stdout)
             sys.stderr.write("Warning -- Error detected: execution halted.\n")
 
+        if analysis_workers is not None:
+            analysis_workers.join()
+            error_count += analysis_workers.errors
+
         if p.metadata_dir != '' and p.compress_metadata == 'tar.gz':
             _, name = os.path.split(metadata_dir)
             tar = tarfile.open(normalize_path("%s.tar.gz" % name), "w:gz")
@@ -902,11 +944,15 @@ def wipe_out_activity():
     # recursively using methods implemented separately on each class,
     # if there are often new types of objects created that store an
     # activity value.
+    #
+    # Fresh arrays are assigned rather than zeroing in place, so that
+    # activity saved copy-on-write by a preceding state_push() is
+    # never copied just to be overwritten.
     for s in topo.sim.objects(Sheet).values():
-        s.activity*=0.0
+        s.activity=numpy.zeros_like(s.activity)
         for c in s.in_connections:
             if hasattr(c,'activity'):
-                c.activity*=0.0
+                c.activity=numpy.zeros_like(c.activity)
 
 
 
@@ -933,11 +979,17 @@ def print_sizes():
     print "Defined %d-connection network; %0.0fMB required for weight storage." % \
     (n_conns(),max(n_bytes()/1024.0/1024.0,1.0))
 
-# added these two function to the PatternDrivenAnalysis hooks
-PatternDrivenAnalysis.pre_presentation_hooks.append(topo.sim.state_push)
-PatternDrivenAnalysis.pre_presentation_hooks.append(wipe_out_activity)
-PatternDrivenAnalysis.pre_presentation_hooks.append(clear_event_queue)
-PatternDrivenAnalysis.post_presentation_hooks.append(topo.sim.state_pop)
+# added these two function to the PatternDrivenAnalysis hooks, once
+# featuremapper is first imported (so that analysis code is not loaded
+# by simulations that do not use it)
+def _add_presentation_hooks(featuremapper):
+    PatternDrivenAnalysis = featuremapper.PatternDrivenAnalysis
+    PatternDrivenAnalysis.pre_presentation_hooks.append(topo.sim.state_push)
+    PatternDrivenAnalysis.pre_presentation_hooks.append(wipe_out_activity)
+    PatternDrivenAnalysis.pre_presentation_hooks.append(clear_event_queue)
+    PatternDrivenAnalysis.post_presentation_hooks.append(topo.sim.state_pop)
+
+after_import('featuremapper',_add_presentation_hooks)
 
 # maybe an explicit list would be better?
 import types
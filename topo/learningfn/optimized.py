@@ -2,25 +2,155 @@
 Learning functions and projection-level learning functions (see projfn.py)
 written in C to optimize performance.
 
+All of the functions here share a single C loop over the
+ConnectionFields of a projection (see _cf_learning_loop), differing
+only in the small C fragments that compute each unit's learning
+signal and update each weight.
+
 Requires the weave package; without it unoptimized versions are used.
 """
 
+from copy import copy
+
+import numpy as np
 from numpy import zeros, ones
 
 import param
 
 from topo.base.sheet import activity_type
 from topo.base.cf import CFPLearningFn,CFPLF_Plugin
-from topo.learningfn.projfn import CFPLF_PluginScaled
+from topo.learningfn.projfn import CFPLF_PluginScaled,CFPLF_EuclideanHebbian,\
+     CFPLF_OutstarHebbian,HomeoSynaptic
 from topo.base.functionfamily import Hebbian,LearningFn
 from topo.misc.inlinec import inline,provide_unoptimized_equivalent,\
      c_header,c_decorators
-from topo.learningfn import BCMFixed
+from topo.learningfn import BCMFixed,Oja,Covariance,CPCA
 
 from projfn import CFPLF_Trace  # pyflakes:ignore (optimized version provided)
 
 
 
+_cf_learning_code = c_header + """
+    DECLARE_SLOT_OFFSET(weights,cf_type);
+    DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
+    DECLARE_SLOT_OFFSET(mask,cf_type);
+    DECLARE_SLOT_OFFSET(_norm_total,cf_type);
+    DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
+    DECLARE_CF_ITEMS(cfs);
+
+    %(cfs_loop_pragma)s
+    for (int k=0; k<num_units; ++k) {
+        int r = %(unit_index)s;
+        double unit_activity = output_activity[r];
+        double load = %(unit_load)s;
+        if (%(unit_condition)s) {
+            PyObject *cf = cfs_items[r];
+
+            LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
+            LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
+            LOOKUP_FROM_SLOT_OFFSET(float,mask,cf);
+
+            UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
+
+            double total = 0.0;
+
+            // modify non-masked weights
+            npfloat *inpj = input_activity+icols*rr1+cc1;
+            for (int i=rr1; i<rr2; ++i) {
+                npfloat *inpi = inpj;
+                for (int j=cc1; j<cc2; ++j) {
+                    // The mask is floating point, so we have to
+                    // use a robust comparison instead of testing
+                    // against exactly 0.0.
+                    if (*(mask++) >= MASK_THRESHOLD) {
+                        double x = *inpi;
+                        double w = *weights;
+                        %(weight_update)s
+                        *weights = w;
+                        total += fabs(w);
+                    }
+                    ++weights;
+                    ++inpi;
+                }
+                inpj += icols;
+            }
+            %(cf_update)s
+            // store the sum of the cf's weights
+            LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
+            _norm_total[0]=total;
+            LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
+            _has_norm_total[0]=1;
+        }
+    }
+"""
+
+
+def _cf_learning_loop(iterator, input_activity, output_activity,
+                      unit_load, weight_update,
+                      unit_condition="load != 0 && sheet_mask[r] != 0",
+                      cf_update="", skip_inactive=True, **c_args):
+    """
+    Update the weights of every CF of the iterator's projection in C.
+
+    The C expression unit_load computes the double load for unit r,
+    typically from that unit's unit_activity and a learning rate;
+    units for which the C expression unit_condition is false are
+    skipped.  The C statement weight_update then modifies the double
+    w, the value of each unmasked weight of the unit's CF, given x,
+    the input activity at that weight.  The optional C statement
+    cf_update is executed once the whole CF has been visited, while
+    its weights are still in the cache; there, total holds the sum of
+    the absolute values of the CF's weights, and weights points just
+    past their end.  Any further values used by these fragments
+    (learning rates, thresholds, or per-unit arrays indexed by r) must
+    be supplied as c_args.
+
+    If skip_inactive is True, unit_condition must be false for units
+    whose activity is zero, which are then not visited at all: only
+    the units in the iterator's (shared) list of active unit indices
+    are processed.
+
+    As a side effect, sets the norm_total attribute on any cf whose
+    weights are updated during learning, to speed up later operations
+    that might depend on it.
+    """
+    cfs = iterator.flatcfs
+    irows,icols = input_activity.shape
+
+    if not skip_inactive:
+        num_units = len(cfs)
+        unit_index = "k"
+    else:
+        if output_activity is iterator.activity:
+            unit_indices = iterator.get_unit_indices(skip_inactive=True)
+        else:
+            unit_indices = np.flatnonzero(np.logical_and(iterator.get_sheet_mask(),
+                                                         output_activity)).astype(np.int32)
+        if len(unit_indices) == 0:
+            return
+        c_args.update(unit_indices=unit_indices)
+        num_units = len(unit_indices)
+        unit_index = "unit_indices[k]"
+
+    c_args.update(cfs=cfs,
+                  num_units=num_units,
+                  icols=icols,
+                  cf_type=iterator.cf_type,
+                  input_activity=input_activity,
+                  output_activity=output_activity,
+                  sheet_mask=iterator.get_sheet_mask())
+
+    fragments = copy(c_decorators)
+    fragments.update(unit_index=unit_index,
+                     unit_load=unit_load,
+                     unit_condition=unit_condition,
+                     weight_update=weight_update,
+                     cf_update=cf_update)
+
+    inline(_cf_learning_code%fragments, sorted(c_args.keys()),
+           local_dict=c_args, headers=['<structmember.h>'])
+
+
 
 class CFPLF_Hebbian_opt(CFPLearningFn):
     """
@@ -43,11 +173,6 @@ class CFPLF_Hebbian_opt(CFPLearningFn):
         if single_connection_learning_rate==0:
             return
 
-        cfs = iterator.flatcfs
-        num_cfs = len(cfs)  # pyflakes:ignore (passed to weave C code)
-        irows,icols = input_activity.shape
-        cf_type = iterator.cf_type  # pyflakes:ignore (passed to weave C code)
-
         # CEBALERT: this function *always* skips inactive units,
         # because it uses the output_activity directly rather than
         # going through the iterator. That's ok since we know this
@@ -57,61 +182,10 @@ class CFPLF_Hebbian_opt(CFPLearningFn):
         # iterator's active_units_mask to be True before calling the
         # iterator in the unoptimized version.)
 
-        sheet_mask = iterator.get_sheet_mask()  # pyflakes:ignore (passed to weave C code)
-
-        code = c_header + """
-            DECLARE_SLOT_OFFSET(weights,cf_type);
-            DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
-            DECLARE_SLOT_OFFSET(mask,cf_type);
-            DECLARE_SLOT_OFFSET(_norm_total,cf_type);
-            DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
-
-            %(cfs_loop_pragma)s
-            for (int r=0; r<num_cfs; ++r) {
-                double load = output_activity[r];
-                if (load != 0 && sheet_mask[r] != 0) {
-                    load *= single_connection_learning_rate;
-
-                    PyObject *cf = PyList_GetItem(cfs,r);
-
-                    LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(float,mask,cf);
-
-                    UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
-
-                    double total = 0.0;
-
-                    // modify non-masked weights
-                    npfloat *inpj = input_activity+icols*rr1+cc1;
-                    for (int i=rr1; i<rr2; ++i) {
-                        npfloat *inpi = inpj;
-                        for (int j=cc1; j<cc2; ++j) {
-                            // The mask is floating point, so we have to
-                            // use a robust comparison instead of testing
-                            // against exactly 0.0.
-                            if (*(mask++) >= MASK_THRESHOLD) {
-                                *weights += load * *inpi;
-                                total += fabs(*weights);
-                            }
-                            ++weights;
-                            ++inpi;
-                        }
-                        inpj += icols;
-                    }
-                    // store the sum of the cf's weights
-                    LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
-                    _norm_total[0]=total;
-                    LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
-                    _has_norm_total[0]=1;
-                }
-            }
-        """%c_decorators
-
-        inline(code, ['input_activity', 'output_activity','sheet_mask','num_cfs',
-                      'icols', 'cfs', 'single_connection_learning_rate','cf_type'],
-               local_dict=locals(),
-               headers=['<structmember.h>'])
+        _cf_learning_loop(iterator, input_activity, output_activity,
+                          unit_load="unit_activity*single_connection_learning_rate",
+                          weight_update="w += load*x;",
+                          single_connection_learning_rate=single_connection_learning_rate)
 
 
 class CFPLF_Hebbian(CFPLF_Plugin):
@@ -120,7 +194,112 @@ class CFPLF_Hebbian(CFPLF_Plugin):
 provide_unoptimized_equivalent("CFPLF_Hebbian_opt","CFPLF_Hebbian",locals())
 
 
-# CBERRORALERT: classes from here on probably ignore the sheet mask
+
+def _jointly_normalized(iterator):
+    """
+    Return True if the CFs of the iterator's projection are
+    normalized jointly with those of other projections (see
+    JointNormalizingCFSheet).
+    """
+    groups = getattr(iterator.dest,'_grouped_in_projections',None)
+    if groups is None:
+        return False
+    for key,projlist in groups('JointNormalize').items():
+        if key is not None and len(projlist)>1 and \
+               any(p.flatcfs is iterator.flatcfs for p in projlist):
+            return True
+    return False
+
+
+class CFPLF_HebbianNormalizeL1(CFPLF_Hebbian):
+    """
+    Hebbian learning followed by divisive L1 normalization of each
+    CF that learned.
+
+    If the projection is normalized jointly with others (see
+    JointNormalizingCFSheet), only the Hebbian learning is done,
+    leaving the normalization to the CFPOF_DivisiveNormalizeL1
+    weights_output_fns of the group, which then must be present.
+
+    Non-optimized version of CFPLF_HebbianNormalizeL1_opt.
+    """
+
+    norm_value = param.Number(default=1.0,doc="""
+        Desired sum of the absolute values of each CF's weights.""")
+
+    def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
+        if _jointly_normalized(iterator):
+            return super(CFPLF_HebbianNormalizeL1,self).__call__(
+                iterator,input_activity,output_activity,learning_rate,**params)
+
+        single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
+        # avoid evaluating these references each time in the loop
+        single_cf_fn = self.single_cf_fn
+        norm_value = self.norm_value
+
+        for cf,i in iterator():
+            unit_activity = output_activity.flat[i]
+            if unit_activity != 0:
+                single_cf_fn(cf.get_input_matrix(input_activity),
+                             unit_activity, cf.weights,
+                             single_connection_learning_rate)
+                cf.weights *= cf.mask
+
+                current_sum = np.sum(np.abs(cf.weights))
+                if current_sum > 0.0000000000001:
+                    cf.weights *= norm_value/current_sum
+                    cf.norm_total = norm_value
+
+
+class CFPLF_HebbianNormalizeL1_opt(CFPLF_HebbianNormalizeL1):
+    """
+    CF-aware Hebbian learning rule fused with divisive L1
+    normalization.
+
+    Implemented in C for speed.  Each CF is updated by the Hebbian
+    rule and then normalized to sum to norm_value while its weights
+    are still in the cache, saving a separate pass over all the
+    weights by a CFPOF_DivisiveNormalizeL1_opt weights output
+    function; such a projection will normally have no
+    weights_output_fns.  The new sum is stored in norm_total, so any
+    remaining normalization step does not need to recompute it.
+
+    If the projection is normalized jointly with others (see
+    JointNormalizingCFSheet), the CFs are not normalized here;
+    only the sum of each CF's weights is stored in norm_total, for
+    the CFPOF_DivisiveNormalizeL1_opt weights_output_fns of the
+    group to normalize them jointly.
+    """
+
+    def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
+        single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
+        if single_connection_learning_rate==0:
+            return
+
+        if _jointly_normalized(iterator):
+            cf_update = ""
+        else:
+            cf_update = """
+                if (total > 0.0000000000001) {
+                    int rc = (rr2-rr1)*(cc2-cc1);
+                    float *cfweights = weights-rc;
+                    double factor = norm_value/total;
+                    for (int k=0; k<rc; ++k) {
+                        cfweights[k] *= factor;
+                    }
+                    total = norm_value;
+                }"""
+
+        _cf_learning_loop(iterator, input_activity, output_activity,
+                          unit_load="unit_activity*single_connection_learning_rate",
+                          weight_update="w += load*x;",
+                          cf_update=cf_update,
+                          single_connection_learning_rate=single_connection_learning_rate,
+                          norm_value=float(self.norm_value))
+
+provide_unoptimized_equivalent("CFPLF_HebbianNormalizeL1_opt","CFPLF_HebbianNormalizeL1",locals())
+
+
 
 # JABALERT: Is this really a fixed-threshold BCM rule?  If so, is that really useful?
 class CFPLF_BCMFixed_opt(CFPLearningFn):
@@ -141,79 +320,23 @@ class CFPLF_BCMFixed_opt(CFPLearningFn):
     unit_threshold=param.Number(default=0.5,bounds=(0,None),doc="Threshold between LTD and LTP.")
 
     def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
-        rows,cols = output_activity.shape
-        cfs = iterator.flatcfs
-        num_cfs = len(cfs)  # pyflakes:ignore (passed to weave C code)
         single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
         if single_connection_learning_rate==0:
             return
 
-        unit_threshold=self.unit_threshold  # pyflakes:ignore (passed to weave C code)
-
-        irows,icols = input_activity.shape
-        cf_type = iterator.cf_type  # pyflakes:ignore (passed to weave C code)
-        code = c_header + """
-            DECLARE_SLOT_OFFSET(weights,cf_type);
-            DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
-            DECLARE_SLOT_OFFSET(mask,cf_type);
-            DECLARE_SLOT_OFFSET(_norm_total,cf_type);
-            DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
-
-            %(cfs_loop_pragma)s
-            for (int r=0; r<num_cfs; ++r) {
-                double load = output_activity[r];
-                double unit_activity= load;
-                if (load != 0) {
-                    load *= single_connection_learning_rate;
-
-                    PyObject *cf = PyList_GetItem(cfs,r);
-
-                    LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(float,mask,cf);
-
-                    UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
-
-                    double total = 0.0;
-
-                    // modify non-masked weights
-                    npfloat *inpj = input_activity+icols*rr1+cc1;
-                    for (int i=rr1; i<rr2; ++i) {
-                        npfloat *inpi = inpj;
-                        for (int j=cc1; j<cc2; ++j) {
-                            // The mask is floating point, so we have to
-                            // use a robust comparison instead of testing
-                            // against exactly 0.0.
-                            if (*(mask++) >= MASK_THRESHOLD) {
-                                *weights += load * *inpi * (unit_activity - unit_threshold);
-                                if (*weights<0) { *weights = 0;}
-                                total += fabs(*weights);
-                            }
-                            ++weights;
-                            ++inpi;
-                        }
-                        inpj += icols;
-                    }
-                    // store the sum of the cf's weights
-                    LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
-                    _norm_total[0]=total;
-                    LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
-                    _has_norm_total[0]=1;
-                }
-            }
-        """%c_decorators
-
-        inline(code, ['input_activity', 'output_activity','num_cfs',
-                      'icols', 'cfs', 'single_connection_learning_rate',
-                      'unit_threshold','cf_type'],
-               local_dict=locals(),
-               headers=['<structmember.h>'])
+        _cf_learning_loop(iterator, input_activity, output_activity,
+                          unit_load="unit_activity*single_connection_learning_rate",
+                          weight_update="""
+                              w += load * x * (unit_activity - unit_threshold);
+                              if (w<0) { w = 0; }""",
+                          single_connection_learning_rate=single_connection_learning_rate,
+                          unit_threshold=self.unit_threshold)
 
 
 class CFPLF_BCMFixed(CFPLF_Plugin):
     """Same as CFPLF_Plugin(single_cf_fn=BCMFixed()); just for non-optimized fallback."""
     single_cf_fn = param.ClassSelector(LearningFn,default=BCMFixed(),readonly=True)
-provide_unoptimized_equivalent("CFPLF_BCMFixed_opt","CFPLF_Hebbian",locals())
+provide_unoptimized_equivalent("CFPLF_BCMFixed_opt","CFPLF_BCMFixed",locals())
 
 
 # CEBALERT: 2009/04/03 - when used in GCA-LISSOM, causes Python to crash.
@@ -234,75 +357,16 @@ class CFPLF_Scaled_opt(CFPLF_PluginScaled):
 
         if self.learning_rate_scaling_factor is None:
             self.learning_rate_scaling_factor = ones(output_activity.shape)*1.0
-        learning_rate_scaling_factor = self.learning_rate_scaling_factor  # pyflakes:ignore (passed to weave C code)
 
         single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
         if single_connection_learning_rate==0:
             return
 
-        cfs = iterator.flatcfs
-        num_cfs = len(cfs)  # pyflakes:ignore (passed to weave C code)
-        irows,icols = input_activity.shape
-        cf_type = iterator.cf_type  # pyflakes:ignore (passed to weave C code)
-
-        sheet_mask = iterator.get_sheet_mask()  # pyflakes:ignore (passed to weave C code)
-
-        code = c_header + """
-            DECLARE_SLOT_OFFSET(weights,cf_type);
-            DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
-            DECLARE_SLOT_OFFSET(mask,cf_type);
-            DECLARE_SLOT_OFFSET(_norm_total,cf_type);
-            DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
-
-            %(cfs_loop_pragma)s
-            for (int r=0; r<num_cfs; ++r) {
-                double load = output_activity[r];
-                double a = learning_rate_scaling_factor[r];
-                load = load * a;
-                if (load != 0 && sheet_mask[r] != 0) {
-                    load *= single_connection_learning_rate;
-
-                    PyObject *cf = PyList_GetItem(cfs,r);
-
-                    LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(float,mask,cf);
-
-                    UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
-
-                    double total = 0.0;
-
-                    // modify non-masked weights
-                    npfloat *inpj = input_activity+icols*rr1+cc1;
-                    for (int i=rr1; i<rr2; ++i) {
-                        npfloat *inpi = inpj;
-                        for (int j=cc1; j<cc2; ++j) {
-                            // The mask is floating point, so we have to
-                            // use a robust comparison instead of testing
-                            // against exactly 0.0.
-                            if (*(mask++) >= MASK_THRESHOLD) {
-                                *weights += load * *inpi;
-                                total += fabs(*weights);
-                            }
-                            ++weights;
-                            ++inpi;
-                        }
-                        inpj += icols;
-                    }
-                    // store the sum of the cf's weights
-                    LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
-                    _norm_total[0]=total;
-                    LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
-                    _has_norm_total[0]=1;
-                }
-            }
-        """%c_decorators
-
-        inline(code, ['input_activity','learning_rate_scaling_factor', 'output_activity',
-                      'sheet_mask', 'num_cfs', 'icols', 'cfs',
-                      'single_connection_learning_rate','cf_type'],
-               local_dict=locals(),
-               headers=['<structmember.h>'])
+        _cf_learning_loop(iterator, input_activity, output_activity,
+                          unit_load="unit_activity*learning_rate_scaling_factor[r]*single_connection_learning_rate",
+                          weight_update="w += load*x;",
+                          single_connection_learning_rate=single_connection_learning_rate,
+                          learning_rate_scaling_factor=self.learning_rate_scaling_factor)
 
 
 class CFPLF_Scaled(CFPLF_PluginScaled):
@@ -324,75 +388,178 @@ class CFPLF_Trace_opt(CFPLearningFn):
         doc="LearningFn that will be applied to each CF individually.")
 
     def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
-        cfs = iterator.flatcfs  # pyflakes:ignore (passed to weave C code)
         single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
-        irows,icols = input_activity.shape
-
         if single_connection_learning_rate==0:
             return
 
-        cfs = iterator.flatcfs
-        num_cfs = len(cfs)  # pyflakes:ignore (passed to weave C code)
-
         ##Initialise traces to zero if they don't already exist
         if not hasattr(self,'traces'):
             self.traces=zeros(output_activity.shape,activity_type)
 
         self.traces = (self.trace_strength*output_activity)+((1-self.trace_strength)*self.traces)
-        traces = self.traces  # pyflakes:ignore (passed to weave C code)
-        cf_type = iterator.cf_type  # pyflakes:ignore (passed to weave C code)
-        code = c_header + """
-            DECLARE_SLOT_OFFSET(weights,cf_type);
-            DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
-            DECLARE_SLOT_OFFSET(mask,cf_type);
-            DECLARE_SLOT_OFFSET(_norm_total,cf_type);
-            DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
-
-            %(cfs_loop_pragma)s
-            for (int r=0; r<num_cfs; ++r) {
-                double load = traces[r];
-                if (load != 0) {
-                    load *= single_connection_learning_rate;
-                    PyObject *cf = PyList_GetItem(cfs,r);
-
-                    LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(float,mask,cf);
-
-                    UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
-
-                    double total = 0.0;
-
-                    // modify non-masked weights
-                    npfloat *inpj = input_activity+icols*rr1+cc1;
-                    for (int i=rr1; i<rr2; ++i) {
-                        npfloat *inpi = inpj;
-                        for (int j=cc1; j<cc2; ++j) {
-                            // The mask is floating point, so we have to
-                            // use a robust comparison instead of testing
-                            // against exactly 0.0.
-                            if (*(mask++) >= MASK_THRESHOLD) {
-                                *weights += load * *inpi;
-                                total += fabs(*weight);
-                            }
-                            ++weights;
-                            ++inpi;
-                        }
-                        inpj += icols;
-                    }
-                    // store the sum of the cf's weights
-                    LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
-                    _norm_total[0]=total;
-                    LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
-                    _has_norm_total[0]=1;
-                }
-            }
-        """%c_decorators
 
-        inline(code, ['input_activity', 'traces','num_cfs', 'icols',
-                      'cfs', 'single_connection_learning_rate','cf_type'],
-               local_dict=locals(),
-               headers=['<structmember.h>'])
+        _cf_learning_loop(iterator, input_activity, output_activity,
+                          unit_load="traces[r]*single_connection_learning_rate",
+                          unit_condition="load != 0",
+                          weight_update="w += load*x;",
+                          skip_inactive=False,
+                          single_connection_learning_rate=single_connection_learning_rate,
+                          traces=self.traces)
 
 
 provide_unoptimized_equivalent("CFPLF_Trace_opt","CFPLF_Trace",locals())
+
+
+
+class CFPLF_EuclideanHebbian_opt(CFPLF_EuclideanHebbian):
+    """
+    Optimized version of CFPLF_EuclideanHebbian; see projfn.py for more info.
+
+    Unlike the unoptimized version, units excluded by the sheet mask
+    are not modified.
+    """
+
+    def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
+        if learning_rate==0:
+            return
+
+        _cf_learning_loop(iterator, input_activity, output_activity,
+                          unit_load="unit_activity*learning_rate",
+                          weight_update="w += load*(x-w);",
+                          learning_rate=float(learning_rate))
+
+provide_unoptimized_equivalent("CFPLF_EuclideanHebbian_opt","CFPLF_EuclideanHebbian",locals())
+
+
+
+class CFPLF_OutstarHebbian_opt(CFPLF_OutstarHebbian):
+    """
+    Optimized version of CFPLF_OutstarHebbian; see projfn.py for more info.
+    """
+    single_cf_fn = param.ClassSelector(LearningFn,default=Hebbian(),readonly=True)
+
+    def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
+        single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
+        if single_connection_learning_rate==0:
+            return
+
+        _cf_learning_loop(iterator, input_activity, output_activity,
+                          unit_load="unit_activity*single_connection_learning_rate",
+                          weight_update="w += load*x;",
+                          single_connection_learning_rate=single_connection_learning_rate)
+
+provide_unoptimized_equivalent("CFPLF_OutstarHebbian_opt","CFPLF_OutstarHebbian",locals())
+
+
+
+class HomeoSynaptic_opt(HomeoSynaptic):
+    """
+    Optimized version of HomeoSynaptic; see projfn.py for more info.
+
+    Every unit is rescaled on each call, active or not, so this
+    function cannot skip inactive units.
+    """
+    single_cf_fn = param.ClassSelector(LearningFn,default=Hebbian(),readonly=True)
+
+    def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
+        activity_norm = self._activity_norm(iterator, output_activity)
+        single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
+
+        _cf_learning_loop(iterator, input_activity, output_activity,
+                          unit_load="unit_activity*single_connection_learning_rate",
+                          unit_condition="sheet_mask[r] != 0",
+                          weight_update="w = (w + load*x)/activity_norm[r];",
+                          skip_inactive=False,
+                          single_connection_learning_rate=single_connection_learning_rate,
+                          activity_norm=activity_norm)
+
+        self._record_history(iterator)
+
+provide_unoptimized_equivalent("HomeoSynaptic_opt","HomeoSynaptic",locals())
+
+
+
+class CFPLF_Oja(CFPLF_Plugin):
+    """Same as CFPLF_Plugin(single_cf_fn=Oja()); just for non-optimized fallback."""
+    single_cf_fn = param.ClassSelector(Oja,default=Oja())
+
+
+class CFPLF_Oja_opt(CFPLF_Oja):
+    """
+    CF-aware Oja learning rule.
+
+    Implemented in C for speed.  Should be equivalent to
+    CFPLF_Plugin(single_cf_fn=Oja()), except faster.
+    """
+
+    def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
+        single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
+        if single_connection_learning_rate==0:
+            return
+
+        _cf_learning_loop(iterator, input_activity, output_activity,
+                          unit_load="unit_activity*single_connection_learning_rate",
+                          weight_update="w += load*(x - alpha*unit_activity*w);",
+                          single_connection_learning_rate=single_connection_learning_rate,
+                          alpha=self.single_cf_fn.alpha)
+
+provide_unoptimized_equivalent("CFPLF_Oja_opt","CFPLF_Oja",locals())
+
+
+
+class CFPLF_Covariance(CFPLF_Plugin):
+    """Same as CFPLF_Plugin(single_cf_fn=Covariance()); just for non-optimized fallback."""
+    single_cf_fn = param.ClassSelector(Covariance,default=Covariance())
+
+
+class CFPLF_Covariance_opt(CFPLF_Covariance):
+    """
+    CF-aware covariance learning rule.
+
+    Implemented in C for speed.  Should be equivalent to
+    CFPLF_Plugin(single_cf_fn=Covariance()), except faster.  Units
+    whose activity is below the unit_threshold are depressed, so
+    inactive units are not skipped unless that threshold is zero.
+    """
+
+    def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
+        single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
+        if single_connection_learning_rate==0:
+            return
+
+        _cf_learning_loop(iterator, input_activity, output_activity,
+                          unit_load="(unit_activity-unit_threshold)*single_connection_learning_rate",
+                          weight_update="w += load*(x - input_threshold);",
+                          single_connection_learning_rate=single_connection_learning_rate,
+                          skip_inactive=(self.single_cf_fn.unit_threshold==0),
+                          unit_threshold=self.single_cf_fn.unit_threshold,
+                          input_threshold=self.single_cf_fn.input_threshold)
+
+provide_unoptimized_equivalent("CFPLF_Covariance_opt","CFPLF_Covariance",locals())
+
+
+
+class CFPLF_CPCA(CFPLF_Plugin):
+    """Same as CFPLF_Plugin(single_cf_fn=CPCA()); just for non-optimized fallback."""
+    single_cf_fn = param.ClassSelector(CPCA,default=CPCA())
+
+
+class CFPLF_CPCA_opt(CFPLF_CPCA):
+    """
+    CF-aware CPCA learning rule.
+
+    Implemented in C for speed.  Should be equivalent to
+    CFPLF_Plugin(single_cf_fn=CPCA()), except faster.
+    """
+
+    def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
+        single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
+        if single_connection_learning_rate==0:
+            return
+
+        _cf_learning_loop(iterator, input_activity, output_activity,
+                          unit_load="unit_activity*single_connection_learning_rate",
+                          weight_update="w += load*(x-w);",
+                          single_connection_learning_rate=single_connection_learning_rate)
+
+provide_unoptimized_equivalent("CFPLF_CPCA_opt","CFPLF_CPCA",locals())
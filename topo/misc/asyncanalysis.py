@@ -0,0 +1,111 @@
+"""
+Running analysis in forked processes while a simulation continues.
+
+When run_batch's analysis_processes parameter is greater than zero,
+each analysis (e.g. map measurement and plotting) is run by
+AnalysisWorkers in a child process forked from the simulation.  The
+child starts with a copy-on-write snapshot of the whole simulation
+(weights, activity, homeostatic thresholds and everything else), so
+the analysis sees exactly the state at the time it was started,
+while the parent carries on training.  The output of each analysis
+is collected into the parent's output when the analysis finishes,
+and analyses that fail are counted as errors.
+"""
+
+import os
+import sys
+import tempfile
+import traceback
+import multiprocessing
+
+
+def fork_available():
+    """Return True if analysis can be run in forked processes on this platform."""
+    return hasattr(os,'fork')
+
+
+def _run_analysis(analysis_fn, output_path):
+    """Run analysis_fn in the child process, sending its output to output_path."""
+    # The output file is left open: multiprocessing flushes
+    # sys.stdout and sys.stderr before the child exits.
+    output = open(output_path,'w')
+    sys.stdout = sys.stderr = output
+    try:
+        # libgomp's thread pool is not copied by fork, so an OpenMP
+        # parallel loop with more than one thread hangs in a child of
+        # a parent that has already run one.
+        from topo.misc.inlinec import set_openmp_threads
+        set_openmp_threads(1)
+        analysis_fn()
+    except:
+        traceback.print_exc(file=output)
+        output.flush()
+        # Report the failure through the exit code
+        os._exit(1)
+
+
+class AnalysisWorkers(object):
+    """
+    Runs analysis functions in at most processes forked child
+    processes at once, collecting their output (printed to
+    sys.stdout) and counting those that fail in errors.
+
+    Because libgomp does not support fork, optimized components are
+    restricted to a single OpenMP thread in the analysis processes.
+    """
+
+    def __init__(self, processes=1, directory=None):
+        self.processes = max(processes,1)
+        self.directory = directory
+        self.errors = 0
+        # (process, label, output path) for each analysis not yet collected
+        self.running = []
+
+
+    def start(self, analysis_fn, label=''):
+        """
+        Start analysis_fn in a new child process, first waiting for an
+        earlier analysis to finish if the maximum number are running.
+        """
+        while len(self.running) >= self.processes:
+            self.collect(block=True)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        fd,output_path = tempfile.mkstemp(suffix='.analysis.out',dir=self.directory)
+        os.close(fd)
+        process = multiprocessing.Process(target=_run_analysis,args=(analysis_fn,output_path))
+        process.start()
+        self.running.append((process,label,output_path))
+        self.collect()
+
+
+    def collect(self, block=False):
+        """
+        Collect the output of any finished analyses, in the order they
+        were started.  If block is True, first wait for the oldest one
+        to finish.
+        """
+        if block and self.running:
+            self.running[0][0].join()
+        running = []
+        for process,label,output_path in self.running:
+            if running or process.is_alive():
+                running.append((process,label,output_path))
+                continue
+            process.join()
+            with open(output_path) as f:
+                output = f.read()
+            os.remove(output_path)
+            if output:
+                print "Analysis %s output:" % label
+                sys.stdout.write(output)
+            if process.exitcode != 0:
+                self.errors += 1
+                print "Warning -- Error detected in analysis %s (exit code %s)." % (label,process.exitcode)
+        self.running = running
+
+
+    def join(self):
+        """Wait for all the analyses to finish, collecting their output."""
+        while self.running:
+            self.collect(block=True)
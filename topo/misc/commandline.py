@@ -23,38 +23,55 @@ from param import parameterized
 from param.parameterized import Parameterized
 from topo.base.simulation import OptionalSingleton
 
-try:
-    # By default, use a non-GUI backend for matplotlib.
-    from matplotlib import rcParams
-    rcParams['backend']='Agg'
-    matplotlib_imported=True
-except ImportError:
-    matplotlib_imported=False
+from topo.misc.util import after_import
+
+def set_matplotlib_backend(backend):
+    """
+    Use the given matplotlib backend, without importing matplotlib
+    if it has not been imported already.
+    """
+    def _set_backend(matplotlib):
+        matplotlib.rcParams['backend']=backend
+    after_import('matplotlib',_set_backend)
+
+# By default, use a non-GUI backend for matplotlib.
+set_matplotlib_backend('Agg')
 
 # Dummy object just for messages
 cmdline_main=Parameterized(name="CommandLine")
 
+# IPython is only imported (by import_ipython()) when an interactive
+# session is about to start.
 ipython_shell_interface = None
 ipython_prompt_interface = None
-try:
-    try:
-         from IPython.terminal.embed import InteractiveShellEmbed as IPShell
-    except ImportError: # Prior to IPython 1.0, InteractiveShellEmbed was found in the frontend package
-        from IPython.frontend.terminal.embed import InteractiveShellEmbed as IPShell # pyflakes:ignore (try/except import)
-    from IPython.config.loader import Config
-    ipython_shell_interface = "InteractiveShellEmbed"
-    try:
-        from IPython.core.prompts import PromptManager  # pyflakes:ignore (try/except import)
-        ipython_prompt_interface = "PromptManager"
-    except ImportError:
-        pass
-except ImportError:
+IPShell = None
+Config = None
+
+def import_ipython():
+    """
+    Import IPython's embedded shell, setting ipython_shell_interface
+    and ipython_prompt_interface to the interfaces found.
+    """
+    global IPShell, Config, ipython_shell_interface, ipython_prompt_interface
     try:
-        # older version?
-        from IPython.Shell import IPShell  # pyflakes:ignore (try/except import)
-        ipython_shell_interface = "IPython.Shell"
+        try:
+             from IPython.terminal.embed import InteractiveShellEmbed as IPShell
+        except ImportError: # Prior to IPython 1.0, InteractiveShellEmbed was found in the frontend package
+            from IPython.frontend.terminal.embed import InteractiveShellEmbed as IPShell # pyflakes:ignore (try/except import)
+        from IPython.config.loader import Config
+        ipython_shell_interface = "InteractiveShellEmbed"
+        try:
+            from IPython.core.prompts import PromptManager  # pyflakes:ignore (try/except import)
+            ipython_prompt_interface = "PromptManager"
+        except ImportError:
+            pass
     except ImportError:
-        print "Note: IPython is not available; using basic interactive Python prompt instead."
+        try:
+            # older version?
+            from IPython.Shell import IPShell  # pyflakes:ignore (try/except import)
+            ipython_shell_interface = "IPython.Shell"
+        except ImportError:
+            print "Note: IPython is not available; using basic interactive Python prompt instead."
 
 
 
@@ -447,8 +464,7 @@ topo_parser.add_option("-o","--outputpath",action="callback",callback=o_action,t
 
 def gui(start=True,exit_on_quit=True):
     """Start the GUI as if -g were supplied in the command used to launch Topographica."""
-    if matplotlib_imported:
-        rcParams['backend']='TkAgg'
+    set_matplotlib_backend('TkAgg')
     auto_import_commands()
     if start:
         import topo.tkgui
@@ -637,6 +653,25 @@ topo_parser.add_option("-t","--test",action = "callback",callback=t_action,type=
                        help="name of test to run (use '-t list' to show tests available).")
 
 
+def precompile_action(option,opt_str,value,parser):
+    """Callback function for the --precompile option."""
+    from topo.misc import compilecache
+    failures = compilecache.precompile()
+    global return_code, something_executed
+    return_code += len(failures)
+    something_executed=True
+
+topo_parser.add_option("--precompile",action="callback",callback=precompile_action,
+                       default=False,dest="precompile",help="""\
+build all optimized (weave and Cython) kernels into the shared kernel \
+cache (see topo.misc.compilecache); scripts run afterwards compile \
+whatever other optimized code they use.  Kernels missing from the \
+cache are reported at startup, and are compiled on first use unless \
+compile_kernels=False is set in the main namespace before \
+Topographica is imported, in which case only precompiled kernels are \
+used.""")
+
+
 
 
 
@@ -739,6 +774,7 @@ def process_argv(argv):
     if os.environ.get('PYTHONINSPECT'):
         print "Output path: %s" % param.normalize_path.prefix
         print BANNER
+        import_ipython()
         # CBALERT: should probably allow a way for users to pass
         # things to IPython? Or at least set up some kind of
         # topographica ipython config file. Right now, a topo_parser
@@ -0,0 +1,485 @@
+"""
+Shared cache of compiled (weave and Cython) kernels.
+
+Optimized components used to be compiled into per-user directories
+when first used (weave) or on every import (Cython), so that many
+jobs starting at once compiled the same code simultaneously into the
+same directory.  Instead, kernels are now compiled into a cache
+directory that is versioned by the Python, numpy and machine type,
+and protected by a lock so that it can be shared between processes
+(and machines, on a shared filesystem that supports locking).  The
+cache records a manifest of what has been built, along with a hash
+of the sources each item was built from.
+
+By default, kernels are still compiled when first used (under the
+lock, so each is compiled only once).  To avoid compiling during the
+first iteration of each job, precompile() (e.g. run as
+'./topographica --precompile') builds all the kernels ahead of time.
+Kernels not found in the manifest with matching sources are reported
+as missing at startup (see report()) whether or not they will be
+compiled.  Setting compile_kernels=False in the main namespace before
+Topographica is imported then uses only the kernels found in the
+manifest; the Python equivalents of any others are used instead.
+
+The cache is in ~/.topographica/kernels by default; define
+kernel_cache_dir in the main namespace to use another location.  If
+the cache directory cannot be created, a warning is printed and
+kernels are compiled as before, into weave's (or pyximport's) default
+location, or beside their sources for Cython extensions, without
+locking.
+"""
+
+import errno
+import hashlib
+import json
+import os
+import platform
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import __main__
+
+import numpy
+import param
+
+try:
+    import fcntl
+except ImportError: # e.g. Windows: no locking
+    fcntl = None
+
+
+compile_kernels = __main__.__dict__.get('compile_kernels',True)
+
+kernel_cache_dir = __main__.__dict__.get('kernel_cache_dir',
+                                         os.path.join(os.path.expanduser('~'),'.topographica','kernels'))
+
+# Set to True while precompile() is running (or after --precompile),
+# when everything that is used is compiled and recorded.
+precompiling = False
+
+MANIFEST_FILENAME = 'manifest.json'
+
+_root_path = os.path.abspath(os.path.join(os.path.dirname(__file__),'..','..'))
+
+# Names of the missing items reported so far
+_missing = []
+
+_manifest = None
+
+# Whether the cache directory can be used (None until first checked)
+_available = None
+
+# Hash of each weave code string used, and the hashes of those known
+# to be compiled, so that the manifest is only consulted once for each
+_code_keys = {}
+_compiled_code = set()
+
+# Tuple of source paths -> hash of their contents, for self-test results
+_source_hashes = {}
+
+
+def version():
+    """
+    Return the name of the cache directory for this Python, numpy
+    and machine type.
+    """
+    return "py%d.%d-numpy%s-%s-%s" % (sys.version_info[0],sys.version_info[1],
+                                      numpy.__version__,platform.system().lower(),
+                                      platform.machine())
+
+
+def cache_path(*subdirs):
+    """Return the path of the versioned cache directory, without creating it."""
+    return os.path.join(kernel_cache_dir,version(),*subdirs)
+
+
+def directory(*subdirs):
+    """
+    Return (creating it if necessary) the versioned cache directory,
+    raising OSError if it cannot be created.
+    """
+    path = cache_path(*subdirs)
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path): # created by another process meanwhile
+                raise
+    return path
+
+
+def available():
+    """
+    Return True if the cache directory exists or can be created, and
+    is writable; otherwise, warn (once) and return False.
+    """
+    global _available
+    if _available is None:
+        try:
+            path = directory()
+            if not os.access(path,os.W_OK):
+                raise OSError(errno.EACCES,os.strerror(errno.EACCES),path)
+            _available = True
+        except OSError, e:
+            _available = False
+            param.Parameterized(name='compilecache').warning(
+                "Unable to use kernel cache %s (%s); compiling kernels into the "
+                "default locations without locking." % (cache_path(),e))
+    return _available
+
+
+@contextmanager
+def lock():
+    """
+    Hold an exclusive lock on the cache, e.g. while compiling into it
+    or updating its manifest.  (No lock is held if the cache
+    directory cannot be used.)
+    """
+    if not available():
+        yield
+        return
+    lockfile = open(os.path.join(directory(),'.lock'),'w')
+    try:
+        if fcntl is not None:
+            fcntl.flock(lockfile,fcntl.LOCK_EX)
+        yield
+    finally:
+        if fcntl is not None:
+            fcntl.flock(lockfile,fcntl.LOCK_UN)
+        lockfile.close()
+
+
+def source_hash(paths):
+    """Return a hash of the contents of the given source files."""
+    h = hashlib.sha1()
+    for path in paths:
+        if path.endswith('.pyc') or path.endswith('.pyo'):
+            path = path[:-1]
+        with open(path,'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def _source_name(path):
+    """Return path relative to the Topographica root, for use as a manifest key."""
+    path = os.path.abspath(path)
+    if path.endswith('.pyc') or path.endswith('.pyo'):
+        path = path[:-1]
+    return os.path.relpath(path,_root_path)
+
+
+def manifest(reload=False):
+    """
+    Return the cache's manifest: a dictionary with entries 'compiler'
+    (True if weave was able to compile), 'modules' (source file to
+    hash, for the modules whose weave kernels were built), 'extensions'
+    (Cython extension name to hash of its sources), 'weave_code'
+    (list of hashes of the weave code compiled) and 'self_tests'
+    (kernel backend name to [hash of its sources, result]; see
+    record_self_test()).
+    """
+    global _manifest
+    if _manifest is None or (reload and available()):
+        _manifest = {}
+        path = os.path.join(cache_path(),MANIFEST_FILENAME)
+        if available() and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    _manifest = json.load(f)
+            except (IOError,ValueError), e:
+                param.Parameterized(name='compilecache').warning(
+                    "Ignoring unreadable manifest %s: %s" % (path,e))
+        for key,default in [('compiler',False),('modules',{}),('extensions',{}),
+                            ('weave_code',[]),('self_tests',{})]:
+            _manifest.setdefault(key,default)
+    return _manifest
+
+
+def update_manifest(fn):
+    """
+    Apply fn to the manifest and save it; must be called while
+    holding the lock.  The manifest is re-read first, so that entries
+    recorded by other processes are kept.  (If the cache directory
+    cannot be used, the manifest is only updated in memory.)
+    """
+    m = manifest(reload=True)
+    fn(m)
+    if not available():
+        return
+    fd,tmp = tempfile.mkstemp(dir=directory(),suffix='.tmp')
+    with os.fdopen(fd,'w') as f:
+        json.dump(m,f,indent=1,sort_keys=True)
+    os.rename(tmp,os.path.join(directory(),MANIFEST_FILENAME))
+
+
+def _report_missing(name, reason):
+    if name in _missing:
+        return
+    _missing.append(name)
+    logger = param.Parameterized(name='compilecache')
+    if len(_missing) == 1:
+        action = "compiling them on first use" if compile_kernels else "using unoptimized versions"
+        logger.warning("Compiled kernels missing from %s (e.g. %s: %s); %s. "
+                       "Run './topographica --precompile' to build them, and see "
+                       "topo.misc.compilecache.report()." % (cache_path(),name,reason,action))
+    else:
+        logger.verbose("Compiled kernel %s missing: %s" % (name,reason))
+
+
+def missing():
+    """Return the names of the compiled items found to be missing so far."""
+    return list(_missing)
+
+
+def report():
+    """Print, and return, the names of the missing compiled items."""
+    print "Kernel cache: %s" % cache_path()
+    if not _missing:
+        print "No compiled kernels missing."
+    for name in _missing:
+        print "Missing: %s" % name
+    return missing()
+
+
+def _memoized_source_hash(paths):
+    key = tuple(paths)
+    digest = _source_hashes.get(key)
+    if digest is None:
+        digest = _source_hashes[key] = source_hash(paths)
+    return digest
+
+
+def self_test_result(name, paths):
+    """
+    Return the result (True if passed) of the self-test of the
+    kernel backend name recorded by record_self_test() for the
+    current contents of the given source files, or None if there is
+    none.
+    """
+    entry = manifest()['self_tests'].get(name)
+    if entry is not None and entry[0] == _memoized_source_hash(paths):
+        return entry[1]
+    return None
+
+
+def record_self_test(name, paths, passed):
+    """
+    Record in the manifest whether the self-test of the kernel
+    backend name passed, for the current contents of the given
+    source files, so that other processes need not repeat it.
+    """
+    entry = [_memoized_source_hash(paths),bool(passed)]
+    with lock():
+        update_manifest(lambda m: m['self_tests'].__setitem__(name,entry))
+
+
+def test_compiler(inline):
+    """
+    Compile and run a trivial piece of code using weave's inline
+    (raising an exception if it cannot be compiled), and record in the
+    manifest that weave is able to compile.  The code is compiled only
+    once into the cache, rather than each time Topographica starts.
+    """
+    inline('double x=0.0;')
+    if not manifest()['compiler']:
+        with lock():
+            update_manifest(lambda m: m.__setitem__('compiler',True))
+
+
+def weave_compiler_available():
+    """
+    Return True if weave has been found to compile successfully (by
+    test_compiler(), e.g. during precompile()).  Otherwise, weave is
+    reported as missing.
+    """
+    if precompiling or manifest()['compiler']:
+        return True
+    _report_missing('weave',"compiler not tested by precompile()")
+    return False
+
+
+def _check_source(section, path):
+    """
+    Return True if the item built from the source file at path is in
+    the given section of the manifest with a matching hash (or may
+    be compiled now).  Otherwise, the item is reported as missing.
+    """
+    name = _source_name(path)
+    if precompiling:
+        digest = source_hash([path])
+        with lock():
+            update_manifest(lambda m: m[section].__setitem__(name,digest))
+        return True
+    if manifest()[section].get(name) == source_hash([path]):
+        return True
+    _report_missing(name,"not built by precompile() from the current source")
+    return compile_kernels
+
+
+def weave_module_compiled(path):
+    """
+    Return True if the weave kernels of the module at path have been
+    built from its current source.
+    """
+    return _check_source('modules',path)
+
+
+def pyx_compiled(path):
+    """
+    Return True if the .pyx file at path has been built by pyximport
+    from its current source.
+    """
+    return _check_source('extensions',path)
+
+
+def weave_inline(inline, code, *args, **kw):
+    """
+    Call weave's inline(code, *args, **kw).  The first time code is
+    used, it is compiled under the cache lock (and recorded in the
+    manifest) unless the manifest shows it has been compiled already;
+    afterwards, this only adds a dictionary lookup to weave's own.
+    """
+    key = _code_keys.get(code)
+    if key is None:
+        key = _code_keys[code] = hashlib.sha1(code).hexdigest()
+    if key in _compiled_code:
+        return inline(code,*args,**kw)
+    if key in manifest()['weave_code']:
+        _compiled_code.add(key)
+        return inline(code,*args,**kw)
+
+    def add_code(m):
+        if key not in m['weave_code']:
+            m['weave_code'].append(key)
+    with lock():
+        if available():
+            directory('weave') # weave only uses PYTHONCOMPILED if it exists
+        result = inline(code,*args,**kw)
+        update_manifest(add_code)
+    _compiled_code.add(key)
+    if not precompiling:
+        param.Parameterized(name='compilecache').verbose(
+            "Compiled weave code %s on first use; run './topographica --precompile' "
+            "to compile it ahead of time." % key)
+    return result
+
+
+def _build_lib(name, setup_script):
+    """
+    Return the directory into which to build the Cython extension
+    name: in the cache, or beside setup_script (as before the cache
+    existed) if the cache cannot be used.
+    """
+    if available():
+        return directory('extensions',*name.split('.')[:-1])
+    return os.path.dirname(os.path.abspath(setup_script))
+
+
+def build_extension(name, setup_script, sources):
+    """
+    Build the Cython extension name (e.g. 'topo.sparse.sparse') by
+    running setup_script (which must accept distutils arguments) into
+    the cache, recording it in the manifest.  Nothing is built if
+    another process has built it from the same sources while this one
+    waited for the lock.
+    """
+    from distutils.core import run_setup
+    build_lib = _build_lib(name,setup_script)
+    digest = source_hash(sources)
+    with lock():
+        if manifest(reload=True)['extensions'].get(name) != digest:
+            run_setup(setup_script,['--quiet','build_ext','--build-lib',build_lib])
+            update_manifest(lambda m: m['extensions'].__setitem__(name,digest))
+    return build_lib
+
+
+def extension_dir(name, setup_script, sources):
+    """
+    Return the directory containing the compiled Cython extension
+    name, or None if it has not been built from the current sources.
+    Such an extension is reported as missing, and is then built if
+    compile_kernels is True (or while precompiling).
+    """
+    if manifest()['extensions'].get(name) == source_hash(sources):
+        return _build_lib(name,setup_script)
+    if not precompiling:
+        _report_missing(name,"not built by precompile() from the current sources")
+    if compile_kernels or precompiling:
+        return build_extension(name,setup_script,sources)
+    return None
+
+
+def pyximport_build_dir():
+    """
+    Return the directory used by pyximport to build .pyx files, or
+    None (for pyximport's default) if the cache cannot be used.
+    """
+    return directory('pyxbld') if available() else None
+
+
+def precompile(modules=None):
+    """
+    Build all the optimized kernels into the cache: test that weave
+    can compile, build the Cython extensions, compile the weave code
+    of each registered CF kernel by applying it to a small
+    projection, and record the results of kernels.self_test().
+
+    Further weave code (e.g. that of optimized sheets) is compiled and
+    recorded whenever it is used while precompiling, so scripts run
+    after ./topographica --precompile have everything they use built.
+
+    Returns a list of the kernels that could not be built.
+    """
+    global precompiling
+    precompiling = True
+    failures = []
+
+    from topo.misc import inlinec, kernels
+    if inlinec.weave_imported:
+        try:
+            test_compiler(inlinec.inline)
+            # Enable weave kernels, which would otherwise have been
+            # disabled if imported before the compiler was tested
+            inlinec.compiled = inlinec.optimized = True
+            kernels.set_backend_status('weave',True)
+        except Exception, e:
+            failures.append(('weave',str(e)))
+
+    # Importing these builds their extensions and records their weave kernels
+    for module in modules or _optimized_modules:
+        try:
+            __import__(module)
+        except Exception, e:
+            failures.append((module,str(e)))
+
+    for kernel,implementations in kernels._kernels.items():
+        for backend,implementation in implementations.items():
+            if kernels.kernel_status.get((kernel,backend)) == 'not precompiled':
+                kernels.set_kernel_status(kernel,backend,True)
+            if backend == 'python' or not kernels.is_available(kernel,backend):
+                continue
+            try:
+                kernels.exercise(kernel,implementation)
+                if backend == 'weave':
+                    weave_module_compiled(sys.modules[implementation.__module__].__file__)
+            except Exception, e:
+                failures.append(("%s (%s)" % (kernel,backend),str(e)))
+
+    for kernel,backend in kernels.self_test():
+        failures.append(("%s (%s)" % (kernel,backend),"disagrees with the Python version"))
+
+    for name,message in failures:
+        param.Parameterized(name='compilecache').warning("Unable to build %s: %s" % (name,message))
+    print "Precompiled kernels into %s." % cache_path()
+    return failures
+
+
+# Modules defining optimized components
+_optimized_modules = ['topo.optimized',
+                      'topo.optimized.color',
+                      'topo.sparse',
+                      'topo.responsefn.optimized',
+                      'topo.learningfn.optimized',
+                      'topo.transferfn.optimized',
+                      'topo.sheet.optimized']
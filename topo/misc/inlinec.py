@@ -29,6 +29,11 @@ inlinec.optimized is False.
 For more information on weave, see:
 http://old.scipy.org/documentation/weave/weaveusersguide.html
 
+Weave compiles into the shared kernel cache of topo.misc.compilecache,
+each piece of code being compiled (under the cache's lock) when first
+used, unless it has been built ahead of time by './topographica
+--precompile'.
+
 Some of the C functions also support OpenMP, which allows them to use
 multiple threads automatically on multi-core machines to give better
 performance.  To enable OpenMP support for those functions, set
@@ -42,13 +47,20 @@ thread-safe portions of the Python/Numpy C API. In general, the Python
 C API cannot be assumed to be thread safe.  Calls to PyObject_SetAttrString
 are a common hazard which can often be avoided using LOOKUP_FROM_SLOT_OFFSET.
 This makes use of Python's __slots__ mechanism with the added benefit of
-bypassing the GIL.
+bypassing the GIL.  Similarly, the CFs of a projection should be
+obtained inside parallel loops from the array declared by
+DECLARE_CF_ITEMS, rather than by calling PyList_GetItem.
+
+The number of threads can be changed while running using
+set_openmp_threads (as done for the Simulation's threads parameter).
 """
 
 import collections
 import os
 from copy import copy
 
+from topo.misc import kernels, compilecache
+
 # If import_weave is not defined, or is set to True, will attempt to
 # import weave.  Set import_weave to False if you want to avoid weave
 # altogether, e.g. if your installation is broken.
@@ -109,6 +121,9 @@ try:
     if import_weave:
         # We supply weave separately with the source distribution, but
         # e.g. the ubuntu package uses scipy.
+        # Compile into (and load from) the shared kernel cache; the
+        # directory is only created when something is first compiled
+        os.environ.setdefault('PYTHONCOMPILED',compilecache.cache_path('weave'))
         try:
             import weave
         except ImportError:
@@ -132,7 +147,7 @@ try:
     def inline_weave(*params,**nparams):
         named_params = copy(inline_named_params) # Make copy of defaults.
         named_params.update(nparams)             # Add newly passed named parameters.
-        weave.inline(*params,**named_params)
+        compilecache.weave_inline(weave.inline,*params,**named_params)
 
     # Overwrites stub definition with full Weave definition
     inline = inline_weave # pyflakes:ignore (try/except import)
@@ -143,22 +158,51 @@ except ImportError:
     print 'Caution: Unable to import Weave.  Will use non-optimized versions of most components.'
 
 
+# Whether weave can compile is tested once, and recorded in the kernel
+# cache, rather than by compiling something each time Topographica
+# starts.
 if weave_imported:
-    import random
-    try:
-        # to force recompilation each time
-        inline('double x=%s;'%random.random())
-        compiled = True
-    except Exception, e:
-        print "Caution: Unable to use Weave to compile: \"%s\". Will use non-optimized versions of most components."%str(e)
+    compiled = compilecache.weave_compiler_available()
+    if not compiled and compilecache.compile_kernels:
+        try:
+            compilecache.test_compiler(inline)
+            compiled = True
+        except Exception, e:
+            print "Caution: Unable to use Weave to compile: \"%s\". Will use non-optimized versions of most components."%str(e)
+            kernels.set_backend_status('weave',False,'unable to compile: %s'%str(e))
+    elif not compiled:
+        kernels.set_backend_status('weave',False,'not precompiled; see topo.misc.compilecache')
 
 # Flag available for all to use to test whether to use the inline
 # versions or not.
 optimized = weave_imported and compiled
 
+if optimized:
+    kernels.set_backend_status('weave',True)
+elif 'weave' not in kernels.backend_status:
+    kernels.set_backend_status('weave',False,'weave not imported' if import_weave
+                               else 'import_weave is False')
+
 warn_for_each_unoptimized_component = False
 
 
+def set_openmp_threads(threads):
+    """
+    Set the number of threads used by the OpenMP-parallel loops of
+    optimized components (both weave and Cython), if available.
+    """
+    if not (optimized and c_decorators['cfs_loop_pragma']):
+        if threads > 1:
+            print "Caution: OpenMP is not available; ignoring request for %d threads." % threads
+        return
+    threads = int(threads)  # pyflakes:ignore (passed to weave C code)
+    inline('omp_set_num_threads(threads);',['threads'],local_dict=locals(),
+           headers=['<omp.h>'])
+
+if optimized and not isinstance(openmp_threads,bool) and openmp_threads > 1:
+    set_openmp_threads(openmp_threads)
+
+
 # JABALERT: I can't see any reason why this function accepts names rather
 # than the more pythonic option of accepting objects, from which names
 # can be extracted if necessary.
@@ -166,6 +210,12 @@ def provide_unoptimized_equivalent(optimized_name, unoptimized_name, local_dict)
     """
     If not using optimization, replace the optimized component with its unoptimized equivalent.
 
+    Both components are also registered with topo.misc.kernels as the
+    'weave' and 'python' backends of the kernel unoptimized_name, and
+    optimized_name is bound to whichever of them is preferred
+    according to kernels.backend_preference (and has not been
+    recorded as failing kernels.self_test()).
+
     The objects named by optimized_name and unoptimized_name should be
     plug-compatible.  The local_dict argument should be given the
     contents of locals(), so that this function can replace the
@@ -183,8 +233,12 @@ def provide_unoptimized_equivalent(optimized_name, unoptimized_name, local_dict)
         sort_opt = sort
         print 'module: Inline-optimized components not available; using sort instead of sort_opt.'
     """
-    if not optimized:
-        local_dict[optimized_name] = local_dict[unoptimized_name]
+    kernels.register(unoptimized_name,'weave',local_dict[optimized_name])
+    kernels.register(unoptimized_name,'python',local_dict[unoptimized_name])
+    if optimized and not compilecache.weave_module_compiled(local_dict['__file__']):
+        kernels.set_kernel_status(unoptimized_name,'weave',False,'not precompiled')
+    optimized_fn = local_dict[optimized_name]
+    if kernels.bind(unoptimized_name,local_dict,optimized_name) is not optimized_fn:
         if warn_for_each_unoptimized_component:
             print '%s: Inline-optimized components not available; using %s instead of %s.' \
                   % (local_dict['__name__'], optimized_name, unoptimized_name)
@@ -250,6 +304,13 @@ typedef double npfloat;
    if(attr ## _array != 0) { \
        Py_DECREF(attr ## _array); }
 
+/* For a list of CFs cfs, declares cfs_items, the array of (borrowed)
+   pointers to its items, so that the CFs can be accessed in
+   OpenMP-parallel loops without calling the Python API. The list
+   must not be modified while cfs_items is in use. */
+#define DECLARE_CF_ITEMS(cfs) \
+  PyObject **cfs ## _items = PySequence_Fast_ITEMS((PyObject *)cfs)
+
 #define UNPACK_FOUR_TUPLE(type,i1,i2,i3,i4,tuple) \
   type i1 = *tuple++; \
   type i2 = *tuple++; \
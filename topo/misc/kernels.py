@@ -0,0 +1,579 @@
+"""
+Registry of the alternative implementations (backends) of optimized
+components, such as CF projection response, learning and output
+functions.
+
+Each kernel (e.g. 'CFPLF_Hebbian') can have several backends: the
+plain Python version ('python'), inline C compiled by weave
+('weave'), and Cython extensions ('cython').  Modules defining
+optimized components register each version here (usually via
+topo.misc.inlinec.provide_unoptimized_equivalent), and the registry
+decides which one is used, according to which backends are available
+and to the order of preference in backend_preference.
+
+The backend_preference can be set globally by defining
+kernel_backends (a list of backend names) in the main namespace
+before Topographica is imported, or changed afterwards for individual
+projections using use_backend().  report() shows which backend every
+projection of a simulation is actually using, so that falling back
+to slow Python versions (e.g. because no compiler is available) does
+not go unnoticed.
+
+self_test() checks that each available backend of a kernel computes
+the same results as the Python version, disabling any that do not.
+Because this means building small simulations and compiling the
+kernels, it is not done on import: the results are recorded in the
+kernel cache (see topo.misc.compilecache), keyed by the kernels'
+source, by ./topographica --precompile, or else when a simulation is
+first run, for the kernels its projections use (define
+kernel_self_test=False in the main namespace to skip the latter).
+Recorded failures are applied whenever a kernel is selected.
+
+Because the fastest backend depends on the size of the CFs and
+sheets, the sparsity of the input and the machine, autotune() can
+instead choose the backend for each projection by timing them all;
+the choices are cached on disk (see autotune_cache_file), keyed by
+the projection geometry and the machine type, so that later runs
+only need to time projections of new shapes.
+"""
+
+import copy
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+from collections import OrderedDict
+
+import __main__
+
+import param
+
+
+backend_preference = list(__main__.__dict__.get('kernel_backends',
+                                                ['weave','cython','python']))
+
+# Backend name -> (available, explanation)
+backend_status = OrderedDict([('python',(True,''))])
+
+# (kernel name, backend name) -> explanation, for individual kernels
+# that cannot be used even though their backend is available (e.g.
+# because they have not been compiled)
+kernel_status = OrderedDict()
+
+# Kernel name -> OrderedDict of backend name -> implementation
+_kernels = OrderedDict()
+
+# Implementation -> (kernel name, backend name)
+_implementations = {}
+
+# Whether Simulation.run() calls self_test_used() before first running
+self_test_on_use = __main__.__dict__.get('kernel_self_test',True)
+
+# (kernel name, backend name) pairs already checked by self_test(), or
+# whose recorded result has been applied
+_self_tested = set()
+
+# Kernel name -> list of (namespace, name) bound by bind()
+_bindings = OrderedDict()
+
+
+def set_backend_status(backend, available, message=''):
+    """Record whether the named backend can be used, and if not, why."""
+    backend_status[backend] = (available, message)
+
+
+def set_kernel_status(kernel, backend, available, message=''):
+    """
+    Record whether the named backend of kernel can be used (provided
+    the backend itself is available), and if not, why.
+    """
+    if available:
+        kernel_status.pop((kernel,backend),None)
+    else:
+        kernel_status[(kernel,backend)] = message
+
+
+def register(kernel, backend, implementation):
+    """
+    Register implementation as the named backend of kernel.
+
+    An implementation already registered for some kernel keeps its
+    original registration (as happens e.g. for a Python class that
+    is also the fallback for a second kernel).
+    """
+    _kernels.setdefault(kernel,OrderedDict())[backend] = implementation
+    _implementations.setdefault(implementation,(kernel,backend))
+
+
+def is_available(kernel, backend):
+    return (backend in _kernels.get(kernel,{}) and backend_status.get(backend,(False,))[0]
+            and (kernel,backend) not in kernel_status)
+
+
+def available_backends(kernel):
+    """Return the names of the usable backends of kernel, in order of preference."""
+    backends = [b for b in _kernels.get(kernel,{}) if is_available(kernel,b)]
+    return sorted(backends,key=lambda b: backend_preference.index(b)
+                  if b in backend_preference else len(backend_preference))
+
+
+def select(kernel, backend=None):
+    """
+    Return the implementation of kernel for the given backend, or
+    for the most preferred available backend if none is given (the
+    Python version being used if none of the preferred backends is
+    available).  In the latter case, backends recorded in the kernel
+    cache as having failed self_test() are disabled first.
+    """
+    if backend is None:
+        _apply_recorded_self_tests(kernel)
+        backends = [b for b in available_backends(kernel) if b in backend_preference]
+        backend = backends[0] if backends else 'python'
+        if backend not in _kernels.get(kernel,{}):
+            raise KeyError("No preferred backend available for kernel %s." % kernel)
+    elif not is_available(kernel,backend):
+        raise KeyError("Backend %s is not available for kernel %s: %s"
+                       % (backend,kernel,kernel_status.get((kernel,backend)) or
+                          backend_status.get(backend,(False,'unknown backend'))[1]))
+    return _kernels[kernel][backend]
+
+
+def bind(kernel, namespace, name):
+    """
+    Set name in namespace (e.g. a module's globals()) to the selected
+    implementation of kernel, returning it.  The name is bound again
+    if self_test() later disables the selected backend.
+    """
+    namespace[name] = select(kernel)
+    _bindings.setdefault(kernel,[]).append((namespace,name))
+    return namespace[name]
+
+
+def backend_of(obj):
+    """
+    Return (kernel,backend) for obj (or obj's class), or (None,None)
+    if it is not a registered implementation.
+    """
+    for o in (obj,type(obj)):
+        try:
+            if o in _implementations:
+                return _implementations[o]
+        except TypeError: # unhashable
+            pass
+    return None,None
+
+
+def _projection_fns(projection):
+    """Return a list of (attribute name, index or None, fn) for the projection's kernels."""
+    fns = [(name,None,getattr(projection,name)) for name in ('response_fn','learning_fn')
+           if hasattr(projection,name)]
+    fns += [('weights_output_fns',i,fn) for i,fn in enumerate(getattr(projection,'weights_output_fns',[]))]
+    return fns
+
+
+# Attributes of every Parameterized instance, which are not state to
+# be copied by _convert()
+_parameterized_attributes = set(param.Parameterized().__dict__)
+
+def _convert(fn, implementation, copy_state=False):
+    """
+    Return an instance of implementation with fn's (changeable)
+    parameter values and its other state (e.g. the traces or averages
+    accumulated by learning functions), which is deep copied if
+    copy_state is True so that fn is unaffected by using the new
+    instance.
+    """
+    if not isinstance(fn,param.Parameterized) or not isinstance(implementation,type):
+        return implementation
+    new_params = implementation.params()
+    values = dict([(n,v) for n,v in fn.get_param_values(onlychanged=True)
+                   if n in new_params and n != 'name'
+                   and not new_params[n].readonly and not new_params[n].constant])
+    new_fn = implementation(**values)
+
+    param_attributes = set('_%s_param_value' % n for n in fn.params())
+    for name,value in fn.__dict__.items():
+        if name not in _parameterized_attributes and name not in param_attributes:
+            new_fn.__dict__[name] = copy.deepcopy(value) if copy_state else value
+    return new_fn
+
+
+def _set_fn(projection, name, i, fn):
+    if i is None:
+        setattr(projection,name,fn)
+    else:
+        projection.weights_output_fns[i] = fn
+
+
+def use_backend(projection, backend):
+    """
+    Switch the response, learning and weights output functions of
+    the projection to their implementations in the named backend,
+    where one is available, keeping their parameter values.
+    """
+    for name,i,fn in _projection_fns(projection):
+        kernel,current = backend_of(fn)
+        if kernel is None or current == backend or not is_available(kernel,backend):
+            continue
+        _set_fn(projection,name,i,_convert(fn,_kernels[kernel][backend]))
+
+
+def report(sim=None):
+    """
+    Print, and return as a list of (projection, function, kernel,
+    backend) tuples, the backend used by each function of each
+    projection in the simulation (topo.sim by default).
+    """
+    if sim is None:
+        import topo
+        sim = topo.sim
+
+    rows = []
+    for projection in sorted(sim.connections(),key=lambda p: p.name):
+        for name,i,fn in _projection_fns(projection):
+            kernel,backend = backend_of(fn)
+            label = name if i is None else '%s[%d]' % (name,i)
+            rows.append((projection.name,label,kernel or type(fn).__name__,backend or 'unregistered'))
+
+    for backend,(available,message) in backend_status.items():
+        if not available:
+            print "Backend %s not available: %s" % (backend,message)
+    for (kernel,backend),message in kernel_status.items():
+        print "Backend %s of %s not available: %s" % (backend,kernel,message)
+    for row in rows:
+        print "%-30s %-22s %-34s %s" % row
+    return rows
+
+
+def exercise(kernel, implementation):
+    """
+    Apply implementation of the CF projection response, learning or
+    output function kernel to a small projection with random weights
+    and activity, returning the resulting arrays (or None for other
+    kinds of kernel).  Also used to compile kernels ahead of time.
+    """
+    if not kernel.startswith(('CFPRF','CFPLF','CFPOF')):
+        return None
+
+    import numpy
+
+    # Not disturbing the random numbers of the simulation being run
+    random_state = numpy.random.get_state()
+    numpy.random.seed(1)
+    try:
+        return _exercise(kernel,implementation)
+    finally:
+        numpy.random.set_state(random_state)
+
+
+def _exercise(kernel, implementation):
+    import numpy
+    from topo.base.simulation import Simulation
+    from topo.base.boundingregion import BoundingBox
+    from topo.base.cf import CFSheet,CFProjection,CFIter
+
+    sim = Simulation(register=False)
+    sim['Src'] = CFSheet(nominal_density=10,nominal_bounds=BoundingBox(radius=0.5))
+    sim['Dest'] = CFSheet(nominal_density=10,nominal_bounds=BoundingBox(radius=0.5))
+    p = sim.connect('Src','Dest',connection_type=CFProjection,
+                    nominal_bounds_template=BoundingBox(radius=0.2))
+    for cf,i in CFIter(p,ignore_sheet_mask=True)():
+        cf.weights[:] = numpy.random.rand(*cf.weights.shape)*cf.mask
+    input_activity = numpy.random.rand(*sim['Src'].activity.shape)
+    sim['Dest'].activity[:] = numpy.random.rand(*sim['Dest'].activity.shape)
+    fn = implementation() if isinstance(implementation,type) else implementation
+
+    if kernel.startswith('CFPRF'):
+        fn(CFIter(p),input_activity,p.activity,1.0)
+        return [p.activity.copy()]
+    elif kernel.startswith('CFPLF'):
+        fn(CFIter(p),input_activity,sim['Dest'].activity,0.5)
+    else:
+        fn(CFIter(p))
+    return [cf.weights.copy() for cf,i in CFIter(p)()]
+
+
+def _compare(kernel, reference, candidate, decimal):
+    """
+    Apply reference and candidate to identical small projections,
+    returning False if their results differ.
+    """
+    from numpy.testing import assert_array_almost_equal
+
+    results = [exercise(kernel,impl) for impl in (reference,candidate)]
+    if results[0] is None:
+        return True
+    try:
+        for r,c in zip(*results):
+            assert_array_almost_equal(r,c,decimal)
+    except AssertionError:
+        return False
+    return True
+
+
+def _sources(kernel, backend):
+    """
+    Return the source files of the named backend of kernel and of
+    its Python version, on which the result of self_test() depends,
+    or None if they are not all known.
+    """
+    paths = []
+    for b in (backend,'python'):
+        module = sys.modules.get(getattr(_kernels[kernel][b],'__module__',None))
+        path = getattr(module,'__file__',None)
+        if path is None:
+            return None
+        paths.append(path)
+    return paths
+
+
+def _recorded_self_test(kernel, backend):
+    """
+    Return the result of self_test() recorded in the kernel cache
+    for the current source of the backend of kernel, or None.
+    """
+    from topo.misc import compilecache
+    paths = _sources(kernel,backend)
+    if paths is None:
+        return None
+    try:
+        return compilecache.self_test_result("%s (%s)" % (kernel,backend),paths)
+    except (IOError,OSError):
+        return None
+
+
+def _record_self_test(kernel, backend, agrees):
+    from topo.misc import compilecache
+    paths = _sources(kernel,backend)
+    if paths is None:
+        return
+    try:
+        compilecache.record_self_test("%s (%s)" % (kernel,backend),paths,agrees)
+    except (IOError,OSError), e:
+        param.Parameterized().warning("Unable to record self-test of %s (%s): %s" % (kernel,backend,e))
+
+
+def _disable(kernel, backend):
+    set_kernel_status(kernel,backend,False,'disagrees with the Python version')
+    print "Self-test: %s backend of %s disagrees with the Python version; disabled." % (backend,kernel)
+
+
+def _apply_recorded_self_tests(kernel):
+    """
+    Disable the backends of kernel recorded as having failed
+    self_test(), without running any tests.
+    """
+    for backend in _kernels.get(kernel,{}).keys():
+        if (backend == 'python' or (kernel,backend) in _self_tested
+            or not is_available(kernel,backend)):
+            continue
+        agrees = _recorded_self_test(kernel,backend)
+        if agrees is not None:
+            _self_tested.add((kernel,backend))
+            if not agrees:
+                _disable(kernel,backend)
+
+
+def self_test(decimal=4, kernels=None):
+    """
+    Check that each available non-Python backend of each CF
+    projection response, learning or output function (or of the
+    named kernels only) computes the same result as its Python
+    version on a small projection.  Each backend is only checked
+    once, and the result is recorded in the kernel cache so that it
+    is reused (without running the test) until the source of the
+    backend or of the Python version changes.  Backends that fail are
+    reported and disabled, and names bound to them by bind() are
+    bound to the newly selected implementation.
+
+    Returns a list of the (kernel,backend) pairs that failed.
+    """
+    failures = []
+    for kernel in (_kernels.keys() if kernels is None else kernels):
+        implementations = _kernels.get(kernel,{})
+        if 'python' not in implementations:
+            continue
+        for backend,implementation in implementations.items():
+            if (backend == 'python' or (kernel,backend) in _self_tested
+                or not is_available(kernel,backend)):
+                continue
+            _self_tested.add((kernel,backend))
+            agrees = _recorded_self_test(kernel,backend)
+            if agrees is None:
+                try:
+                    agrees = _compare(kernel,implementations['python'],implementation,decimal)
+                    _record_self_test(kernel,backend,agrees)
+                except Exception, e:
+                    # Not recorded, since the error may be transient
+                    # (e.g. a compiler problem)
+                    param.Parameterized().warning("Self-test of %s (%s) failed: %s" % (kernel,backend,e))
+                    agrees = False
+            if not agrees:
+                failures.append((kernel,backend))
+                _disable(kernel,backend)
+
+    for kernel in set(k for k,b in failures):
+        for namespace,name in _bindings.get(kernel,[]):
+            namespace[name] = select(kernel)
+    return failures
+
+
+def self_test_used(sim=None):
+    """
+    Run self_test() on the kernels used by the projections of the
+    simulation (topo.sim by default), switching any function whose
+    backend fails to the newly selected implementation of its kernel.
+
+    Returns a list of the (kernel,backend) pairs that failed.
+    """
+    if sim is None:
+        import topo
+        sim = topo.sim
+
+    used = []
+    for projection in sim.connections():
+        for name,i,fn in _projection_fns(projection):
+            kernel,backend = backend_of(fn)
+            if kernel is not None and kernel not in used:
+                used.append(kernel)
+    failures = self_test(kernels=used)
+    for projection in sim.connections():
+        for name,i,fn in _projection_fns(projection):
+            kernel,backend = backend_of(fn)
+            if (kernel,backend) in failures:
+                _set_fn(projection,name,i,_convert(fn,select(kernel)))
+    return failures
+
+
+# File in which autotune() records its choices; relative paths are
+# interpreted relative to param.normalize_path.prefix.
+autotune_cache_file = __main__.__dict__.get('kernel_autotune_cache','kernel_autotune.json')
+
+
+def _geometry_key(kernel, projection, input_activity, threads):
+    """
+    Return a string identifying the kernel, the projection shape, the
+    input density (to the nearest 10%), the type of machine and the
+    number of threads.
+    """
+    cf_shape = projection.mask_template.shape
+    density = int(round(10*float((input_activity!=0).sum())/input_activity.size))
+    return "%s src=%dx%d dest=%dx%d cf=%dx%d density=%d0%% %s/%dcpu/%s threads" % (
+        kernel,projection.src.activity.shape[0],projection.src.activity.shape[1],
+        projection.dest.activity.shape[0],projection.dest.activity.shape[1],
+        cf_shape[0],cf_shape[1],density,platform.machine(),
+        multiprocessing.cpu_count(),threads or 'default')
+
+
+def _load_autotune_cache(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError,ValueError), e:
+        param.Parameterized(name='autotune').warning("Ignoring unreadable cache %s: %s" % (path,e))
+        return {}
+
+
+def _save_autotune_cache(path, cache):
+    try:
+        with open(path,'w') as f:
+            json.dump(cache,f,indent=1,sort_keys=True)
+    except IOError, e:
+        param.Parameterized(name='autotune').warning("Unable to save %s: %s" % (path,e))
+
+
+def _time_fn(name, fn, projection, input_activity, output_activity, iterations):
+    """
+    Return the shortest time taken by fn over the given number of
+    calls (after one untimed call, which may include compilation),
+    leaving the projection's weights unchanged.
+    """
+    from topo.base.cf import CFIter
+    import numpy
+
+    cfs = [cf for cf,i in CFIter(projection,ignore_sheet_mask=True)()]
+    saved = [(cf.weights.copy(),cf._norm_total.copy(),cf._has_norm_total.copy()) for cf in cfs]
+    activity = numpy.zeros(projection.activity.shape)
+
+    def call():
+        if name == 'response_fn':
+            fn(CFIter(projection),input_activity,activity,projection.strength)
+        elif name == 'learning_fn':
+            fn(CFIter(projection),input_activity,output_activity,projection.learning_rate)
+        else:
+            fn(CFIter(projection))
+
+    try:
+        call()
+        times = []
+        for n in range(iterations):
+            start = time.time()
+            call()
+            times.append(time.time()-start)
+    finally:
+        for cf,(weights,norm_total,has_norm_total) in zip(cfs,saved):
+            cf.weights[:] = weights
+            cf._norm_total[:] = norm_total
+            cf._has_norm_total[:] = has_norm_total
+    return min(times)
+
+
+def autotune(sim=None, iterations=3, cache_file=None, retune=False):
+    """
+    Switch each function of each CF projection in the simulation
+    (topo.sim by default) to the fastest of its available backends.
+
+    The backends are timed on the projection itself for the given
+    number of iterations (using the current input activity, or random
+    input if there is none yet), unless a choice for the same
+    geometry is already recorded in the cache file and retune is
+    False.  Returns a dictionary of projection name to a list of
+    (function, backend) choices.
+    """
+    import numpy
+    from topo.base.cf import CFProjection
+
+    if sim is None:
+        import topo
+        sim = topo.sim
+    path = param.normalize_path(cache_file or autotune_cache_file)
+    cache = _load_autotune_cache(path)
+    cache_changed = False
+    choices = {}
+
+    for projection in sorted(sim.connections(),key=lambda p: p.name):
+        if not isinstance(projection,CFProjection):
+            continue
+        input_activity = projection.src.activity
+        if not input_activity.any():
+            input_activity = numpy.random.rand(*input_activity.shape)
+        output_activity = numpy.random.rand(*projection.dest.activity.shape)
+
+        for name,i,fn in _projection_fns(projection):
+            kernel,current = backend_of(fn)
+            backends = [b for b in available_backends(kernel) if b in backend_preference]
+            if kernel is None or len(backends) < 2:
+                continue
+            key = _geometry_key(kernel,projection,input_activity,getattr(sim,'threads',None))
+            best = cache.get(key)
+            if retune or best not in backends:
+                # Timed on copies, so that fn's state is unchanged
+                timings = [(_time_fn(name,_convert(fn,_kernels[kernel][b],copy_state=True),
+                                     projection,input_activity,output_activity,iterations),b)
+                           for b in backends]
+                best = min(timings)[1]
+                cache[key] = best
+                cache_changed = True
+                param.Parameterized(name='autotune').message(
+                    "%s.%s: %s" % (projection.name,name,", ".join(["%s %.2gs" % (b,t) for t,b in timings])))
+            if best != current:
+                _set_fn(projection,name,i,_convert(fn,_kernels[kernel][best]))
+            choices.setdefault(projection.name,[]).append((name,best))
+
+    if cache_changed:
+        _save_autotune_cache(path,cache)
+    return choices
@@ -7,7 +7,7 @@ RunBatchCommand allow for more sophisticated measurements and analysis
 to be executed during a simulation run.
 """
 
-import os, sys, types, pickle, inspect
+import os, sys, types, pickle, inspect, multiprocessing
 from collections import namedtuple, OrderedDict
 
 import numpy.version as np_version
@@ -774,6 +774,30 @@ class BatchCollector(PrettyPrinted, param.Parameterized):
 
 
 
+# Files to be read by _load_file in forked worker processes, by the
+# BatchCollator _load_collator, and the path filters (if any) to apply
+# to them before they are returned
+_load_filenames = []
+_load_collator = None
+_load_path_filters = None
+
+
+def _load_file(index):
+    """
+    Read the index'th file in _load_filenames (in a forked worker
+    process), returning the filename and its data, filtered by
+    _load_path_filters if given so that only the selected items are
+    sent back to the parent.
+    """
+    filename = _load_filenames[index]
+    filetype = _load_collator.filetype
+    data = filetype.data(filename)[filetype.data_key]
+    if _load_path_filters is not None:
+        data = _load_collator._filter_attrtree(data, _load_path_filters)
+    return filename, data
+
+
+
 class BatchCollator(NdMapping):
     """
     BatchCollator provides a convenient interface to load the output
@@ -806,6 +830,24 @@ class BatchCollator(NdMapping):
         The Log object contains information about the full batch and may be
         passed optionally to find missing data files.""")
 
+    processes = param.Integer(default=None, allow_None=True, bounds=(1,None), doc="""
+        Number of worker processes used by load() to read and
+        deserialize the data files; one per CPU if None.  Files are
+        read serially if 1, or if os.fork is not available.""")
+
+    parallel_min_files = param.Integer(default=8, bounds=(2,None), doc="""
+        Minimum number of files to be read for load() to use worker
+        processes, which only pay for the cost of starting them and
+        of sending the data back when there are many files to read.""")
+
+    cache_data = param.Boolean(default=False, doc="""
+        Whether load() keeps the contents of each file it has read
+        (shared with any BatchCollators sliced from this one), so that
+        later calls (e.g. with different path_filters) only reread
+        files that have been modified since.  Note that the cache
+        holds the full contents of every file loaded, and that the
+        files must then be sent back unfiltered by worker processes.""")
+
     _deep_indexable = False
 
     def __init__(self, data, filetype=None, filekey='filename', log=None, **params):
@@ -829,6 +871,9 @@ class BatchCollator(NdMapping):
                                             filetype=filetype, filekey=filekey,
                                             **params)
 
+        # Filename -> (modification time and size, data)
+        self._data_cache = {}
+
         if self.log and self.fileinfo:
             if len(self.missing_args()):
                 self.warning("Missing data files. Use .missing_args method "
@@ -922,15 +967,17 @@ class BatchCollator(NdMapping):
 
     def clone(self, items=None, **kwargs):
         settings = dict(self.get_param_values(), **kwargs)
-        return self.__class__(items, **settings)
+        clone = self.__class__(items, **settings)
+        clone._data_cache = self._data_cache
+        return clone
 
 
     def _filter_attrtree(self, attrtree, path_filters):
         """
-        Filters the loaded AttrTree using the supplied path_filters.
+        Filters the loaded AttrTree using the supplied path_filters,
+        returning a new AttrTree (so that the loaded one, which may be
+        cached, is never modified).
         """
-        if not path_filters: return attrtree
-
         # Convert string path filters
         path_filters = [tuple(pf.split('.')) if not isinstance(pf, tuple)
                         else pf for pf in path_filters]
@@ -938,7 +985,8 @@ class BatchCollator(NdMapping):
         # Search for substring matches between paths and path filters
         new_attrtree = AttrTree()
         for path, item in attrtree.path_items.items():
-            if any([all([subpath in path for subpath in pf]) for pf in path_filters]):
+            if not path_filters or any([all([subpath in path for subpath in pf])
+                                        for pf in path_filters]):
                 new_attrtree.set_path(path, item)
 
         return new_attrtree
@@ -960,7 +1008,11 @@ class BatchCollator(NdMapping):
                 for dim, val in dims[::-1]:
                     if dim.capitalize() not in v.dimension_labels:
                         v = v.add_dimension(dim, 0, val)
-                if constant_keys: v.constant_keys = constant_keys
+                if constant_keys:
+                    if v is item[k]:
+                        # Never modify the loaded (possibly cached) Stack
+                        v = v.clone(v.items())
+                    v.constant_keys = constant_keys
                 new_item[k] = v
             else:
                 new_item[k] = self._add_dimensions(v, dims, constant_keys)
@@ -970,28 +1022,96 @@ class BatchCollator(NdMapping):
         return new_item
 
 
+    def _file_signature(self, filename):
+        """
+        Return the modification time and size of the file, or None if
+        it cannot be found.
+        """
+        path = os.path.join(getattr(self.filetype, 'directory', None) or '', filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime, stat.st_size)
+
+
+    def _load_data(self, filenames, path_filters):
+        """
+        Generator yielding (filename, data) for each of the filenames,
+        in the order in which they are read: first those found in the
+        cache, then the others as each worker process finishes reading
+        one.  The data may already have been filtered by path_filters.
+        """
+        global _load_filenames, _load_collator, _load_path_filters
+        signatures = dict((f, self._file_signature(f)) for f in filenames)
+        filenames_to_read = []
+        for filename in filenames:
+            signature, data = self._data_cache.get(filename, (None, None))
+            if signature is not None and signature == signatures[filename]:
+                yield filename, data
+            else:
+                filenames_to_read.append(filename)
+
+        processes = min(self.processes or multiprocessing.cpu_count(),
+                        len(filenames_to_read))
+        if (processes > 1 and len(filenames_to_read) >= self.parallel_min_files
+            and hasattr(os, 'fork')):
+            _load_filenames, _load_collator = filenames_to_read, self
+            _load_path_filters = None if self.cache_data or not path_filters else path_filters
+            pool = multiprocessing.Pool(processes)
+            try:
+                results = pool.imap_unordered(_load_file, range(len(filenames_to_read)))
+                for filename, data in results:
+                    if self.cache_data:
+                        self._data_cache[filename] = (signatures[filename], data)
+                    yield filename, data
+            finally:
+                pool.close()
+                pool.join()
+                _load_filenames, _load_collator, _load_path_filters = [], None, None
+        else:
+            for filename in filenames_to_read:
+                data = self.filetype.data(filename)[self.filetype.data_key]
+                if self.cache_data:
+                    self._data_cache[filename] = (signatures[filename], data)
+                yield filename, data
+
+
     def load(self, path_filters=[], merge=True):
         """
         Load and filter the file contents for the selected parameter
         space.  If merge is set to True all AttrTrees are merged,
         otherwise an NdMapping containing all the AttrTrees is
         returned.
+
+        Many files are read in parallel (see the processes and
+        parallel_min_files parameters), each being filtered as soon as
+        it has been read.  If cache_data is True, files already read
+        by an earlier call are not read again unless they have
+        changed.
         """
         constant_dims = self.constant_dims
-        ndmapping = NdMapping(dimensions=self.dimensions)
+        keys = OrderedDict()
         for key, filename in self.items():
-           file_data = self.filetype.data(filename)
-           attrtree = self._filter_attrtree(file_data[self.filetype.data_key],
-                                            path_filters)
-           if merge:
-              dim_keys = zip(self.dimension_labels, key)
-              varying_keys = [(d, k) for d, k in dim_keys
-                              if d not in constant_dims]
-              constant_keys = [(d, k) for d, k in dim_keys
-                               if d in constant_dims]
-              attrtree = self._add_dimensions(attrtree, varying_keys,
-                                              dict(constant_keys))
-           ndmapping[key] = attrtree
+           keys.setdefault(filename, []).append(key)
+
+        attrtrees = {}
+        for filename, file_data in self._load_data(keys.keys(), path_filters):
+           for key in keys[filename]:
+              attrtree = self._filter_attrtree(file_data, path_filters)
+              if merge:
+                 dim_keys = zip(self.dimension_labels, key)
+                 varying_keys = [(d, k) for d, k in dim_keys
+                                 if d not in constant_dims]
+                 constant_keys = [(d, k) for d, k in dim_keys
+                                  if d in constant_dims]
+                 attrtree = self._add_dimensions(attrtree, varying_keys,
+                                                 dict(constant_keys))
+              attrtrees[key] = attrtree
+
+        ndmapping = NdMapping(dimensions=self.dimensions)
+        for key in self.keys():
+           ndmapping[key] = attrtrees[key]
         if merge:
            return AttrTree.merge(ndmapping.values())
         return ndmapping
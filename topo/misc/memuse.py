@@ -15,6 +15,8 @@ Examples::
 
   ./topographica -a -c 'from topo.misc import memuse, asizeof' -c 'memuse.memuse_batch("examples/tiny.ty",cortex_density=20)'
 
+  ./topographica -c 'from topo.misc import memuse' examples/tiny.ty -c 'print memuse.memory_totals()'
+
   ./topographica -a -c 'from topo.misc import memuse, asizeof' -c 'memuse.memuse_batch("examples/tiny.ty",times=[0,100],analysis_fn=memuse.plotting_and_saving_analysis_fn,cortex_density=20)'
 """
 
@@ -27,6 +29,7 @@ Examples::
 # shown above.
 
 import subprocess
+import sys
 
 
 def cmd_to_string(cmd):
@@ -57,6 +60,140 @@ def simsize():
 
 
 
+def rss():
+    """
+    Return the resident set size of this process in bytes, read from
+    /proc (without running any external command).  Where /proc is
+    not available, returns the peak resident set size instead.
+    """
+    import resource
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1])*resource.getpagesize()
+    except (IOError,IndexError,ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on OS X, but kilobytes elsewhere
+        return peak if sys.platform=='darwin' else peak*1024
+
+
+
+###############################################################################
+# Accounting for the memory taken by the objects in a simulation
+#
+# Each EventProcessor and Projection has a memory_usage() method
+# returning the bytes it takes by category (e.g. 'activity',
+# 'weights', 'state', 'python'); the functions below help implement
+# and collate these.  Unlike simsize() and n_bytes(), memory_usage()
+# takes time independent of the number of units (after the first
+# call for each CFProjection), so it can be used during a run.
+
+def object_bytes(obj):
+    """
+    Return the bytes taken by the given Python object itself and its
+    instance dictionary (if any), but not the objects it refers to.
+    """
+    n = sys.getsizeof(obj)
+    if hasattr(obj,'__dict__'):
+        n += sys.getsizeof(obj.__dict__)
+    return n
+
+
+def _owner(array):
+    """Return the array that owns the memory of the given array (or view)."""
+    while hasattr(getattr(array,'base',None),'nbytes'):
+        array = array.base
+    return array
+
+
+def unique_nbytes(arrays, exclude=()):
+    """
+    Return the total nbytes of the given arrays, counting the memory
+    of each only once and skipping None and any array in exclude (so
+    that e.g. arrays shared between CFs, or saved on a state stack
+    while still in use, are not counted twice).  Views are counted as
+    the whole of the array they are a view of.
+    """
+    seen = set(id(_owner(a)) for a in exclude)
+    total = 0
+    for a in arrays:
+        if a is None:
+            continue
+        owner = _owner(a)
+        if id(owner) not in seen:
+            seen.add(id(owner))
+            total += owner.nbytes
+    return total
+
+
+def add_usage(usage, other):
+    """Add the bytes in the dictionary other to those in usage, by category."""
+    for category,n in other.items():
+        usage[category] = usage.get(category,0)+n
+    return usage
+
+
+def memory_usage(sim=None):
+    """
+    Return the memory taken by each EventProcessor in the simulation
+    (topo.sim by default), and by each of its incoming Projections.
+
+    The result is an OrderedDict mapping each EventProcessor's name
+    to a dictionary with keys 'usage', an OrderedDict of bytes by
+    category (as returned by the EventProcessor's memory_usage()),
+    and 'projections', mapping the name of each incoming Projection
+    to its own OrderedDict of bytes by category.
+    """
+    from collections import OrderedDict
+    import topo
+    sim = sim or topo.sim
+
+    results = OrderedDict()
+    for name,ep in sorted(sim.objects().items()):
+        projections = OrderedDict([(conn.name,conn.memory_usage()) for conn in ep.in_connections
+                                   if hasattr(conn,'memory_usage')])
+        results[name] = dict(usage=ep.memory_usage(),projections=projections)
+    return results
+
+
+def memory_totals(usage=None):
+    """
+    Return the total bytes in each category across all the
+    EventProcessors and Projections in usage (as returned by
+    memory_usage(); by default, that of topo.sim), plus the
+    process's 'rss' and the accounted 'total'.
+    """
+    from collections import OrderedDict
+    usage = usage if usage is not None else memory_usage()
+    totals = OrderedDict()
+    for ep in usage.values():
+        add_usage(totals,ep['usage'])
+        for proj in ep['projections'].values():
+            add_usage(totals,proj)
+    totals['total'] = sum(totals.values())
+    totals['rss'] = rss()
+    return totals
+
+
+def log_memory(filename):
+    """
+    Append a line to filename with the simulation time, the total
+    bytes in each category, and the bytes of each EventProcessor and
+    Projection, in JSON format.  Suitable for calling periodically
+    during a run (see run_batch's memory_log_interval).
+    """
+    import json
+    import topo
+    usage = memory_usage()
+    record = dict(time=float(topo.sim.time()),totals=memory_totals(usage),
+                  objects=dict((name,dict(total=sum(ep['usage'].values()),
+                                          projections=dict((pname,sum(proj.values()))
+                                                           for pname,proj in ep['projections'].items())))
+                               for name,ep in usage.items()))
+    with open(filename,'a') as f:
+        f.write(json.dumps(record)+"\n")
+
+
+
 ###############################################################################
 # String-formatted versions of the above
 
@@ -77,6 +214,14 @@ def wtsize_mb():
     from topo.command import n_bytes
     return "wtsize:%s" % (mb(n_bytes()))
 
+def rss_mb():
+    """String-formatted version of the resident set size of this process, from /proc."""
+    return "rss:%s" % (mb(rss()))
+
+def accounted_mb():
+    """String-formatted version of the total memory reported by memory_usage()."""
+    return "accounted:%s" % (mb(memory_totals()['total']))
+
 def allsizes_mb():
     """
     Collates results from topsize, simsize, and wtsize.
@@ -0,0 +1,109 @@
+"""
+Low-overhead timing of the components of a simulation.
+
+Unlike topo.misc.util.profile, which uses cProfile to time every
+Python function call, ComponentProfiler only records the time taken
+by the main operations of the simulation's components: each
+EventProcessor's process_current_time(), each projection's
+activate(), learn() and apply_learn_output_fns(), and each sheet
+output function.  It is enabled by setting the Simulation's
+profile_components parameter to True, and the results are available
+from Simulation.profile_report().
+
+Times are inclusive: e.g. a sheet's process_current_time() includes
+the time taken by its projections' learn().
+"""
+
+import json
+import math
+from collections import OrderedDict
+from timeit import default_timer as timer
+
+
+def _component_name(name):
+    return ".".join(name) if isinstance(name,tuple) else name
+
+
+class ComponentProfiler(object):
+    """
+    Accumulates the number of calls, total time and estimated bytes
+    touched for each (component, operation) pair, along with a time
+    series of the time spent by each pair in each interval of
+    simulation time.
+    """
+
+    def __init__(self, interval=1.0):
+        # (component name, operation) -> [calls, seconds, bytes per call]
+        self.stats = OrderedDict()
+        # interval index -> {(component name, operation): seconds}
+        self.timeseries = OrderedDict()
+        self.interval = interval
+        self._current = self.timeseries.setdefault(0,{})
+
+
+    def set_time(self, time):
+        """Record subsequent timings as belonging to the given simulation time."""
+        index = int(math.floor(float(time)/self.interval))
+        self._current = self.timeseries.setdefault(index,{})
+
+
+    def timed(self, key, nbytes, fn, *args):
+        """
+        Call fn(*args), recording the time taken under key.
+
+        nbytes is a callable returning an estimate of the bytes
+        touched by each call; it is called only once for each key.
+        """
+        start = timer()
+        result = fn(*args)
+        elapsed = timer()-start
+
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = [0,0.0,nbytes()]
+        stats[0] += 1
+        stats[1] += elapsed
+        self._current[key] = self._current.get(key,0.0) + elapsed
+        return result
+
+
+    def rows(self):
+        """
+        Return a list of (component, operation, calls, total seconds,
+        mean seconds, bytes per call), most time-consuming first.
+        """
+        rows = [(_component_name(name),operation,calls,total,total/calls,nbytes)
+                for (name,operation),(calls,total,nbytes) in self.stats.items()]
+        return sorted(rows,key=lambda row: -row[3])
+
+
+    def report(self):
+        """Print a table of the accumulated statistics, returning its rows."""
+        rows = self.rows()
+        print "%-40s %-24s %8s %10s %10s %12s" % \
+              ("Component","Operation","Calls","Total (s)","Mean (ms)","Bytes/call")
+        for name,operation,calls,total,mean,nbytes in rows:
+            print "%-40s %-24s %8d %10.3f %10.3f %12d" % \
+                  (name,operation,calls,total,1000*mean,nbytes)
+        return rows
+
+
+    def series(self):
+        """
+        Return the time series as a list of (simulation time, {'component
+        operation': seconds}) tuples, one for each interval in which
+        anything was timed.
+        """
+        return [(index*self.interval,
+                 dict([("%s %s" % (_component_name(name),operation),seconds)
+                       for (name,operation),seconds in times.items()]))
+                for index,times in self.timeseries.items() if times]
+
+
+    def save(self, path):
+        """Save the statistics and time series to path in JSON format."""
+        with open(path,'w') as f:
+            json.dump({'interval':self.interval,
+                       'stats':[dict(zip(('component','operation','calls','total','mean','bytes'),row))
+                                for row in self.rows()],
+                       'timeseries':self.series()},f,indent=1)
@@ -14,16 +14,25 @@ Support for optional Cython .pyx files.
 import __main__
 import_pyx = __main__.__dict__.get('import_pyx',False)
 
+from topo.misc import kernels, compilecache
+
 pyximported = False
 
 if import_pyx:
     try:
         import pyximport
-        pyximport.install()
+        # Build into the shared kernel cache
+        pyximport.install(build_dir=compilecache.pyximport_build_dir())
         pyximported = True
     except:
         pass
 
+if pyximported:
+    kernels.set_backend_status('cython',True)
+elif 'cython' not in kernels.backend_status:
+    kernels.set_backend_status('cython',False,'pyximport not available' if import_pyx
+                               else 'import_pyx is False')
+
 
 # JABALERT: As for the version in inlinec, I can't see any reason why
 # this function accepts names rather than the more pythonic option of
@@ -31,11 +40,16 @@ if import_pyx:
 def provide_unoptimized_equivalent_cy(optimized_name, unoptimized_name, local_dict):
     """
     Replace the optimized Cython component with its unoptimized
-    equivalent if pyximport is not available.
+    equivalent if pyximport is not available (or the component has
+    not been built; see topo.misc.compilecache).
 
     If import_pyx is True, warns about the unavailable component.
+    The Cython component is registered with topo.misc.kernels as the
+    'cython' backend of the kernel unoptimized_name.
     """
-    if not pyximported:
+    if pyximported and optimized_name in local_dict:
+        kernels.register(unoptimized_name,'cython',local_dict[optimized_name])
+    else:
         local_dict[optimized_name] = local_dict[unoptimized_name]
         if import_pyx:
             print '%s: Cython components not available; using %s instead of %s.' \
@@ -9,9 +9,12 @@ aligned axes.
 """
 
 import os
+import re
 import bisect
-from itertools import izip
+import tempfile
+import multiprocessing
 
+import numpy
 from numpy import asarray
 import ImageDraw
 
@@ -35,7 +38,9 @@ class DataRecorder(EventProcessor):
     DataRecorder is an abstract class for which different
     implementations may exist for different means of storing recorded
     data.  For example, the subclass InMemoryRecorder stores all the
-    data in memory.
+    data in memory, DiskRecorder stores matrix-valued data in
+    memory-mapped files, and RingBufferRecorder keeps only the most
+    recent frames in a fixed amount of memory.
 
     A DataRecorder instance can operate either as an event processor, or in a
     stand-alone mode.  Both usage modes can be used on the same
@@ -123,6 +128,14 @@ class DataRecorder(EventProcessor):
         raise NotImplementedError
 
 
+    def _times(self,varname):
+        """
+        Return a sequence of the timestamps for the given variable,
+        in order, for searching; by default, get_times(varname).
+        """
+        return self.get_times(varname)
+
+
     def get_time_indices(self,varname,start_time,end_time):
         """
         For the named variable, get the start and end indices suitable
@@ -134,7 +147,7 @@ class DataRecorder(EventProcessor):
         earliest or latest available time, respectively.
         """
 
-        times = self.get_times(varname)
+        times = self._times(varname)
         if start_time is None:
             start = 0
         else:
@@ -162,14 +175,23 @@ class InMemoryRecorder(DataRecorder):
     def __init__(self,**params):
         super(InMemoryRecorder,self).__init__(**params)
         self._vars = {}
+        self._recorded_bytes = 0
 
 
     def add_variable(self,name):
         self._vars[name] = Struct(time=[],data=[])
 
 
+    def memory_usage(self):
+        usage = super(InMemoryRecorder,self).memory_usage()
+        usage['recorder'] = getattr(self,'_recorded_bytes',0)
+        return usage
+
+
     def record_data(self,varname,time,data):
         var = self._vars[varname]
+        # Not set on recorders restored from older snapshots
+        self._recorded_bytes = getattr(self,'_recorded_bytes',0) + getattr(data,'nbytes',0)
 
         # add the data, maintaining it sorted by time
         if not var.time or var.time[-1] <= time:
@@ -221,6 +243,323 @@ class InMemoryRecorder(DataRecorder):
 
 
 
+class DiskRecorder(DataRecorder):
+    """
+    A data recorder that stores matrix-valued data on disk.
+
+    All data items recorded for a given variable must be arrays of
+    the same shape and type (e.g. the activity of one sheet).  They
+    are written into preallocated chunks of chunk_size frames, each
+    of which is a memory-mapped .npy file in the given directory, so
+    that memory use does not grow with the length of the recording.
+    Only the timestamps are kept in memory: get_datum() and get_data()
+    locate frames by binary search on the times, and return views
+    that read only the requested frames from disk.
+    """
+
+    directory = param.String(default=None,doc="""
+        Directory in which to store the chunk files.  If None, a new
+        temporary directory is created.  The files are not deleted
+        when the recorder is, so that they can be reloaded, e.g. from
+        a saved snapshot.  A recorder restored from a snapshot never
+        modifies the saved files: they are reopened read-only, and
+        any frames recorded after restoring (including the rest of a
+        partly filled chunk) are written to a new temporary
+        directory.""")
+
+    chunk_size = param.Integer(default=256,bounds=(1,None),doc="""
+        Number of frames to preallocate in each chunk file.""")
+
+
+    def __init__(self,**params):
+        super(DiskRecorder,self).__init__(**params)
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix='topo_recorder_')
+        elif not os.access(self.directory,os.F_OK):
+            os.makedirs(self.directory)
+        self._vars = {}
+
+
+    def add_variable(self,name):
+        fileroot = '%s_%d'%(re.sub(r'[^\w.-]','_',name),len(self._vars))
+        self._vars[name] = Struct(time=[],slot=[],chunks=[],n_frames=0,
+                                  shape=None,dtype=None,fileroot=fileroot)
+
+
+    def _new_chunk(self,var,index):
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix='topo_recorder_')
+        filename = os.path.join(self.directory,'%s_%05d.npy'%(var.fileroot,index))
+        return numpy.lib.format.open_memmap(filename,mode='w+',dtype=var.dtype,
+                                            shape=(self.chunk_size,)+var.shape)
+
+
+    def _frame(self,var,slot):
+        chunk,offset = divmod(slot,self.chunk_size)
+        return var.chunks[chunk][offset]
+
+
+    def record_data(self,varname,time,data):
+        var = self._vars[varname]
+        data = asarray(data)
+
+        if var.shape is None:
+            var.shape,var.dtype = data.shape,data.dtype
+        elif data.shape != var.shape:
+            raise ValueError("Data recorded for variable '%s' must have shape %s, not %s."
+                             %(varname,var.shape,data.shape))
+
+        chunk,offset = divmod(var.n_frames,self.chunk_size)
+        if chunk == len(var.chunks):
+            if var.chunks:
+                var.chunks[-1].flush()
+            var.chunks.append(self._new_chunk(var,chunk))
+        elif not var.chunks[chunk].flags.writeable:
+            # A chunk saved in a snapshot: continue in a copy
+            copy = self._new_chunk(var,chunk)
+            copy[:] = var.chunks[chunk]
+            var.chunks[chunk] = copy
+        var.chunks[chunk][offset] = data
+        slot = var.n_frames
+        var.n_frames += 1
+
+        # Frames are stored in the order they arrive; the time and
+        # slot lists are kept sorted by time.
+        if not var.time or var.time[-1] <= time:
+            var.time.append(time)
+            var.slot.append(slot)
+        else:
+            idx = bisect.bisect_right(var.time,time)
+            var.time.insert(idx,time)
+            var.slot.insert(idx,slot)
+
+
+    def get_datum(self,name,time):
+        idx,dummy = self.get_time_indices(name,time,time)
+        var = self._vars[name]
+        if idx >= len(var.slot):
+            idx -= 1
+        return self._frame(var,var.slot[idx])
+
+
+    def get_data(self,name,times=(None,None),fill_range=False):
+        tstart,tend = times
+        start,end = self.get_time_indices(name,tstart,tend)
+        var = self._vars[name]
+
+        if start >= len(var.slot):
+            # if the start index is out of bounds
+            if fill_range:
+                time = times
+                data = [self._frame(var,var.slot[-1])]*2
+            else:
+                time,data = [],[]
+        else:
+            time = var.time[start:end]
+            data = [self._frame(var,slot) for slot in var.slot[start:end]]
+            if fill_range:
+                if time[0] > tstart and start > 0:
+                    time.insert(0,tstart)
+                    data.insert(0,self._frame(var,var.slot[start-1]))
+                if time[-1] < tend:
+                    time.append(tend)
+                    data.append(data[-1])
+
+        return time,data
+
+
+    def get_times(self,varname):
+        return self._vars[varname].time
+
+
+    def flush(self):
+        """Write any buffered frames to disk."""
+        for var in self._vars.values():
+            for chunk in var.chunks:
+                chunk.flush()
+
+
+    def __getstate__(self):
+        """
+        Store the chunk filenames rather than the recorded data.
+        """
+        self.flush()
+        state = super(DiskRecorder,self).__getstate__()
+        state['_vars'] = dict((name,Struct(**dict(var.__dict__,chunks=[c.filename for c in var.chunks])))
+                              for name,var in self._vars.items())
+        return state
+
+
+    def __setstate__(self,state):
+        """
+        Reopen the chunk files saved by __getstate__, read-only, so
+        that neither this recorder nor any other restored from the
+        same snapshot can overwrite them.  New frames are written to
+        a new directory.
+        """
+        for var in state['_vars'].values():
+            var.chunks = [numpy.load(filename,mmap_mode='r') for filename in var.chunks]
+        super(DiskRecorder,self).__setstate__(state)
+        self.directory = None
+
+
+
+
+class RingBufferRecorder(DataRecorder):
+    """
+    A data recorder that keeps only the most recent frames of each
+    variable, in a fixed amount of memory.
+
+    All data items recorded for a given variable must be arrays of
+    the same shape.  On the first record, a single (capacity x rows x
+    cols) array is allocated for the variable; subsequent frames are
+    copied into it in place, overwriting the oldest frame once the
+    buffer is full, so that recording never allocates memory per
+    frame.  Frames must be recorded in order of increasing time, as
+    they are when the recorder is connected to a simulation.
+
+    get_datum() and get_data() return views into the buffer, which
+    will be overwritten by later recordings; copy them if they need to
+    be kept.
+    """
+
+    capacity = param.Integer(default=100,bounds=(1,None),doc="""
+        Maximum number of frames to keep for each variable.""")
+
+    record_every = param.Integer(default=1,bounds=(1,None),doc="""
+        Record only every record_every'th data item for each
+        variable, discarding the rest.""")
+
+    downsample = param.Integer(default=1,bounds=(1,None),doc="""
+        Factor by which to subsample each dimension of the data
+        before storing it, e.g. 2 to store every second row and
+        column of a sheet's activity.""")
+
+
+    def __init__(self,**params):
+        super(RingBufferRecorder,self).__init__(**params)
+        self._vars = {}
+
+
+    def add_variable(self,name):
+        self._vars[name] = Struct(time=[None]*self.capacity,data=None,
+                                  count=0,next=0,n_events=0)
+
+
+    def memory_usage(self):
+        usage = super(RingBufferRecorder,self).memory_usage()
+        usage['recorder'] = sum(var.data.nbytes for var in self._vars.values()
+                                if var.data is not None)
+        return usage
+
+
+    def record_data(self,varname,time,data):
+        var = self._vars[varname]
+
+        var.n_events += 1
+        if (var.n_events-1) % self.record_every:
+            return
+
+        if var.count and time < var.time[(var.next-1) % self.capacity]:
+            raise ValueError("%s can only record data in order of increasing time."
+                             % self.__class__.__name__)
+
+        data = asarray(data)
+        if self.downsample > 1:
+            data = data[(slice(None,None,self.downsample),)*data.ndim]
+
+        if var.data is None:
+            var.data = numpy.empty((self.capacity,)+data.shape,dtype=data.dtype)
+        elif data.shape != var.data.shape[1:]:
+            raise ValueError("Data recorded for variable '%s' must have shape %s, not %s."
+                             %(varname,var.data.shape[1:],data.shape))
+
+        var.data[var.next] = data
+        var.time[var.next] = time
+        var.next = (var.next+1) % self.capacity
+        var.count = min(var.count+1,self.capacity)
+
+
+    def _slot(self,var,idx):
+        """Return the buffer position of the idx'th oldest stored frame."""
+        return (var.next-var.count+idx) % self.capacity
+
+
+    def get_datum(self,name,time):
+        idx,dummy = self.get_time_indices(name,time,time)
+        var = self._vars[name]
+        if idx >= var.count:
+            idx -= 1
+        return var.data[self._slot(var,idx)]
+
+
+    def get_data(self,name,times=(None,None),fill_range=False):
+        tstart,tend = times
+        start,end = self.get_time_indices(name,tstart,tend)
+        var = self._vars[name]
+        all_times = self._times(name)
+
+        if start >= var.count:
+            # if the start index is out of bounds
+            if fill_range:
+                time = times
+                data = [var.data[self._slot(var,var.count-1)]]*2
+            else:
+                time,data = [],[]
+        else:
+            if end is None:
+                end = var.count
+            time = all_times[start:end]
+            data = [var.data[self._slot(var,i)] for i in range(start,end)]
+            if fill_range:
+                if time[0] > tstart and start > 0:
+                    time.insert(0,tstart)
+                    data.insert(0,var.data[self._slot(var,start-1)])
+                if time[-1] < tend:
+                    time.append(tend)
+                    data.append(data[-1])
+
+        return time,data
+
+
+    def _times(self,varname):
+        return _RingTimes(self._vars[varname],self.capacity)
+
+
+    def get_times(self,varname):
+        return list(self._times(varname))
+
+
+
+class _RingTimes(object):
+    """
+    Read-only sequence of the times stored for a RingBufferRecorder
+    variable, oldest first, indexing into the ring rather than
+    copying it.
+    """
+
+    def __init__(self,var,capacity):
+        self._var = var
+        self._capacity = capacity
+
+
+    def __len__(self):
+        return self._var.count
+
+
+    def __getitem__(self,idx):
+        if isinstance(idx,slice):
+            return [self[i] for i in xrange(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("time index out of range")
+        var = self._var
+        return var.time[(var.next-var.count+idx) % self._capacity]
+
+
+
+
 class Trace(param.Parameterized):
     """
     A specification for generating 1D traces of data from recorded
@@ -438,6 +777,10 @@ class ActivityMovie(param.Parameterized):
     to sequentially-named files that can be composited into a movie by
     external software.
 
+    Frames are rendered only when needed: the frames attribute is a
+    generator over frame_times, and save() renders each frame just
+    before writing it, optionally on several worker processes.
+
     Parameters are available to control the layout of the montage,
     adding timecodes to the frames, and the names of the frame files.
     """
@@ -504,24 +847,34 @@ class ActivityMovie(param.Parameterized):
     timecode_offset = param.Number(default=0,doc="""
         A value to be added to each timecode before formatting for display.""")
 
+    processes = param.Integer(default=1,bounds=(0,None),doc="""
+        Number of worker processes used by save() to render and write
+        frames concurrently; 0 means one per available CPU.  Worker
+        processes are forked, so on platforms without os.fork the
+        frames are always saved serially.""")
 
-    def __init__(self,**params):
-        super(ActivityMovie,self).__init__(**params)
 
-        bitmaps = [get_images(var,self.frame_times,self.recorder,
-                              overlays=self.overlays.get(var,(0,0,0)))
+    def render_frame(self,t):
+        """Return a MontageBitmap showing each variable at time t."""
+        bitmaps = [get_images(var,[t],self.recorder,
+                              overlays=self.overlays.get(var,(0,0,0)))[0]
                    for var in self.variables]
 
-        self.frames = [MontageBitmap(bitmaps=list(bms),**self.montage_params)
-                       for bms in izip(*bitmaps)]
+        f = MontageBitmap(bitmaps=bitmaps,**self.montage_params)
         if self.add_timecode:
-            for t,f in izip(self.frame_times,self.frames):
-                draw = ImageDraw.Draw(f.image)
-                timecode = self.timecode_fmt % (t+self.timecode_offset)
-                tw,th = draw.textsize(timecode,font=self.timecode_options.setdefault('font',TITLE_FONT))
-                w,h = f.image.size
+            draw = ImageDraw.Draw(f.image)
+            timecode = self.timecode_fmt % (t+self.timecode_offset)
+            tw,th = draw.textsize(timecode,font=self.timecode_options.setdefault('font',TITLE_FONT))
+            w,h = f.image.size
+
+            draw.text((w-tw-f.margin-1,h-th-1),timecode,**self.timecode_options)
+        return f
 
-                draw.text((w-tw-f.margin-1,h-th-1),timecode,**self.timecode_options)
+
+    @property
+    def frames(self):
+        """A generator rendering the MontageBitmap for each frame time in turn."""
+        return (self.render_frame(t) for t in self.frame_times)
 
 
     def save(self):
@@ -536,8 +889,37 @@ class ActivityMovie(param.Parameterized):
         if not os.access(dirname,os.F_OK):
             os.makedirs(dirname)
 
-        self.verbose('Writing',len(self.frames),'to files like "%s"'%filename_pat)
-        for t,f in zip(self.frame_times,self.frames):
-            filename = filename_pat% t
-            self.debug("Writing frame",repr(filename))
-            f.image.save(filename)
+        frame_files = [(t,filename_pat % t) for t in self.frame_times]
+        processes = self.processes or multiprocessing.cpu_count()
+        self.verbose('Writing',len(frame_files),'to files like "%s"'%filename_pat)
+
+        if processes > 1 and hasattr(os,'fork'):
+            # The forked workers inherit this movie (and its recorder)
+            # through a module global, so nothing large is pickled.
+            global _movie_being_saved
+            _movie_being_saved = self
+            pool = multiprocessing.Pool(processes)
+            try:
+                for filename in pool.imap_unordered(_save_frame,frame_files,chunksize=4):
+                    self.debug("Wrote frame",repr(filename))
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+                _movie_being_saved = None
+        else:
+            for t,filename in frame_files:
+                self.debug("Writing frame",repr(filename))
+                self.render_frame(t).image.save(filename)
+
+
+
+_movie_being_saved = None
+
+def _save_frame(frame_file):
+    """Render and save a single frame of _movie_being_saved (in a worker process)."""
+    t,filename = frame_file
+    _movie_being_saved.render_frame(t).image.save(filename)
+    return filename
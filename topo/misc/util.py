@@ -436,6 +436,90 @@ class gmpyImporter(ModuleImporter):
         return None
 
 
+############################################################
+# Deferred imports, so that optional subsystems (e.g. plotting,
+# analysis, IPython) are only imported when first used rather than
+# at startup.
+import types, importlib
+
+class LazyModule(types.ModuleType):
+    """
+    Placeholder for a module that has not been imported yet.
+
+    The named module is imported on first attribute access, and the
+    attribute is then looked up on the real module.  Importing the
+    real module normally replaces the placeholder in its parent
+    package, so later accesses do not go through the placeholder.
+    """
+    def __getattr__(self,attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        return getattr(importlib.import_module(self.__name__),attr)
+
+
+class PostImportHook(ModuleImporter):
+    """
+    Import hook running callbacks when a module is first imported,
+    and allowing a module to be registered under an alias name
+    (e.g. topo.pattern.random for imagen.random) without importing
+    it until either name is imported.
+    """
+    def __init__(self):
+        self.aliases = {}    # alias name -> real module name
+        self.callbacks = {}  # real module name -> [callbacks]
+        self._loading = set()
+
+    def find_module(self,fullname,path=None):
+        if fullname in self._loading:
+            return None
+        if fullname in self.aliases or fullname in self.callbacks:
+            return self
+        return None
+
+    def load_module(self,fullname):
+        if fullname in sys.modules:
+            return sys.modules[fullname]
+        name = self.aliases.get(fullname,fullname)
+        # Let the normal import machinery find the module itself
+        self._loading.add(fullname)
+        try:
+            module = importlib.import_module(name)
+        finally:
+            self._loading.discard(fullname)
+        for alias,real in self.aliases.items():
+            if real==name:
+                sys.modules[alias] = module
+        for callback in self.callbacks.pop(name,[]):
+            callback(module)
+        return module
+
+_post_import_hook = PostImportHook()
+sys.meta_path.append(_post_import_hook)
+
+
+def after_import(name,callback):
+    """
+    Call callback(module) once the named module has been imported:
+    immediately if it has been imported already, and otherwise
+    whenever it is first imported.
+    """
+    if name in sys.modules:
+        callback(sys.modules[name])
+    else:
+        _post_import_hook.callbacks.setdefault(name,[]).append(callback)
+
+
+def alias_module(alias,name):
+    """
+    Make the module name importable as alias too, without importing
+    it until one of the two names is first imported.
+    """
+    if name in sys.modules:
+        sys.modules[alias] = sys.modules[name]
+    else:
+        _post_import_hook.aliases[alias] = name
+
+
 def unit_value(str):
     m = re.match(r'([^\d]*)(\d*\.?\d+)([^\d]*)', str)
     if m:
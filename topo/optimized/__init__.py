@@ -1,17 +1,41 @@
 import os
 
+from topo.misc import kernels
+
 (basepath, _) = os.path.split(os.path.abspath(__file__))
 
 warn_for_each_unoptimized_component = False
 
-try:
-    from distutils.core import run_setup
-
-    # Run the setup script in the sandbox, so that it doesn't complain about unknown args when launched through nose
-    run_setup(basepath + "/compile.py")
+from topo.misc import compilecache
 
-    from optimized import * # pyflakes:ignore (API import)
-except ImportError:
+# The extension is built ahead of time into the kernel cache (see
+# topo.misc.compilecache), rather than each time it is imported.
+try:
+    build_dir = compilecache.extension_dir(__name__+'.optimized',basepath + "/compile.py",
+                                           [basepath + "/optimized.pyx",basepath + "/optimized.h"])
+except Exception:
+    # compile.py raises SkipTest if Cython is missing
     print "WARNING: Install distutils and Cython to build optimized component, " \
           "falling back to unoptimized components."
-    from unoptimized import * # pyflakes:ignore (API import)
\ No newline at end of file
+    build_dir = None
+
+if build_dir is not None:
+    __path__.insert(0,build_dir)
+    try:
+        from optimized import * # pyflakes:ignore (API import)
+    except ImportError, e:
+        print "WARNING: Unable to import optimized component (%s), " \
+              "falling back to unoptimized components." % e
+        build_dir = None
+
+if build_dir is not None:
+    for _kernel,_cython in [('CFPRF_DotProduct',CFPRF_DotProduct_cython),
+                            ('CFPRF_EuclideanDistance',CFPRF_EuclideanDistance_cython),
+                            ('CFPLF_Hebbian',CFPLF_Hebbian_cython),
+                            ('CFPLF_BCMFixed',CFPLF_BCMFixed_cython),
+                            ('CFPLF_Trace',CFPLF_Trace_cython),
+                            ('CFPOF_DivisiveNormalizeL1',CFPOF_DivisiveNormalize_L1_cython)]:
+        kernels.register(_kernel,'cython',_cython)
+    kernels.set_backend_status('cython',True)
+else:
+    from unoptimized import * # pyflakes:ignore (API import)
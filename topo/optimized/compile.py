@@ -1,4 +1,5 @@
 import os
+import sys
 import numpy
 
 (basepath, _) = os.path.split(os.path.abspath(__file__))
@@ -22,7 +23,9 @@ ext_module = Extension(
     include_dirs=[numpy.get_include()]
 )
 
-setup_args = ['--quiet', 'build_ext', '--build-lib', basepath]
+# Arguments may be supplied when run by distutils.core.run_setup
+# (e.g. to build into the kernel cache; see topo.misc.compilecache)
+setup_args = sys.argv[1:] or ['--quiet', 'build_ext', '--build-lib', basepath]
 setup(
     name = 'Cython Optimized Functions',
     cmdclass = {'build_ext': build_ext},
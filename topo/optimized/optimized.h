@@ -53,6 +53,12 @@
    if(attr ## _array != 0) { \
        Py_DECREF(attr ## _array); }
 
+/* For a list of CFs cfs, declares cfs_items, the array of (borrowed)
+   pointers to its items, so that the CFs can be accessed in
+   OpenMP-parallel loops without calling the Python API. */
+#define DECLARE_CF_ITEMS(cfs) \
+  PyObject **cfs ## _items = PySequence_Fast_ITEMS(cfs)
+
 #define UNPACK_FOUR_TUPLE(type,i1,i2,i3,i4,tuple) \
   type i1 = *tuple++; \
   type i2 = *tuple++; \
@@ -84,6 +90,8 @@ void dot_product(double mask[], double X[], double strength, int icols,
     DECLARE_SLOT_OFFSET(weights,cf_type);
     DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
 
+    DECLARE_CF_ITEMS(cfs);
+
     int r, i, j;
 
     #pragma omp parallel for schedule(guided, 8)
@@ -91,7 +99,7 @@ void dot_product(double mask[], double X[], double strength, int icols,
         if(mask[r] == 0.0) {
             temp_act[r] = 0;
         } else {
-            PyObject *cf = PyList_GetItem(cfs,r);
+            PyObject *cf = cfs_items[r];
 
             LOOKUP_FROM_SLOT_OFFSET_UNDECL_DATA(float,weights,cf);
             char *data = weights_obj->data;
@@ -122,31 +130,30 @@ void dot_product(double mask[], double X[], double strength, int icols,
 
 
 void euclidean_response(double input_activity[], double strength, int icols,
-                        double temp_act[], PyObject* cfs, int num_cfs) {
-    double *tact = temp_act;
+                        double temp_act[], PyObject* cfs, int num_cfs, PyObject* cf_type) {
+    DECLARE_SLOT_OFFSET(weights,cf_type);
+    DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
+    DECLARE_CF_ITEMS(cfs);
+
     double max_dist=0.0;
 
     int r;
 
+    // compute the distances in parallel, then the maximum
+    #pragma omp parallel for schedule(guided, 8)
     for (r=0; r<num_cfs; ++r) {
-        PyObject *cf = PyList_GetItem(cfs,r);
-
-        PyObject *weights_obj = PyObject_GetAttrString(cf,"weights");
-        PyObject *slice_obj   = PyObject_GetAttrString(cf,"input_sheet_slice");
+        PyObject *cf = cfs_items[r];
 
-        float *wj = (float *)(((PyArrayObject*)weights_obj)->data);
-        int *slice =  (int *)(((PyArrayObject*)slice_obj)->data);
+        LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
+        LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
 
-        int rr1 = *slice++;
-        int rr2 = *slice++;
-        int cc1 = *slice++;
-        int cc2 = *slice;
+        UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
 
         double *xj = input_activity+icols*rr1+cc1;
+        float *wj = weights;
 
         int i, j;
 
-        // computes the dot product
         double tot = 0.0;
         for (i=rr1; i<rr2; ++i) {
             double *xi = xj;
@@ -161,21 +168,15 @@ void euclidean_response(double input_activity[], double strength, int icols,
             wj += cc2-cc1;
         }
 
-        double euclidean_distance = sqrt(tot);
-        if (euclidean_distance>max_dist)
-            max_dist = euclidean_distance;
-
-        *tact = euclidean_distance;
-        ++tact;
+        temp_act[r] = sqrt(tot);
+    }
 
-        // Anything obtained with PyObject_GetAttrString must be explicitly freed
-        Py_DECREF(weights_obj);
-        Py_DECREF(slice_obj);
+    for (r=0; r<num_cfs; ++r) {
+        if (temp_act[r]>max_dist)
+            max_dist = temp_act[r];
     }
-    tact = temp_act;
     for (r=0; r<num_cfs; ++r) {
-        *tact = strength*(max_dist - *tact);
-        ++tact;
+        temp_act[r] = strength*(max_dist - temp_act[r]);
     }
 }
 
@@ -191,6 +192,8 @@ void hebbian(double input_activity[], double output_activity[],
     DECLARE_SLOT_OFFSET(_norm_total,cf_type);
     DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
 
+    DECLARE_CF_ITEMS(cfs);
+
     int r;
 
     #pragma omp parallel for schedule(guided, 8)
@@ -199,7 +202,7 @@ void hebbian(double input_activity[], double output_activity[],
         if (load != 0 && sheet_mask[r] != 0) {
             load *= single_connection_learning_rate;
 
-            PyObject *cf = PyList_GetItem(cfs,r);
+            PyObject *cf = cfs_items[r];
 
             LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
             LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
@@ -246,6 +249,8 @@ void bcm_fixed(double input_activity[], double output_activity[], int num_cfs,
     DECLARE_SLOT_OFFSET(_norm_total,cf_type);
     DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
 
+    DECLARE_CF_ITEMS(cfs);
+
     int r;
 
     #pragma omp parallel for schedule(guided, 8)
@@ -255,7 +260,7 @@ void bcm_fixed(double input_activity[], double output_activity[], int num_cfs,
         if (load != 0) {
             load *= single_connection_learning_rate;
 
-            PyObject *cf = PyList_GetItem(cfs,r);
+            PyObject *cf = cfs_items[r];
 
             LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
             LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
@@ -304,6 +309,8 @@ void trace_learning(double input_activity[], double traces[], int num_cfs,
     DECLARE_SLOT_OFFSET(_norm_total,cf_type);
     DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
 
+    DECLARE_CF_ITEMS(cfs);
+
     int r;
 
     #pragma omp parallel for schedule(guided, 8)
@@ -311,7 +318,7 @@ void trace_learning(double input_activity[], double traces[], int num_cfs,
         double load = traces[r];
         if (load != 0) {
             load *= single_connection_learning_rate;
-            PyObject *cf = PyList_GetItem(cfs,r);
+            PyObject *cf = cfs_items[r];
 
             LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
             LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
@@ -357,12 +364,14 @@ void divisive_normalize_l1(double sheet_mask[], double active_units_mask[],
     DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
     DECLARE_SLOT_OFFSET(mask,cf_type);
 
+    DECLARE_CF_ITEMS(cfs);
+
     int r;
 
     #pragma omp parallel for schedule(guided, 8)
     for (r=0; r<num_cfs; ++r) {
         if (active_units_mask[r] != 0 && sheet_mask[r] != 0) {
-            PyObject *cf = PyList_GetItem(cfs,r);
+            PyObject *cf = cfs_items[r];
 
             LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
             LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
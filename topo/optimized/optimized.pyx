@@ -12,7 +12,7 @@ cdef extern from "optimized.h":
                      double*, cfs, np.int64_t, cf_type)
 
     void euclidean_response(double*, np.float64_t, np.int64_t, double*, cfs,
-                            np.int64_t)
+                            np.int64_t, cf_type)
 
     void hebbian(double*, double*, double*, np.int64_t,
                  np.int64_t, cfs, np.float64_t, cf_type)
@@ -70,9 +70,10 @@ class CFPRF_EuclideanDistance_cython(CFPResponseFn):
 
         cfs = iterator.flatcfs
         cdef np.int64_t num_cfs = len(cfs)
+        cf_type = iterator.cf_type
 
         euclidean_response(<double*> X.data, strength, icols, <double*> activity.data,
-                           cfs, num_cfs)
+                           cfs, num_cfs, cf_type)
 
 
 
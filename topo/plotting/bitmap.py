@@ -45,6 +45,30 @@ except:
 ###        - Get rid of accessing function (copy, show...) (should we really?)
 
 
+def hsv_to_rgb_arrays(h,s,v):
+    """
+    Convert hue, saturation, and value arrays (in the range 0.0 to
+    1.0) to red, green, and blue arrays.
+
+    Vectorized equivalent of applying colorsys.hsv_to_rgb to each
+    element, giving identical results.
+    """
+    h6 = np.multiply(h,6.0)
+    i = np.floor(h6)
+    f = h6-i
+    i = i.astype(np.int)%6
+
+    p = v*(1.0-s)
+    q = v*(1.0-s*f)
+    t = v*(1.0-s*(1.0-f))
+
+    r = np.choose(i,(v,q,p,p,t,v))
+    g = np.choose(i,(t,v,v,q,p,p))
+    b = np.choose(i,(p,p,t,v,v,q))
+    return r,g,b
+
+
+
 class Bitmap(param.Parameterized):
     """
     Wrapper class for the PIL Image class.
@@ -79,6 +103,7 @@ class Bitmap(param.Parameterized):
         the 'image' attribute's Image with a string representation.
         """
         state = super(Bitmap,self).__getstate__()
+        state.pop('_zoom_cache',None)
         import StringIO
         f = StringIO.StringIO()
         image = state['image']
@@ -113,13 +138,30 @@ class Bitmap(param.Parameterized):
         parameter.  1.0 is the same size, 2.0 is doubling the height
         and width, 0.5 is 1/2 the original size.  The original Image
         is not changed.
+
+        The result of the most recent integer zoom is cached (e.g. for
+        GUI windows that repeatedly redraw the same plot), so the
+        returned Image should not be modified.
         """
         if factor%1==0:
+            cached = getattr(self,'_zoom_cache',None)
+            if cached and cached[0] is self.image and cached[1]==factor:
+                return cached[2]
+
             # CEBALERT: work around PIL bug (see SF #2820821) so that
             # integer scaling works in the typical case (where an
             # image is being enlarged).
-            a = np.array(self.image).repeat(int(factor),axis=0).repeat(int(factor),axis=1)
-            zoomed = Image.fromarray(a,mode=self.image.mode)
+            #
+            # Each pixel is replicated into a factor x factor block by
+            # a single broadcast assignment (equivalent to repeating
+            # along both axes, without the intermediate array).
+            f = int(factor)
+            a = np.asarray(self.image)
+            r,c = a.shape[:2]
+            blocks = np.empty((r,f,c,f)+a.shape[2:],dtype=a.dtype)
+            blocks[...] = a[:,np.newaxis,:,np.newaxis]
+            zoomed = Image.fromarray(blocks.reshape((r*f,c*f)+a.shape[2:]),mode=self.image.mode)
+            self._zoom_cache = (self.image,factor,zoomed)
         else:
             x,y = self.image.size
             zx, zy = int(x*factor), int(y*factor)
@@ -128,10 +170,6 @@ class Bitmap(param.Parameterized):
         return zoomed
 
 
-    # CEBALERT: Might be worthwhile simplifying this
-    # method. E.g. Image.fromarray() now exists (PIL>=1.1.6), and
-    # probably various numpy operations can now be written more
-    # clearly, too.
     def _arrayToImage(self, inArray):
         """
         Generate a 1-channel PIL Image from an array of values from 0 to 1.0.
@@ -144,22 +182,23 @@ class Bitmap(param.Parameterized):
         # input array to match.  The pixels are scaled by 255, not
         # 256, so that 1.0 maps to fully white.
         max_pixel_value=255
-        inArray = (np.floor(inArray * max_pixel_value)).astype(np.int)
-
-        # Clip any values that are still larger than max_pixel_value
-        to_clip = (np.greater(inArray.ravel(),max_pixel_value)).sum()
-        if (to_clip>0):
+        scaled = np.multiply(inArray,max_pixel_value)
+        if not isinstance(scaled,np.ndarray) or scaled.dtype.kind!='f':
+            scaled = np.asarray(scaled,dtype=np.float)
+        np.floor(scaled,out=scaled)
+
+        # Count any values that are still larger than max_pixel_value
+        # (the full comparison is only needed if there are any).
+        if scaled.size and scaled.max() > max_pixel_value:
+            to_clip = np.count_nonzero(scaled > max_pixel_value)
             # CEBALERT: no explanation of why clipped pixel count is
             # being accumulated.
             self.clipped_pixels = self.clipped_pixels + to_clip
-            inArray.clip(0,max_pixel_value,out=inArray)
             self.verbose("Bitmap: clipped",to_clip,"image pixels that were out of range")
 
-        r,c = inArray.shape
-        # The size is (width,height), so we swap r and c:
-        newImage = Image.new('L',(c,r),None)
-        newImage.putdata(inArray.ravel())
-        return newImage
+        # Negative values are clipped to 0, as Image.putdata used to do.
+        np.clip(scaled,0,max_pixel_value,out=scaled)
+        return Image.fromarray(scaled.astype(np.uint8),'L')
 
 
 class PaletteBitmap(Bitmap):
@@ -215,25 +254,9 @@ class HSVBitmap(Bitmap):
 
     def __init__(self,hue,sat,val):
         """Each matrix must be the same size, with values in the range 0.0 to 1.0."""
-        shape = hue.shape # Assumed same as sat.shape and val.shape
-        rmat = np.zeros(shape, dtype=np.float)
-        gmat = np.zeros(shape, dtype=np.float)
-        bmat = np.zeros(shape, dtype=np.float)
-
-        # Note: should someday file a feature request for PIL for them
-        # to accept an image of type 'HSV', so that they will do this
-        # conversion themselves, without us needing an explicit loop
-        # here.  That should speed this up.
-        ch = hue.clip(0.0,1.0)
-        cs = sat.clip(0.0,1.0)
-        cv = val.clip(0.0,1.0)
-
-        for i in range(shape[0]):
-            for j in range(shape[1]):
-                r,g,b = hsv_to_rgb(ch[i,j],cs[i,j],cv[i,j])
-                rmat[i,j] = r
-                gmat[i,j] = g
-                bmat[i,j] = b
+        rmat,gmat,bmat = hsv_to_rgb_arrays(hue.clip(0.0,1.0),
+                                           sat.clip(0.0,1.0),
+                                           val.clip(0.0,1.0))
 
         rImage = self._arrayToImage(rmat)
         gImage = self._arrayToImage(gmat)
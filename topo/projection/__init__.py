@@ -27,6 +27,7 @@ from topo.misc.util import rowcol2idx
 from topo.transferfn import TransferFn,IdentityTF
 from topo.learningfn import LearningFn,IdentityLF
 from topo.base import patterngenerator
+from topo.misc.memuse import unique_nbytes
 
 class CFPOF_SharedWeight(CFPOutputFn):
     """
@@ -174,9 +175,9 @@ class SharedWeightCFProjection(CFProjection):
 
 
     def n_bytes(self):
-        return self.activity.nbytes + self.__sharedcf.weights.nbytes + \
-               sum([cf.input_sheet_slice.nbytes
-                    for cf,i in CFIter(self)()])
+        # the CFs' weights are views of the shared weights
+        cf_usage = self._cf_memory_usage()
+        return self.activity.nbytes + cf_usage['weights'] + cf_usage['slices']
 
 
 
@@ -213,6 +214,11 @@ class LeakyCFProjection(ResizableCFProjection):
         return super(LeakyCFProjection,self).n_bytes() + \
                self.activity.nbytes*1 # for leaky_input_buffer
 
+    def memory_usage(self):
+        usage = super(LeakyCFProjection,self).memory_usage()
+        usage['buffers'] = self.leaky_input_buffer.nbytes
+        return usage
+
 
 class ScaledCFProjection(CFProjection):
     """
@@ -298,6 +304,11 @@ class ScaledCFProjection(CFProjection):
         return super(ScaledCFProjection,self).n_bytes() + \
                self.activity.nbytes*4 # for x_avg,sf,lr_sf,scaled_x_avg
 
+    def memory_usage(self):
+        usage = super(ScaledCFProjection,self).memory_usage()
+        usage['buffers'] = unique_nbytes([self.x_avg,self.sf,self.lr_sf,self.scaled_x_avg])
+        return usage
+
 
 
 class OneToOneProjection(Projection):
@@ -389,6 +400,12 @@ class OneToOneProjection(Projection):
         return super(OneToOneProjection,self).n_bytes() + \
                self.activity.nbytes
 
+    def memory_usage(self):
+        usage = super(OneToOneProjection,self).memory_usage()
+        usage['weights'] = self.weights.nbytes
+        usage['indices'] = self.src_idxs.nbytes + self.dest_idxs.nbytes
+        return usage
+
 
 _public = list(set([_k for _k,_v in locals().items()
                     if isinstance(_v,type) and issubclass(_v,Projection)]))
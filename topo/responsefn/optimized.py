@@ -5,13 +5,16 @@ in C to optimize performance.
 Requires the weave package; without it unoptimized versions are used.
 """
 
+import os
+
 import param
 
 from topo.base.functionfamily import ResponseFn,DotProduct
 from topo.base.cf import CFPResponseFn, CFPRF_Plugin
 from topo.misc.inlinec import inline,provide_unoptimized_equivalent,\
      c_header,c_decorators
-from topo.misc.pyxhandler import provide_unoptimized_equivalent_cy
+from topo.misc.pyxhandler import provide_unoptimized_equivalent_cy, pyximported
+from topo.misc.compilecache import pyx_compiled
 from topo.responsefn.projfn import CFPRF_EuclideanDistance  # pyflakes:ignore (optimized version provided)
 
 
@@ -46,13 +49,14 @@ class CFPRF_DotProduct_opt(CFPResponseFn):
         code = c_header + """
             DECLARE_SLOT_OFFSET(weights,cf_type);
             DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
+            DECLARE_CF_ITEMS(cfs);
 
             %(cfs_loop_pragma)s
             for (int r=0; r<num_cfs; ++r) {
                 if(mask[r] == 0.0) {
                     temp_act[r] = 0;
                 } else {
-                    PyObject *cf = PyList_GetItem(cfs,r);
+                    PyObject *cf = cfs_items[r];
 
                     // CONTIGUOUS_ARRAY_FROM_SLOT_OFFSET(float,weights,cf) <<<<<<<<<<<
 
@@ -110,10 +114,12 @@ class CFPRF_DotProduct(CFPRF_Plugin):
 provide_unoptimized_equivalent("CFPRF_DotProduct_opt","CFPRF_DotProduct",locals())
 
 
-try:
-    from optimized_cy import CFPRF_DotProduct_cyopt  # pyflakes:ignore (optimized version)
-except:
-    pass
+# Only imported if already built by pyximport (see topo.misc.compilecache)
+if pyximported and pyx_compiled(os.path.join(os.path.dirname(__file__),"optimized_cy.pyx")):
+    try:
+        from optimized_cy import CFPRF_DotProduct_cyopt  # pyflakes:ignore (optimized version)
+    except:
+        pass
 
 provide_unoptimized_equivalent_cy("CFPRF_DotProduct_cyopt","CFPRF_DotProduct",locals())
 
@@ -130,34 +136,31 @@ class CFPRF_EuclideanDistance_opt(CFPResponseFn):
     """
     def __call__(self, iterator, input_activity, activity, strength, **params):
         temp_act = activity  # pyflakes:ignore (passed to weave C code)
-        rows,cols = activity.shape
         irows,icols = input_activity.shape
         X = input_activity.ravel()  # pyflakes:ignore (passed to weave C code)
         cfs = iterator.flatcfs
         num_cfs = len(cfs)  # pyflakes:ignore (passed to weave C code)
+        cf_type = iterator.cf_type  # pyflakes:ignore (passed to weave C code)
 
         code = c_header + """
             #include <math.h>
-            npfloat *tact = temp_act;
-            double max_dist=0.0;
+            DECLARE_SLOT_OFFSET(weights,cf_type);
+            DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
+            DECLARE_CF_ITEMS(cfs);
 
+            // compute the distances in parallel, then the maximum
+            %(cfs_loop_pragma)s
             for (int r=0; r<num_cfs; ++r) {
-                PyObject *cf = PyList_GetItem(cfs,r);
-
-                PyObject *weights_obj = PyObject_GetAttrString(cf,"weights");
-                PyObject *slice_obj   = PyObject_GetAttrString(cf,"input_sheet_slice");
+                PyObject *cf = cfs_items[r];
 
-                float *wj = (float *)(((PyArrayObject*)weights_obj)->data);
-                int *slice =  (int *)(((PyArrayObject*)slice_obj)->data);
+                LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
+                LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
 
-                int rr1 = *slice++;
-                int rr2 = *slice++;
-                int cc1 = *slice++;
-                int cc2 = *slice;
+                UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
 
                 npfloat *xj = X+icols*rr1+cc1;
+                float *wj = weights;
 
-                // computes the dot product
                 double tot = 0.0;
                 for (int i=rr1; i<rr2; ++i) {
                     npfloat *xi = xj;
@@ -172,24 +175,19 @@ class CFPRF_EuclideanDistance_opt(CFPResponseFn):
                     wj += cc2-cc1;
                 }
 
-                double euclidean_distance = sqrt(tot);
-                if (euclidean_distance>max_dist)
-                    max_dist = euclidean_distance;
-
-                *tact = euclidean_distance;
-                ++tact;
+                temp_act[r] = sqrt(tot);
+            }
 
-                // Anything obtained with PyObject_GetAttrString must be explicitly freed
-                Py_DECREF(weights_obj);
-                Py_DECREF(slice_obj);
+            double max_dist=0.0;
+            for (int r=0; r<num_cfs; ++r) {
+                if (temp_act[r]>max_dist)
+                    max_dist = temp_act[r];
             }
-            tact = temp_act;
             for (int r=0; r<num_cfs; ++r) {
-                *tact = strength*(max_dist - *tact);
-                ++tact;
+                temp_act[r] = strength*(max_dist - temp_act[r]);
             }
-        """
-        inline(code, ['X', 'strength', 'icols', 'temp_act','cfs','num_cfs'],
-               local_dict=locals())
+        """%c_decorators
+        inline(code, ['X', 'strength', 'icols', 'temp_act','cfs','num_cfs','cf_type'],
+               local_dict=locals(), headers=['<structmember.h>'])
 
 provide_unoptimized_equivalent("CFPRF_EuclideanDistance_opt","CFPRF_EuclideanDistance",locals())
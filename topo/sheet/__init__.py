@@ -161,7 +161,8 @@ class JointNormalizingCFSheet(CFSheet):
             self.debug(normtype + " normalizing:")
 
             for p in projlist:
-                p.apply_learn_output_fns(active_units_mask=active_units_mask)
+                self._timed((self.name,p.name),'apply_learn_output_fns',p.n_bytes,
+                            p.apply_learn_output_fns,active_units_mask)
                 self.debug('  ',p.name)
 
 
@@ -170,15 +171,21 @@ class JointNormalizingCFSheet(CFSheet):
         Call the learn() method on every Projection to the Sheet, and
         call the output functions (jointly if necessary).
         """
-        # Ask all projections to learn independently
-        for proj in self.in_connections:
-            if not isinstance(proj,Projection):
-                self.debug("Skipping non-Projection "+proj.name)
-            else:
-                proj.learn()
+        # The indices of the units to be processed are shared by all
+        # projections while learning (see CFIter.get_unit_indices)
+        self._unit_indices_cache = {}
+        try:
+            # Ask all projections to learn independently
+            for proj in self.in_connections:
+                if not isinstance(proj,Projection):
+                    self.debug("Skipping non-Projection "+proj.name)
+                else:
+                    self._timed((self.name,proj.name),'learn',proj.n_bytes,proj.learn)
 
-        # Apply output function in groups determined by dest_port
-        self._normalize_weights()
+            # Apply output function in groups determined by dest_port
+            self._normalize_weights()
+        finally:
+            self._unit_indices_cache = None
 
 
 
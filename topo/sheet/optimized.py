@@ -6,7 +6,8 @@ import param
 
 from topo.base.cf import CFIter
 from topo.base.projection import NeighborhoodMask
-from topo.misc.inlinec import inline,provide_unoptimized_equivalent,c_header
+from topo.misc.inlinec import inline,provide_unoptimized_equivalent,c_header,\
+     c_decorators
 from topo.sheet import SettlingCFSheet
 from topo.sheet import compute_joint_norm_totals  # pyflakes:ignore (optimized version provided)
 
@@ -22,13 +23,12 @@ def compute_joint_norm_totals_opt(projlist,active_units_mask):
 
     proj = projlist[0]
     iterator = CFIter(proj,active_units_mask=active_units_mask)
-    num_cfs = len(proj.flatcfs)  # pyflakes:ignore (passed to weave C code)
-    active_units_mask = iterator.get_active_units_mask()
-    sheet_mask = iterator.get_sheet_mask()  # pyflakes:ignore (passed to weave C code)
+    unit_indices = iterator.get_unit_indices()
+    num_units = len(unit_indices)  # pyflakes:ignore (passed to weave C code)
     cf_type = iterator.cf_type  # pyflakes:ignore (passed to weave C code)
-
-    # CEBALERT: Not consistent with other C code. E.g. could be
-    # simplified to use active_units_mask[] and sheet_mask[]?
+    # The CF lists are collected here so that the C loop over CFs
+    # need not call the Python API (and can therefore use OpenMP).
+    cfs_lists = [p.flatcfs for p in projlist]  # pyflakes:ignore (passed to weave C code)
 
     code = c_header + """
         DECLARE_SLOT_OFFSET(_norm_total,cf_type);
@@ -37,49 +37,44 @@ def compute_joint_norm_totals_opt(projlist,active_units_mask):
         DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
         DECLARE_SLOT_OFFSET(mask,cf_type);
 
-        npfloat *x = active_units_mask;
-        npfloat *m = sheet_mask;
-        for (int r=0; r<num_cfs; ++r) {
-            double load = *x++;
-            double msk = *m++;
-            if (msk!=0 && load != 0) {
-                double nt = 0;
-
-                for(int p=0; p<length; p++) {
-                    PyObject *proj = PyList_GetItem(projlist,p);
-                    PyObject *cfs = PyObject_GetAttrString(proj,"flatcfs");
-                    PyObject *cf = PyList_GetItem(cfs,r);
-                    LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
-                    if (_has_norm_total[0] == 0) {
-                        LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
-                        LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
-
-                        UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
-
-                        SUM_NORM_TOTAL(cf,weights,_norm_total,rr1,rr2,cc1,cc2);
-                    }
-                    nt += _norm_total[0];
-                    Py_DECREF(cfs);
-                }
+        PyObject ***proj_cfs = new PyObject**[length];
+        for (int p=0; p<length; p++) {
+            proj_cfs[p] = PySequence_Fast_ITEMS(PyList_GetItem(cfs_lists,p));
+        }
+
+        %(cfs_loop_pragma)s
+        for (int k=0; k<num_units; ++k) {
+            int r = unit_indices[k];
+            double nt = 0;
 
-                for(int p=0; p<length; p++) {
-                    PyObject *proj = PyList_GetItem(projlist,p);
-                    PyObject *cfs = PyObject_GetAttrString(proj,"flatcfs");
-                    PyObject *cf = PyList_GetItem(cfs,r);
+            for(int p=0; p<length; p++) {
+                PyObject *cf = proj_cfs[p][r];
+                LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
+                LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
+                if (_has_norm_total[0] == 0) {
+                    LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
+                    LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
 
-                    LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
-                    _norm_total[0] = nt;
-                    LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
-                    _has_norm_total[0] = 1;
+                    UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
 
-                    Py_DECREF(cfs);
+                    SUM_NORM_TOTAL(cf,weights,_norm_total,rr1,rr2,cc1,cc2);
                 }
+                nt += _norm_total[0];
             }
 
+            for(int p=0; p<length; p++) {
+                PyObject *cf = proj_cfs[p][r];
+
+                LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
+                _norm_total[0] = nt;
+                LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
+                _has_norm_total[0] = 1;
+            }
         }
-    """
-    inline(code, ['projlist','active_units_mask','sheet_mask','num_cfs','length','cf_type'],
+
+        delete[] proj_cfs;
+    """%c_decorators
+    inline(code, ['cfs_lists','unit_indices','num_units','length','cf_type'],
            local_dict=locals(),
            headers=['<structmember.h>'])
 
@@ -11,6 +11,7 @@ in Cython.
 #include <omp.h>
 #include <eigen3/Eigen/Sparse>
 #include <vector>
+#include <cstring>
 #define EIGEN_DONT_PARALLELIZE
 
 using Eigen::SparseMatrix;
@@ -217,6 +218,22 @@ template <class T, int S=Eigen::ColMajor>
 		tripletList.push_back(Tr(is[i],js[i],vs[i]));
 	  }
 	  this->setFromTriplets(tripletList.begin(),tripletList.end());
+  }
+
+  void getCompressed(int* outer, int* inner, float* values) {
+	this->makeCompressed();
+	std::memcpy(outer, this->outerIndexPtr(), (this->outerSize()+1)*sizeof(int));
+	std::memcpy(inner, this->innerIndexPtr(), this->nonZeros()*sizeof(int));
+	std::memcpy(values, this->valuePtr(), this->nonZeros()*sizeof(float));
+  }
+
+  void setCompressed(const int* outer, const int* inner, const float* values, const int n) {
+	this->setZero();
+	this->makeCompressed();
+	this->resizeNonZeros(n);
+	std::memcpy(this->outerIndexPtr(), outer, (this->outerSize()+1)*sizeof(int));
+	std::memcpy(this->innerIndexPtr(), inner, n*sizeof(int));
+	std::memcpy(this->valuePtr(), values, n*sizeof(float));
   }};
 
 #endif
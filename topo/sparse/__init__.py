@@ -3,11 +3,15 @@ import os
 (basepath, _) = os.path.split(os.path.abspath(__file__))
 
 try:
-    from distutils.core import run_setup
+    from topo.misc import compilecache
 
-    # Run the setup script in the sandbox, so that it doesn't complain about unknown args when launched through nose
-    run_setup(basepath + "/compile.py")
-
-    from topo.sparse import sparse # pyflakes:ignore (try/except import)
-except ImportError:
-    print "WARNING: Install distutils and Cython to build sparse extension."
+    # The extension is built ahead of time into the kernel cache
+    # (see topo.misc.compilecache), rather than each time it is imported
+    build_dir = compilecache.extension_dir(__name__+'.sparse',basepath + "/compile.py",
+                                           [basepath + "/sparse.pyx",basepath + "/SparseMatrixExt.cpp"])
+    if build_dir is not None:
+        __path__.insert(0,build_dir)
+        from topo.sparse import sparse # pyflakes:ignore (try/except import)
+except Exception:
+    # compile.py raises SkipTest if Cython is missing
+    print "WARNING: Install distutils and Cython to build sparse extension; using scipy.sparse instead."
@@ -1,4 +1,5 @@
 import os
+import sys
 import numpy
 
 (basepath, _) = os.path.split(os.path.abspath(__file__))
@@ -17,7 +18,9 @@ ext_modules = [Extension("sparse", [basepath + "/sparse.pyx"],
                          language="c++", extra_compile_args = ["-w","-O2","-fopenmp","-DNDEBUG","-msse2"],
                          extra_link_args=['-lgomp'])]
 
-setup_args = ['--quiet','build_ext','--build-lib',basepath]
+# Arguments may be supplied when run by distutils.core.run_setup
+# (e.g. to build into the kernel cache; see topo.misc.compilecache)
+setup_args = sys.argv[1:] or ['--quiet','build_ext','--build-lib',basepath]
 setup(name = "Sparse CF Matrix",  ext_modules = ext_modules,
       include_dirs=[rootpath+'/external/',numpy.get_include()],
       cmdclass = {'build_ext':build_ext}, script_args = setup_args)
@@ -0,0 +1,318 @@
+"""
+Implementation of the sparse weights matrix used by
+SparseCFProjection on top of scipy.sparse, for use where the compiled
+sparse extension (sparse.pyx) cannot be built.
+
+Provides csarray_float with the same interface as the compiled
+version, storing the weights in CSC format, so that each column holds
+the weights of one CF (as in the column-major Eigen matrix of the
+compiled version).  All operations are vectorized over the stored
+entries rather than looping over CFs.
+"""
+
+import warnings
+
+import numpy
+import scipy.sparse
+
+
+# Activities below this value are treated as zero by the _opt methods,
+# as in SparseMatrixExt.cpp.
+epsilon = 0.000001
+
+
+class csarray_float(object):
+    """
+    Column-major sparse float32 matrix with Topographica-specific
+    operations (DotProduct, Hebbian, DivisiveNormalizeL1, ...).
+    """
+
+    def __init__(self, src_dim, dest_dim):
+        """
+        Create a new, empty array with one row per unit of src_dim and
+        one column per unit of dest_dim (or, if given integers, of
+        shape (src_dim,dest_dim)).
+        """
+        if isinstance(src_dim,tuple):
+            self.src_dim = src_dim
+            self.dest_dim = dest_dim
+            shape = (src_dim[0]*src_dim[1],dest_dim[0]*dest_dim[1])
+        else:
+            self.src_dim = (src_dim,1)
+            self.dest_dim = (dest_dim,1)
+            shape = (src_dim,dest_dim)
+        self._set_matrix(scipy.sparse.csc_matrix(shape,dtype=numpy.float32))
+
+
+    def _set_matrix(self, matrix):
+        self.matrix = matrix
+        self._cols = None
+
+
+    def _col_indices(self):
+        """Return the column of each stored entry, in storage order."""
+        if self._cols is None or len(self._cols) != len(self.matrix.data):
+            self._cols = numpy.repeat(numpy.arange(self.matrix.shape[1],dtype=numpy.int32),
+                                      numpy.diff(self.matrix.indptr))
+        return self._cols
+
+
+    def _wrap(self, matrix):
+        result = csarray_float(matrix.shape[0],matrix.shape[1])
+        result._set_matrix(scipy.sparse.csc_matrix(matrix,dtype=numpy.float32))
+        return result
+
+
+    ndim = property(lambda self: 2,doc="Return the number of dimensions of this array.")
+
+    shape = property(lambda self: self.matrix.shape,doc="Return the shape of this array (rows, cols).")
+
+    size = property(lambda self: self.matrix.shape[0]*self.matrix.shape[1],
+                    doc="Return the size of this array, that is rows*cols.")
+
+
+    def getnnz(self):
+        """
+        Return the number of non-zero elements in the array
+        """
+        return self.matrix.nnz
+
+
+    def __setitem__(self, inds, val):
+        """
+        Set elements of the array, either a single element or, if
+        i,j = inds are arrays, the elements A[i[k], j[k]].
+        """
+        i, j = inds
+        if type(i) == numpy.ndarray and type(j) == numpy.ndarray:
+            self.put(val, i, j)
+        else:
+            i = int(i)
+            j = int(j)
+            if i < 0 or i>=self.shape[0]:
+                raise ValueError("Invalid row index " + str(i))
+            if j < 0 or j>=self.shape[1]:
+                raise ValueError("Invalid col index " + str(j))
+            self.put(val, numpy.array([i]), numpy.array([j]))
+
+
+    def __getitem__(self, inds):
+        """
+        Get a value or set of values from the array, as for the
+        compiled version: a single element for integer i,j = inds,
+        the elements A[i[k], j[k]] if both are arrays, or otherwise
+        the submatrix selected by i and j.
+        """
+        i, j = inds
+        if type(i) == numpy.ndarray and type(j) == numpy.ndarray:
+            return numpy.asarray(self.matrix[i,j]).ravel()
+        elif isinstance(i,(int,long,numpy.integer)) and isinstance(j,(int,long,numpy.integer)):
+            return self.matrix[i,j]
+        else:
+            if not isinstance(i,slice):
+                i = numpy.atleast_1d(i)
+            if not isinstance(j,slice):
+                j = numpy.atleast_1d(j)
+            return self._wrap(self.matrix[:,j][i,:])
+
+
+    def __add__(self, A):
+        """
+        Add two matrices together
+        """
+        if self.shape != A.shape:
+            raise ValueError("Cannot add matrices of shapes" + str(self.shape) + " and " + str(A.shape))
+        result = csarray_float(self.src_dim,self.dest_dim)
+        result._set_matrix(self.matrix + A.matrix)
+        return result
+
+
+    def prune(self):
+        """
+        Remove all stored entries that are (close to) zero.
+        """
+        self.matrix.data[numpy.abs(self.matrix.data) <= 0.0001*0.000001] = 0
+        self.matrix.eliminate_zeros()
+        self._cols = None
+
+
+    def nonzero(self):
+        """
+        Return a tuple of arrays corresponding to nonzero elements.
+        """
+        cols = self._col_indices()
+        return (self.matrix.indices.astype(numpy.int64), cols.astype(numpy.int64))
+
+
+    def put(self, val, rowInds, colInds):
+        """
+        Set the elements at rowInds,colInds to val (either an array or
+        a single value).  Zeros are not inserted where no element is
+        stored already.
+        """
+        val = numpy.broadcast_to(numpy.asarray(val,dtype=numpy.float32),numpy.shape(rowInds))
+        changed = numpy.asarray(self.matrix[rowInds,colInds]).ravel() != val
+        if changed.any():
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore',scipy.sparse.SparseEfficiencyWarning)
+                self.matrix[rowInds[changed],colInds[changed]] = val[changed]
+            self._cols = None
+
+
+    def copy(self):
+        """
+        Return a copied version of this array.
+        """
+        result = csarray_float(self.src_dim,self.dest_dim)
+        result._set_matrix(self.matrix.copy())
+        return result
+
+
+    def toarray(self):
+        """
+        Convert this sparse matrix into a numpy array.
+        """
+        return self.matrix.toarray()
+
+
+    def compress(self):
+        """
+        Sum any duplicate entries and sort the indices of each column.
+        """
+        self.matrix.sum_duplicates()
+        self._cols = None
+
+
+    def reserve(self, n):
+        """
+        No-op; scipy.sparse matrices do not support reserving space.
+        """
+        pass
+
+
+    def getTriplets(self):
+        """
+        Returns coordinate and value triplets from sparse matrix.
+        """
+        return (self.matrix.indices.astype(numpy.int32),
+                self._col_indices().copy(),
+                self.matrix.data.astype(numpy.float32))
+
+
+    def setTriplets(self, rows, cols, vals):
+        """
+        Replace the contents of the matrix with the given coordinate
+        and value triplets, summing any duplicates.
+        """
+        matrix = scipy.sparse.coo_matrix((vals,(rows,cols)),shape=self.shape,dtype=numpy.float32)
+        self._set_matrix(matrix.tocsc())
+
+
+    def getCompressed(self):
+        """
+        Returns the compressed column storage of the sparse matrix:
+        the index of the first entry of each column (plus the total
+        number of entries), and the row and value of each entry.
+        The arrays are those of the matrix itself, not copies.
+        """
+        self.compress()
+        return (self.matrix.indptr.astype(numpy.int32,copy=False),
+                self.matrix.indices.astype(numpy.int32,copy=False),
+                self.matrix.data)
+
+
+    def setCompressed(self, outerInds, innerInds, values):
+        """
+        Replaces the contents of the sparse matrix with the given
+        compressed column storage (as returned by getCompressed),
+        without copying it.
+        """
+        if len(outerInds) != self.shape[1]+1:
+            raise ValueError("Compressed storage does not match matrix shape.")
+        self._set_matrix(scipy.sparse.csc_matrix((values,innerInds,outerInds),
+                                                 shape=self.shape,copy=False))
+
+
+    def Hebbian(self, src_act, dest_act, norm_total, lr):
+        """
+        Update weights based on Hebbian learning and the learning
+        rate, also calculating the CF weight totals for divisive
+        normalization.
+        """
+        rows = self.matrix.indices
+        cols = self._col_indices()
+        self._add_to_data(lr*dest_act.ravel()[cols]*src_act.ravel()[rows])
+        self.CFWeightTotals(norm_total)
+
+
+    def Hebbian_opt(self, src_act, dest_act, norm_total, lr, init):
+        """
+        As Hebbian, but skipping connections whose source or
+        destination activity is (close to) zero, once init is True.
+        """
+        if not init:
+            self.Hebbian(src_act,dest_act,norm_total,lr)
+            return
+        rows = self.matrix.indices
+        cols = self._col_indices()
+        src = src_act.ravel()[rows]
+        dest = dest_act.ravel()[cols]
+        self._add_to_data(numpy.where((src>=epsilon) & (dest>=epsilon),lr*dest*src,0.0))
+        self.CFWeightTotals(norm_total)
+
+
+    def _add_to_data(self, delta):
+        self.matrix.data[:] = self.matrix.data + delta
+
+
+    def DotProduct(self, strength, dense, out):
+        """
+        Calculate the dot product sums between the input activities
+        and CF weights, adding them to out.
+        """
+        out.ravel()[:] += self.matrix.T.dot(dense.ravel())
+        out *= strength
+
+
+    def DotProduct_opt(self, strength, dense, out):
+        """
+        As DotProduct, but ignoring input activities that are (close
+        to) zero.
+        """
+        dense = dense.ravel()
+        self.DotProduct(strength,numpy.where(dense>=epsilon,dense,0.0),out)
+
+
+    def DivisiveNormalizeL1(self, norm_total):
+        """
+        Apply divisive normalization on each CF, given its total in
+        norm_total.
+        """
+        self._scale_data(1.0/norm_total.ravel()[self._col_indices()])
+
+
+    def DivisiveNormalizeL1_opt(self, norm_total, dest_act, init):
+        """
+        As DivisiveNormalizeL1, but (unless init is True) only for
+        CFs whose unit is active.
+        """
+        if init:
+            self.DivisiveNormalizeL1(norm_total)
+            return
+        cols = self._col_indices()
+        active = dest_act.ravel()[cols] >= epsilon
+        factor = numpy.ones(len(cols))
+        factor[active] = 1.0/norm_total.ravel()[cols[active]]
+        self._scale_data(factor)
+
+
+    def _scale_data(self, factor):
+        self.matrix.data[:] = self.matrix.data * factor
+
+
+    def CFWeightTotals(self, norm_total):
+        """
+        Add the current weight total of each CF to norm_total.
+        """
+        norm_total.ravel()[:] += numpy.bincount(self._col_indices(),weights=self.matrix.data,
+                                                minlength=self.matrix.shape[1])
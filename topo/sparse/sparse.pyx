@@ -38,6 +38,9 @@ cdef extern from "SparseMatrixExt.cpp":
         void DivisiveNormalizeL1_opt(double*,double*)
         void CFWeightTotals(double*)
         void setTriplets(int*,int*,float*,int)
+        void getCompressed(int*,int*,float*)
+        void setCompressed(int*,int*,float*,int)
+        int outerSize()
         void reserve(int)
         void slice(int*, int, int*, int, SparseMatrixExt[T]*)
         void prune(float,float)
@@ -294,6 +297,29 @@ cdef class csarray_float:
         self.thisPtr.setTriplets(&rows[0],&cols[0],&vals[0],int(vals.shape[0]))
 
 
+    def getCompressed(self):
+        """
+        Returns the compressed column storage of the sparse matrix:
+        the index of the first entry of each column (plus the total
+        number of entries), and the row and value of each entry.
+        """
+        cdef numpy.ndarray[int, ndim=1, mode="c"] outerInds = numpy.zeros(self.thisPtr.outerSize()+1, dtype=numpy.int32)
+        cdef numpy.ndarray[int, ndim=1, mode="c"] innerInds = numpy.zeros(self.getnnz(), dtype=numpy.int32)
+        cdef numpy.ndarray[float, ndim=1, mode="c"] values = numpy.zeros(self.getnnz(), dtype=numpy.float32)
+        self.thisPtr.getCompressed(&outerInds[0], <int*>innerInds.data, <float*>values.data)
+        return outerInds, innerInds, values
+
+
+    def setCompressed(self, numpy.ndarray[int, ndim=1, mode="c"] outerInds, numpy.ndarray[int, ndim=1, mode="c"] innerInds, numpy.ndarray[float, ndim=1, mode="c"] values):
+        """
+        Replaces the contents of the sparse matrix with the given
+        compressed column storage (as returned by getCompressed).
+        """
+        if outerInds.shape[0] != self.thisPtr.outerSize()+1:
+            raise ValueError("Compressed storage does not match matrix shape.")
+        self.thisPtr.setCompressed(&outerInds[0], <int*>innerInds.data, <float*>values.data, int(values.shape[0]))
+
+
     def Hebbian(self,numpy.ndarray[double, ndim=2, mode="c"] src_act, numpy.ndarray[double, ndim=2, mode="c"] dest_act, numpy.ndarray[double, ndim=2, mode="c"] norm_total, double lr):
         """
         Call C method to update weights based on Hebbian learning and
@@ -1,7 +1,8 @@
 """
 Basic SparseCFProjection with associated sparse CFs and output,
-response, and learning function. If sparse component cannot be imported,
-SparseCFProjection will fall back to a basic dense CFProjection.
+response, and learning function. The sparse weights are stored using
+either the compiled sparse component or, if that cannot be imported,
+an equivalent implementation based on scipy.sparse.
 
 CFSOF and CFSLF Plugin function allow any single CF output function to
 be applied to the sparse CFs, but may suffer a serious performance
@@ -9,8 +10,10 @@ loss.  For real work, such functions should be implemented at the
 Cython or C++ level.
 """
 
+import sys
 import numpy as np
 import math
+import timeit
 from scipy.ndimage.filters import gaussian_filter
 import param
 
@@ -18,6 +21,8 @@ from copy import copy
 
 import topo
 from topo.base.cf import CFProjection, NullCFError, _create_mask, simple_vectorize
+from topo.base.projection import Projection
+from topo.misc.memuse import object_bytes
 from topo import pattern
 from imagen import patterngenerator
 from imagen.patterngenerator import PatternGenerator
@@ -26,9 +31,15 @@ from topo.base.functionfamily import LearningFn, Hebbian
 from topo.base.functionfamily import ResponseFn, DotProduct
 from topo.base.sheetcoords import Slice
 
+import scipysparse
+
+# Available implementations of the sparse weights matrix, by name
+sparse_backends = {'scipy':scipysparse}
+
 use_sparse = True
 try:
     import sparse
+    sparse_backends['eigen'] = sparse
 except:
     use_sparse = False
 
@@ -120,6 +131,28 @@ class CFSPOF_Prune(CFSPOF_Plugin):
             self.message("%s has %f%% of initial connections" % (projection.name, (float(projection.n_conns())/self.initial_conns[projection.name])*100))
 
 
+def _top_positive(values, counts):
+    """
+    Return the indices (row,column) of the counts[i] largest positive
+    values in each row i of the 2D array values, selected by partial
+    sorting (so that only the candidates are sorted).
+    """
+    n,size = values.shape
+    k = min(counts.max(),size) if n else 0
+    if k <= 0:
+        return np.zeros(0,np.int64),np.zeros(0,np.int64)
+    rows = np.arange(n)[:,np.newaxis]
+    if k < size:
+        best = np.argpartition(-values,k-1,axis=1)[:,:k]
+    else:
+        best = np.tile(np.arange(size),(n,1))
+    best = best[rows,np.argsort(-values[rows,best],axis=1)]
+    chosen = (np.arange(k) < counts[:,np.newaxis]) & (values[rows,best] > 0)
+    i,rank = chosen.nonzero()
+    return i,best[i,rank]
+
+
+
 class CFSPOF_SproutRetract(CFSPOF_Plugin):
     """
     Sprouting and retraction weights output function. At a preset time
@@ -137,6 +170,11 @@ class CFSPOF_SproutRetract(CFSPOF_Plugin):
     convolution with a Gaussian kernel to the existing connections,
     growing connections at locations with the highest probabilities.
 
+    All CFs are processed together, working directly on the
+    (row,column,value) triplets of the projection's sparse weights
+    rather than on each CF's dense weights in turn; the sparse
+    matrix is then rebuilt once from the resulting triplets.
+
     Still experimental and not scientifically validated.
     """
 
@@ -159,111 +197,184 @@ class CFSPOF_SproutRetract(CFSPOF_Plugin):
     disk_mask = param.Boolean(default=True,doc="""
         Limits connection sprouting to a disk.""")
 
+    batch_size = param.Integer(default=1024,bounds=(1,None),doc="""
+        Number of CFs of the same shape whose sprouting probabilities
+        are computed together in one convolution; bounds the amount
+        of temporary dense storage needed.""")
+
+
     def __call__(self, projection, **params):
         time = math.ceil(topo.sim.time())
 
         if self.disk_mask:
             self.disk = pattern.Disk(size=1.0,smoothing=0.0)
 
-        # Get CF and src sheet shapes
-        cf_x,cf_y = projection.dest.activity.shape
-        src_x,src_y = projection.src.activity.shape
-
-        # Initialize sparse triplet arrays
-        y_array = np.zeros((src_x*src_y*cf_y),dtype=np.int32)
-        x_array = np.zeros((src_x*src_y*cf_y),dtype=np.int32)
-        val_array = np.zeros((src_x*src_y*cf_y),dtype=sparse_type)
-
-        # Create new sparse matrix to accumulate into
-        sum_sparse = sparse.csarray_float(projection.src.activity.shape,projection.dest.activity.shape)
-
-        # Counters for logging
-        sprout_sum = 0; prune_sum = 0; unit_total = 0
-        self.mask_total = 0
-
         if (time == 0):
             if not hasattr(self,"initial_conns"):
                 self.initial_conns = {}
             self.initial_conns[projection.name] = projection.n_conns()
         elif (time % self.interval) == 0:
-            idx=0
-            for cidx,cf in enumerate(projection.flatcfs):
-                temp_weights = cf.weights
-                dense_unit_mask = (1.0 - (temp_weights>0.0))
-                dim1,dim2 = temp_weights.shape
-
-                sprout_count,prune_idx,nnz = self.calc_ratios(temp_weights)
-
-                self.prune(temp_weights,prune_idx)
-                nnz_pp = np.count_nonzero(temp_weights)
-                prune_sum += (nnz_pp-nnz)
-
-                self.sprout(temp_weights,dense_unit_mask,sprout_count)
-                nnz_ps = np.count_nonzero(temp_weights)
-                sprout_sum += nnz_ps - nnz_pp
-                unit_total += nnz_ps
-
-                # Populate sparse array chunk
-                temp_sparse = sparse.csarray_float(projection.src.activity.shape,projection.dest.activity.shape)
-                x1,x2,y1,y2 = cf.input_sheet_slice.tolist()
-                for cnx in range(dim1):
-                    val_array[idx:idx+dim2] = temp_weights[cnx,:]
-                    x_val = (x1+cnx) * src_y + y1
-                    x_array[idx:idx+dim2] = range(x_val,x_val+dim2)
-                    y_array[idx:idx+dim2] = cidx
-                    idx += dim2
-
-                # Populate combined sparse array with sparse array chunk
-                if (cidx+1)%cf_y == 0:
-                    nnz_idx = val_array.nonzero()
-                    temp_sparse.setTriplets(x_array[nnz_idx],y_array[nnz_idx],val_array[nnz_idx])
-                    sum_sparse += temp_sparse
-                    x_array *= 0; y_array *= 0; val_array *= 0.0
-                    idx=0
-            projection.weights = sum_sparse
-            del temp_sparse, sum_sparse
-            projection.weights.compress()
-
+            src_cols = projection.src.activity.shape[1]
+            n_cfs = len(projection.flatcfs)
+
+            # Position and shape of each CF on the src sheet
+            slices = np.array([cf.input_sheet_slice.tolist() for cf in projection.flatcfs],dtype=np.int64)
+            r1 = slices[:,0]; c1 = slices[:,2]
+            shapes = np.column_stack((slices[:,1]-r1,slices[:,3]-c1))
+
+            # Triplets grouped by CF (i.e. by column)
+            rows,cols,vals = projection.weights.getTriplets()
+            order = np.argsort(cols,kind='mergesort')
+            rows,cols,vals = rows[order],cols[order],vals[order]
+            nnz = np.bincount(cols,minlength=n_cfs)
+
+            masked_units = self._masked_units(shapes)
+            self.mask_total = masked_units.sum()
+            sprout_count,prune_count = self.calc_ratios(nnz,masked_units)
+
+            keep = self.prune(cols,vals,nnz,prune_count)
+            new_rows,new_cols,new_vals = self.sprout(rows,cols,vals,keep,nnz,r1,c1,
+                                                     shapes,src_cols,sprout_count)
+
+            rows = np.concatenate((rows[keep],new_rows)).astype(np.int32)
+            cols = np.concatenate((cols[keep],new_cols)).astype(np.int32)
+            vals = np.concatenate((vals[keep],new_vals)).astype(sparse_type)
+
+            weights = projection._new_weights()
+            weights.setTriplets(rows,cols,vals)
+            weights.compress()
+            projection.weights = weights
+
+            prune_sum = np.count_nonzero(keep)-len(keep)
+            sprout_sum = len(new_vals)
+            unit_total = len(vals)
             self.message("%s pruned by %d and sprouted %d, connection is now %f%% dense" % (projection.name,prune_sum,sprout_sum,(float(unit_total)/self.mask_total)*100))
 
 
-    def sprout(self, temp_weights, mask, sprout_count):
-        """
-        Applies a Gaussian blur to the existing connection field,
-        selecting the n units with the highest probabilities to sprout
-        new connections, where n is set by the sprout_count. New
-        connections are initialized at the minimal strength of the
-        current CF.
-        """
+    def _disk(self, shape):
+        """Return the (cached) disk mask for a CF of the given shape."""
+        if not hasattr(self,'_disks'):
+            self._disks = {}
+        if shape not in self._disks:
+            dim1,dim2 = shape
+            self._disks[shape] = self.disk(xdensity=dim2,ydensity=dim1)
+        return self._disks[shape]
 
-        dim1,dim2 = temp_weights.shape
-        init_weight = temp_weights[temp_weights.nonzero()].min()
-        blurred_weights = gaussian_filter(temp_weights, sigma=self.kernel_sigma)
-        blurred_weights = (blurred_weights - blurred_weights.min()) / blurred_weights.max()
-        sprout_prob_map = (blurred_weights * np.random.rand(dim1,dim2)) * mask
-        if self.disk_mask:
-            sprout_prob_map *= self.disk(xdensity=dim2,ydensity=dim1)
-        sprout_inds = np.unravel_index(np.argsort(sprout_prob_map.flatten())[-sprout_count:],(dim1,dim2))
-        temp_weights[sprout_inds] = init_weight
+
+    def _masked_units(self, shapes):
+        """Return the number of units in which each CF may have connections."""
+        if not self.disk_mask:
+            return shapes[:,0]*shapes[:,1]
+        masked_units = np.zeros(len(shapes),dtype=np.int64)
+        for shape in set(map(tuple,shapes)):
+            in_shape = (shapes[:,0]==shape[0]) & (shapes[:,1]==shape[1])
+            masked_units[in_shape] = np.count_nonzero(self._disk(shape))
+        return masked_units
 
 
-    def prune(self, temp_weights, prune_idx):
+    def sprout(self, rows, cols, vals, keep, nnz, r1, c1, shapes, src_cols, sprout_count):
         """
-        Retracts n connections with the lowest weights, where n is
-        determined by the piecewise linear function in the calc_ratios
-        method.
+        Applies a Gaussian blur to the existing connection fields,
+        selecting for each CF the n units with the highest
+        probabilities to sprout new connections, where n is set by
+        the sprout_count. New connections are initialized at the
+        minimal strength of the current CF.
+
+        CFs of the same shape are packed into one dense stack and
+        blurred by a single convolution over the stack, batch_size
+        CFs at a time.  Only units without a connection before
+        pruning, and with nonzero probability, are candidates.
+
+        Returns the (row,column,value) triplets of the new
+        connections.
         """
+        col_start = np.cumsum(nnz)-nnz
+        new_rows,new_cols,new_vals = [],[],[]
+
+        for shape in set(map(tuple,shapes)):
+            dim1,dim2 = shape
+            same_shape = np.flatnonzero((shapes[:,0]==dim1) & (shapes[:,1]==dim2) & (sprout_count>0))
+            for b in range(0,len(same_shape),self.batch_size):
+                batch = same_shape[b:b+self.batch_size]
+                n = len(batch)
+
+                # Indices of the batch's triplets, and their CF positions
+                counts = nnz[batch]
+                idx = np.repeat(col_start[batch]-(np.cumsum(counts)-counts),counts)+np.arange(counts.sum())
+                cf_idx = np.repeat(np.arange(n),counts)
+                wr = rows[idx]//src_cols - r1[cols[idx]]
+                wc = rows[idx]%src_cols - c1[cols[idx]]
+
+                connected = np.zeros((n,dim1,dim2),dtype=np.bool)
+                connected[cf_idx,wr,wc] = vals[idx]>0.0
+                weights = np.zeros((n,dim1,dim2),dtype=sparse_type)
+                weights[cf_idx,wr,wc] = np.where(keep[idx],vals[idx],0.0)
+
+                positive = np.where(weights>0.0,weights,np.inf).reshape(n,-1)
+                init_weight = positive.min(axis=1)
+
+                blurred = gaussian_filter(weights,sigma=(0,self.kernel_sigma,self.kernel_sigma))
+                bmin = blurred.reshape(n,-1).min(axis=1)
+                bmax = blurred.reshape(n,-1).max(axis=1)
+                bmax[bmax==0] = 1.0
+                blurred = (blurred-bmin[:,np.newaxis,np.newaxis])/bmax[:,np.newaxis,np.newaxis]
+
+                sprout_prob_map = blurred * np.random.rand(n,dim1,dim2) * ~connected
+                if self.disk_mask:
+                    sprout_prob_map *= self._disk(shape)
+                sprout_prob_map = sprout_prob_map.reshape(n,-1)
+
+                # Highest-probability candidates of each CF
+                counts = np.where(np.isfinite(init_weight),sprout_count[batch],0)
+                cf_i,best = _top_positive(sprout_prob_map,counts)
+                pr,pc = np.divmod(best,dim2)
+                new_rows.append((r1[batch[cf_i]]+pr)*src_cols + c1[batch[cf_i]]+pc)
+                new_cols.append(batch[cf_i])
+                new_vals.append(init_weight[cf_i])
+
+        if not new_vals:
+            return np.zeros(0,np.int32),np.zeros(0,np.int32),np.zeros(0,sparse_type)
+        return np.concatenate(new_rows),np.concatenate(new_cols),np.concatenate(new_vals)
+
+
+    def prune(self, cols, vals, nnz, prune_count):
+        """
+        Retracts n connections with the lowest weights from each CF,
+        where n is determined by the piecewise linear function in the
+        calc_ratios method.
 
-        sorted_weights = np.sort(temp_weights.flatten())
-        threshold = sorted_weights[prune_idx]
-        temp_weights[temp_weights < threshold] = 0.0
-
-
-    def calc_ratios(self,temp_weights):
+        The triplets must be grouped by column.  Returns a boolean
+        array indicating which connections are kept.
+        """
+        if len(vals)==0:
+            return np.ones(0,dtype=np.bool)
+
+        # The first weight kept by each CF is its kth smallest, found
+        # by partitioning (rather than sorting) a row per CF, padded
+        # to the same length, for batches of CFs with the same k.
+        col_start = np.cumsum(nnz)-nnz
+        kth = np.clip(prune_count,0,np.maximum(nnz-1,0))
+        threshold = np.zeros(len(nnz),dtype=vals.dtype)
+        for k in np.unique(kth[nnz>0]):
+            same_k = np.flatnonzero((kth==k) & (nnz>0))
+            for b in range(0,len(same_k),self.batch_size):
+                batch = same_k[b:b+self.batch_size]
+                counts = nnz[batch]
+                pos = np.arange(counts.sum()) - np.repeat(np.cumsum(counts)-counts,counts)
+                padded = np.empty((len(batch),counts.max()),dtype=vals.dtype)
+                padded.fill(np.inf)
+                padded[np.repeat(np.arange(len(batch)),counts),pos] = vals[np.repeat(col_start[batch],counts)+pos]
+                threshold[batch] = np.partition(padded,k,axis=1)[:,k]
+        return vals >= threshold[cols]
+
+
+    def calc_ratios(self, nnz, masked_units):
         """
         Uses a piecewise linear function to determine the unit
         proportion of sprouting and retraction and the associated
-        turnover rates.
+        turnover rates, returning the number of connections to sprout
+        and to prune for each CF, given the number of connections
+        (nnz) and available units (masked_units) of each CF.
 
         Above the target sparsity the sprout/retract ratio scales
         linearly up to maximal density, i.e. at full density 100% of
@@ -280,29 +391,20 @@ class CFSPOF_SproutRetract(CFSPOF_Plugin):
         connections continue to sprout and retract.
         """
 
-        dim1,dim2 = temp_weights.shape
-        if self.disk_mask:
-            masked_units = len(self.disk(xdensity=dim2,ydensity=dim1).nonzero()[0])
-        else:
-            masked_units = dim1*dim2
-        self.mask_total += masked_units
-        max_units = dim1*dim2
-        nnz = np.count_nonzero(temp_weights)
-        cf_sparsity = nnz / float(masked_units)
+        cf_sparsity = nnz / masked_units.astype(np.float64)
         delta_sparsity = cf_sparsity - self.target_sparsity
-        if delta_sparsity > 0:
-            relative_sparsity = delta_sparsity/(1.0 - self.target_sparsity)
-        else:
-            relative_sparsity = delta_sparsity/self.target_sparsity
+        with np.errstate(divide='ignore',invalid='ignore'):
+            relative_sparsity = np.where(delta_sparsity > 0,
+                                         delta_sparsity/(1.0 - self.target_sparsity),
+                                         delta_sparsity/self.target_sparsity)
 
         # Total number of units to modify, broken down into units for pruning and sprouting
         delta_units = (abs(self.turnover_rate * relative_sparsity) + self.residual_turnover) * masked_units
         prune_factor = 0.5 + (0.5*relative_sparsity)
-        prune_count = int(delta_units * prune_factor)
-        prune_idx = (max_units-nnz)+prune_count
-        sprout_count = int(delta_units * (1-prune_factor))
+        prune_count = (delta_units * prune_factor).astype(np.int64)
+        sprout_count = (delta_units * (1-prune_factor)).astype(np.int64)
 
-        return sprout_count, prune_idx, nnz
+        return sprout_count, prune_count
 
 
 
@@ -418,6 +520,26 @@ def CFPRF_DotProduct_Sparse_opt(projection):
 
 
 
+# Number of connections per chunk when pickling sparse weights
+pickle_chunk_size = 2**20
+
+def _split_for_pickle(array):
+    """Split array into a list of views of at most pickle_chunk_size elements."""
+    return [array[i:i+pickle_chunk_size] for i in xrange(0,len(array),pickle_chunk_size)]
+
+def _join_from_pickle(chunks,dtype):
+    """Inverse of _split_for_pickle, avoiding a copy for a single chunk."""
+    if len(chunks) == 1:
+        return np.ascontiguousarray(chunks[0],dtype=dtype)
+    result = np.zeros(sum([len(c) for c in chunks]),dtype=dtype)
+    i = 0
+    for c in chunks:
+        result[i:i+len(c)] = c
+        i += len(c)
+    return result
+
+
+
 class SparseConnectionField(param.Parameterized):
     """
     A set of weights on one input Sheet.
@@ -639,6 +761,13 @@ class SparseCFProjection(CFProjection):
 
     initialized = param.Boolean(default=False)
 
+    sparse_backend = param.ObjectSelector(default='eigen' if use_sparse else 'scipy',
+        objects=sorted(sparse_backends.keys()),doc="""
+        Implementation of the sparse weights matrix: 'eigen' for the
+        compiled sparse component, or 'scipy' for the pure Python
+        version based on scipy.sparse, which is slower but needs no
+        compiler.""")
+
 
     def __init__(self,initialize_cfs=True,**params):
         """
@@ -689,12 +818,18 @@ class SparseCFProjection(CFProjection):
     def __getstate__(self):
         """
         Method to support pickling of sparse weights object.
+
+        The weights are stored in compressed column form (the row and
+        value of each connection, plus the start of each CF), split
+        into chunks so that only one chunk at a time needs to be
+        copied while pickling.
         """
 
         state_dict = self.__dict__.copy()
-        state_dict['triplets'] = state_dict['weights'].getTriplets()
+        outerInds, innerInds, values = state_dict.pop('weights').getCompressed()
+        state_dict['compressed_weights'] = (outerInds,_split_for_pickle(innerInds),
+                                            _split_for_pickle(values))
         state_dict['weight_shape'] = (self.src.activity.shape,self.dest.activity.shape)
-        del state_dict['weights']
         return state_dict
 
 
@@ -704,57 +839,83 @@ class SparseCFProjection(CFProjection):
         """
 
         self.__dict__.update(state_dict)
-        self.weights = sparse.csarray_float(self.weight_shape[0],self.weight_shape[1])
-        rowInds, colInds, values = self.triplets
-        self.weights.setTriplets(rowInds,colInds,values)
-        del self.triplets
+        if self.sparse_backend not in sparse_backends:
+            self.warning("Sparse backend %s not available; using scipy instead." % self.sparse_backend)
+            self.sparse_backend = 'scipy'
+        self.weights = sparse_backends[self.sparse_backend].csarray_float(self.weight_shape[0],self.weight_shape[1])
+        if 'compressed_weights' in state_dict:
+            outerInds, innerInds, values = self.compressed_weights
+            self.weights.setCompressed(outerInds,_join_from_pickle(innerInds,np.int32),
+                                       _join_from_pickle(values,sparse_type))
+            del self.compressed_weights
+        else:
+            # Snapshots saved before compressed_weights was introduced
+            rowInds, colInds, values = self.triplets
+            self.weights.setTriplets(rowInds,colInds,values)
+            del self.triplets
         del self.weight_shape
 
 
+    def _new_weights(self):
+        """
+        Return a new, empty sparse weights matrix using the selected
+        sparse_backend.
+        """
+        return sparse_backends[self.sparse_backend].csarray_float(self.src.activity.shape,
+                                                                  self.dest.activity.shape)
+
+
     def _create_cfs(self):
         """
         Creates the CF objects, initializing the weights one by one
-        and adding them to the sparse weights object in chunks.
+        into a single buffer of (row,column,value) triplets, from
+        which the sparse weights object is then built in one step.
+
+        The buffer is sized from the number of nonzero elements of
+        each CF's mask, which bounds the number of nonzero weights
+        the weights_generator can produce.
         """
 
         vectorized_create_cf = simple_vectorize(self._create_cf)
         self.cfs = vectorized_create_cf(*self._generate_coords())
         self.flatcfs = list(self.cfs.flat)
-        self.weights = sparse.csarray_float(self.src.activity.shape,self.dest.activity.shape)
-
-        cf_x,cf_y = self.dest.activity.shape
-        src_x,src_y = self.src.activity.shape
-
-        y_array = np.zeros((src_x*src_y*cf_y),dtype=np.int32)
-        x_array = np.zeros((src_x*src_y*cf_y),dtype=np.int32)
-        val_array = np.zeros((src_x*src_y*cf_y),dtype=np.float32)
-
-        # Iterate over the CFs
-        for x in range(cf_x):
-            temp_sparse = sparse.csarray_float(self.src.activity.shape,self.dest.activity.shape)
-            idx = 0
-            for y in range(cf_y):
-                x1,x2,y1,y2 = self.cfs[x][y].input_sheet_slice.tolist()
-                if self.same_cf_shape_for_all_cfs:
-                    mask_template = self.mask_template
-                else:
-                    mask_template = _create_mask(self.cf_shape,self.bounds_template,
-                                                 self.src,self.autosize_mask,
-                                                 self.mask_threshold)
-                weights = self.cfs[x][y]._init_weights(mask_template)
-                cn_x,cn_y = weights.shape
-                y_val = x * cf_y + y
-                for cnx in range(cn_x):
-                    val_array[idx:idx+cn_y] = weights[cnx,:]
-                    x_val = (x1+cnx) * src_y + y1
-                    x_array[idx:idx+cn_y] = range(x_val,x_val+cn_y)
-                    y_array[idx:idx+cn_y] = y_val
-                    idx += cn_y
-            nnz_idx = val_array.nonzero()
-            temp_sparse.setTriplets(x_array[nnz_idx],y_array[nnz_idx],val_array[nnz_idx])
-            self.weights += temp_sparse
-            x_array *= 0; y_array *= 0; val_array *= 0.0
-        del temp_sparse
+
+        if self.same_cf_shape_for_all_cfs:
+            mask_templates = [self.mask_template]*len(self.flatcfs)
+        else:
+            mask_templates = [_create_mask(self.cf_shape,self.bounds_template,
+                                           self.src,self.autosize_mask,
+                                           self.mask_threshold)
+                              for cf in self.flatcfs]
+
+        nnz = sum([np.count_nonzero(cf.weights_slice.submatrix(mask_template))
+                   for cf,mask_template in zip(self.flatcfs,mask_templates)
+                   if cf is not None])
+        row_array = np.zeros(nnz,dtype=np.int32)
+        col_array = np.zeros(nnz,dtype=np.int32)
+        val_array = np.zeros(nnz,dtype=sparse_type)
+
+        src_y = self.src.activity.shape[1]
+        idx = 0
+        for cidx,(cf,mask_template) in enumerate(zip(self.flatcfs,mask_templates)):
+            if cf is None:
+                continue
+            weights = cf._init_weights(mask_template)
+            cnx,cny = weights.nonzero()
+            n = len(cnx)
+            # Only possible if the weights_generator ignored the mask
+            if idx+n > len(val_array):
+                size = max(2*len(val_array),idx+n)
+                row_array,col_array,val_array = [np.resize(a,size) for a in (row_array,col_array,val_array)]
+            x1,x2,y1,y2 = cf.input_sheet_slice.tolist()
+            row_array[idx:idx+n] = (x1+cnx) * src_y + y1+cny
+            col_array[idx:idx+n] = cidx
+            val_array[idx:idx+n] = weights[cnx,cny]
+            idx += n
+
+        self.weights = self._new_weights()
+        if idx > 0:
+            self.weights.setTriplets(row_array[:idx],col_array[:idx],val_array[:idx])
         self.weights.compress()
         self.apply_learn_output_fns()
         print self.name , "loaded"
@@ -817,6 +978,22 @@ class SparseCFProjection(CFProjection):
         return self.n_conns() * (3 * 4)
 
 
+    def memory_usage(self):
+        """
+        Extends Projection.memory_usage() with the sparse weights
+        (estimated as for n_bytes()) and the norm_total buffer.  The
+        SparseConnectionFields are all of the same size, so their
+        Python objects are estimated from the first one (if any).
+        """
+        usage = Projection.memory_usage(self)
+        usage['weights'] = self.n_bytes()
+        usage['buffers'] = self.norm_total.nbytes
+        usage['python'] += sys.getsizeof(self.flatcfs) + self.cfs.nbytes
+        if self.flatcfs:
+            usage['python'] += len(self.flatcfs)*object_bytes(self.flatcfs[0])
+        return usage
+
+
     def n_conns(self):
         """
         Returns number of nonzero weights.
@@ -824,7 +1001,31 @@ class SparseCFProjection(CFProjection):
         return self.weights.getnnz()
 
 
-if not use_sparse:
-    print "WARNING: Sparse component could not be imported, replacing SparseCFProjection with regular CFProjection"
-    def SparseCFProjection(*args, **kwargs): # pyflakes:ignore (optimized version provided)
-        return CFProjection(*args,**kwargs)
+def time_sparse_backends(src_shape=(100,100),dest_shape=(100,100),cf_size=15,iterations=10):
+    """
+    Return the time taken by each available sparse backend for
+    iterations steps of activation, Hebbian learning and
+    normalization of a randomly connected matrix from src_shape to
+    dest_shape, where each dest unit has cf_size*cf_size connections.
+    """
+    n_src = src_shape[0]*src_shape[1]
+    n_dest = dest_shape[0]*dest_shape[1]
+    rows = np.random.randint(0,n_src,n_dest*cf_size*cf_size).astype(np.int32)
+    cols = np.repeat(np.arange(n_dest,dtype=np.int32),cf_size*cf_size)
+    vals = np.random.rand(len(rows)).astype(sparse_type)
+    src_act = np.random.rand(*src_shape)
+    dest_act = np.random.rand(*dest_shape)
+    norm_total = np.zeros(dest_shape)
+
+    times = {}
+    for name,backend in sorted(sparse_backends.items()):
+        weights = backend.csarray_float(src_shape,dest_shape)
+        weights.setTriplets(rows,cols,vals)
+        weights.compress()
+        def step():
+            weights.DotProduct(1.0,src_act,dest_act)
+            norm_total[:] = 0.0
+            weights.Hebbian(src_act,dest_act,norm_total,0.0001)
+            weights.DivisiveNormalizeL1(norm_total)
+        times[name] = timeit.Timer(step).timeit(number=iterations)
+    return times
@@ -9,11 +9,19 @@ parameters/matchconditions for a sheet within a level, as well as
 parameters for projections.
 """
 
-import itertools
+import os
+import re
+import sys
+import types
+import marshal
+import hashlib
+import tempfile
+import multiprocessing
 
 from functools import wraps
 from collections import OrderedDict
 
+import numpy
 import param
 import lancet
 import topo
@@ -88,6 +96,327 @@ def order_projections(model, connection_order):
 
 
 
+# The ProjectionSpecs being instantiated by _generate_weights_in_parallel,
+# for the forked worker processes to look up by index.
+_parallel_specs = []
+
+
+def _parallelizable(spec):
+    """
+    Whether the weights of the projection specified by spec can be
+    generated in a separate process: only for CFProjections with
+    ordinary ConnectionFields that each own their weights.
+    """
+    from topo.base.cf import CFProjection, ConnectionField
+    from topo.projection import SharedWeightCFProjection
+    cf_type = spec.parameters.get('cf_type')
+    return (issubclass(spec.projection_type,CFProjection) and
+            not issubclass(spec.projection_type,SharedWeightCFProjection) and
+            isinstance(cf_type,type) and issubclass(cf_type,ConnectionField))
+
+
+def _weights_file(directory=None):
+    """
+    Return the name of a new, empty .npy file in directory (by
+    default, tempfile.gettempdir()).
+    """
+    handle,filename = tempfile.mkstemp(prefix='topo_weights_',suffix='.npy',dir=directory)
+    os.close(handle)
+    return filename
+
+
+def _save_weights(projection, filename):
+    """
+    Save the weights of all the projection's ConnectionFields,
+    concatenated in the order of flatcfs, to filename as a
+    memory-mapped .npy file.
+    """
+    weights = [cf.weights for cf in projection.flatcfs if cf is not None]
+    dtype = weights[0].dtype if weights else numpy.float32
+    buf = numpy.lib.format.open_memmap(filename,mode='w+',dtype=dtype,
+                                       shape=(sum(w.size for w in weights),))
+    offset = 0
+    for w in weights:
+        buf[offset:offset+w.size] = w.ravel()
+        offset += w.size
+    buf.flush()
+    del buf
+
+
+def _generate_weights(index, filename):
+    """
+    Instantiate the index'th ProjectionSpec in _parallel_specs (in a
+    forked worker process), and save its weights to filename (see
+    _save_weights).  Exits with a non-zero status if the projection
+    could not be instantiated, so that it is instantiated normally
+    (and any error reported) by the parent.
+
+    Because libgomp does not support fork, optimized components are
+    restricted to a single OpenMP thread in the worker.
+    """
+    spec = _parallel_specs[index]
+    try:
+        # libgomp's thread pool is not copied by fork, so an OpenMP
+        # parallel loop (e.g. in a weights output function) with more
+        # than one thread hangs in a child of a parent that has
+        # already run one.
+        from topo.misc.inlinec import set_openmp_threads
+        set_openmp_threads(1)
+        spec()
+        _save_weights(spec.resolve(),filename)
+    except Exception:
+        os._exit(1)
+
+
+def _generate_weights_in_parallel(specs, processes):
+    """
+    Generate the weights of each of the given ProjectionSpecs that
+    can be generated separately, using at most the given number of
+    worker processes at once.  Returns a list with the name of the
+    file containing each spec's weights (see _generate_weights), or
+    None for specs to be instantiated normally.
+
+    The workers are forked from this process after the sheets have
+    been instantiated, and each instantiates one projection
+    completely.  Because the random streams used by the weights
+    generators depend only on the simulation time and the name of
+    each CF (see CFProjection.hash_format), not on the order of
+    instantiation, the weights are identical to those generated by
+    instantiating the projections one after another.
+
+    A worker that fails (including one killed by a signal, e.g. if
+    the temporary directory fills up) is noticed as soon as it exits,
+    and its projection is then instantiated normally.
+    """
+    global _parallel_specs
+    results = [None]*len(specs)
+    indices = [i for i,spec in enumerate(specs) if spec is not None and _parallelizable(spec)]
+    if not indices:
+        return results
+
+    def finish(i, process):
+        process.join()
+        if process.exitcode != 0:
+            os.remove(results[i])
+            results[i] = None
+
+    _parallel_specs = specs
+    running = []
+    try:
+        for i in indices:
+            if len(running) >= processes:
+                finish(*running.pop(0))
+            results[i] = _weights_file()
+            process = multiprocessing.Process(target=_generate_weights,args=(i,results[i]))
+            process.start()
+            running.append((i,process))
+        while running:
+            finish(*running.pop(0))
+    finally:
+        for i,process in running:
+            process.terminate()
+            process.join()
+        _parallel_specs = []
+    return results
+
+
+def _instantiate_with_weights(spec, filename):
+    """
+    Instantiate the projection specified by spec, copying the weights
+    of its ConnectionFields from filename (as saved by _save_weights)
+    rather than generating them again.
+    """
+    from topo.base.patterngenerator import Constant
+
+    weights_generator = spec.parameters['weights_generator']
+    spec.parameters['weights_generator'] = Constant()
+    try:
+        spec()
+    finally:
+        spec.parameters['weights_generator'] = weights_generator
+
+    # As done by CFProjection.__init__ when generating the weights
+    weights_generator.set_dynamic_time_fn(None,sublistattr='generators')
+    projection = spec.resolve()
+    projection.weights_generator = weights_generator
+
+    weights = numpy.load(filename,mmap_mode='r')
+    offset = 0
+    for cf in projection.flatcfs:
+        if cf is not None:
+            cf.weights[...] = weights[offset:offset+cf.weights.size].reshape(cf.weights.shape)
+            offset += cf.weights.size
+    if offset != weights.size:
+        raise ValueError("Weights in %s do not match projection %s." % (filename,spec))
+    del weights
+
+
+# Parameters of a ProjectionSpec that do not affect the initial
+# weights, and so are not included in its _weights_cache_key().
+_weights_cache_ignored = ['learning_rate','learning_fn','response_fn','strength','delay',
+                          'output_fns','plastic','precedence','dest_port','src_port']
+
+def _sheet_geometry(sheet):
+    return (sheet.bounds.lbrt(),sheet.xdensity,sheet.ydensity,sheet.shape)
+
+
+def _add_source_files(obj, files):
+    """
+    Add to the set files the source files of the modules defining the
+    class or function obj (and, for a class, its base classes).
+    """
+    for o in getattr(obj,'__mro__',None) or [obj]:
+        path = getattr(sys.modules.get(getattr(o,'__module__',None)),'__file__',None)
+        if path is not None:
+            files.add(path[:-1] if path.endswith(('.pyc','.pyo')) else path)
+
+
+def _stable_repr(val, files, parents=()):
+    """
+    Return a representation of val (e.g. a parameter value) that is
+    the same in every run, unlike its script_repr when that includes
+    e.g. the repr of a function (which contains its address).  The
+    source files of the classes and functions used are added to the
+    set files.  Raises ValueError if val has no such representation.
+    """
+    if id(val) in parents:
+        raise ValueError("%r contains itself" % (val,))
+    parents = parents + (id(val),)
+    r = lambda v: _stable_repr(v,files,parents)
+
+    if val is None or isinstance(val,(bool,int,long,float,complex,basestring)):
+        return repr(val)
+    elif isinstance(val,type):
+        _add_source_files(val,files)
+        return (val.__module__,val.__name__)
+    elif isinstance(val,param.Parameterized):
+        _add_source_files(type(val),files)
+        return (r(type(val)),[(name,r(v)) for name,v in val.get_param_values()])
+    elif isinstance(val,types.FunctionType):
+        # The function's code, and the values it uses
+        _add_source_files(val,files)
+        code = val.func_code
+        used = sorted((name,val.func_globals[name]) for name in code.co_names
+                      if name in val.func_globals)
+        return (val.__module__,val.__name__,hashlib.sha1(marshal.dumps(code)).hexdigest(),
+                r(val.func_defaults),r([c.cell_contents for c in val.func_closure or []]),
+                r(used))
+    elif isinstance(val,(list,tuple)):
+        return (type(val).__name__,[r(v) for v in val])
+    elif isinstance(val,dict):
+        return ('dict',sorted((r(k),r(v)) for k,v in val.items()))
+    elif isinstance(val,numpy.ndarray):
+        return ('array',val.dtype.str,val.shape,hashlib.sha1(numpy.ascontiguousarray(val)).hexdigest())
+
+    representation = repr(val)
+    if not re.search(' at 0x[0-9a-fA-F]+',representation):
+        return representation
+    # Otherwise, represent the object by its class and pickled state
+    try:
+        reduced = val.__reduce_ex__(2)
+    except Exception:
+        raise ValueError("%s has no stable representation" % representation)
+    if isinstance(reduced,basestring):
+        return reduced
+    return (r(type(val)),r(reduced[1:3]))
+
+
+# Hashes of source files read by _source_hash
+_file_hashes = {}
+
+def _source_hash(files):
+    """Return a hash of the contents of the given source files."""
+    h = hashlib.sha1()
+    for path in sorted(files):
+        if path not in _file_hashes:
+            try:
+                with open(path,'rb') as f:
+                    _file_hashes[path] = hashlib.sha1(f.read()).hexdigest()
+            except IOError:
+                _file_hashes[path] = None
+        h.update("%s %s\n" % (path,_file_hashes[path]))
+    return h.hexdigest()
+
+
+def _weights_cache_key(spec):
+    """
+    Return a hash of everything that determines the initial weights
+    of the projection specified by spec: its type, the parameters
+    other than those in _weights_cache_ignored (including the weights
+    generator and its seeds), the names and geometry of its source
+    and destination sheets, the simulation time, and the source code
+    of the classes and functions involved (including this module).
+    The sheets must already have been instantiated.
+
+    Returns None if the weights cannot be cached, because some
+    parameter has no representation that is the same in every run.
+    """
+    files = set()
+    _add_source_files(_weights_cache_key,files)
+    try:
+        params = [(name,_stable_repr(val,files))
+                  for name,val in sorted(spec.parameters.items())
+                  if name not in _weights_cache_ignored]
+    except ValueError:
+        return None
+    _add_source_files(spec.projection_type,files)
+
+    src,dest = topo.sim[str(spec.src)],topo.sim[str(spec.dest)]
+    key = (spec.projection_type.__module__,spec.projection_type.__name__,params,
+           str(spec.src),_sheet_geometry(src),str(spec.dest),_sheet_geometry(dest),
+           str(topo.sim.time()),getattr(param,'random_seed',None),topo.version,
+           _source_hash(files))
+    return hashlib.sha1(repr(key)).hexdigest()
+
+
+
+class _PropertyIndex(object):
+    """
+    Index of a list of SheetSpecs by their property values, allowing
+    the SheetSpecs that satisfy some matchconditions (as tested by
+    Model._matchcondition_holds) to be found by lookup.
+
+    As for _matchcondition_holds, a SheetSpec satisfies a condition
+    key:value if it has no property key, or if the string of its
+    property value is contained in the string of value.  Each such
+    test is made once per distinct property value rather than once
+    per SheetSpec, and its result is cached.
+    """
+
+    def __init__(self, sheet_specs):
+        self._all = frozenset(xrange(len(sheet_specs)))
+        # property key -> {str(property value): set of SheetSpec indices}
+        self._buckets = {}
+        for i, sheet_spec in enumerate(sheet_specs):
+            for key, value in sheet_spec.properties.items():
+                self._buckets.setdefault(key, {}).setdefault(str(value), set()).add(i)
+        self._cache = {}
+
+
+    def _matching(self, key, value):
+        value = str(value)
+        matching = self._cache.get((key, value))
+        if matching is None:
+            excluded = [indices for (string, indices) in self._buckets.get(key, {}).items()
+                        if string not in value]
+            matching = self._cache[(key, value)] = self._all.difference(*excluded)
+        return matching
+
+
+    def matches(self, matchconditions):
+        """
+        Return the indices of the SheetSpecs satisfying all the given
+        matchconditions, in increasing order.
+        """
+        if matchconditions is None:
+            return []
+        matching = self._all
+        for key, value in matchconditions.items():
+            matching = matching & self._matching(key, value)
+        return sorted(matching)
+
+
+
 class Specification(object):
     """
     Specifications are templates for sheet or projection objects which
@@ -381,6 +710,26 @@ class Model(param.Parameterized):
     """
     __abstract = True
 
+    construction_processes = param.Integer(default=1,bounds=(1,None),doc="""
+        Number of processes to use for generating the initial weights
+        of the projections when the model is instantiated.  If greater
+        than 1 (and processes can be forked), the weights of each
+        CFProjection are generated in a separate worker process, and
+        copied into the projection via a memory-mapped temporary file.  The weights are
+        identical to those generated serially, but only if the random
+        streams are time_dependent; otherwise, construction is serial.""")
+
+    weights_cache = param.String(default=None,allow_None=True,doc="""
+        If not None, the directory of an on-disk cache of the initial
+        weights of CFProjections, shared between runs (e.g. those of a
+        parameter sweep with run_batch).  Weights are stored under a
+        hash of everything that determines them (see
+        _weights_cache_key), so that runs differing only in e.g.
+        learning rates map the previously generated weights instead of
+        generating them again.  Relative paths are relative to the
+        current directory.  Only used if the random streams are
+        time_dependent.""")
+
     matchconditions = MatchConditions()
 
     sheet_decorators = set()
@@ -616,39 +965,47 @@ class Model(param.Parameterized):
 
     def _compute_projection_specs(self):
         """
-        Loop through all possible combinations of SheetSpec objects in
-        self.sheets If the src_sheet fulfills all criteria specified
+        For all possible combinations of SheetSpec objects in
+        self.sheets, if the src_sheet fulfills all criteria specified
         in dest_sheet.matchconditions, create a new ProjectionSpec
         object and add this item to self.projections.
-        """
-        sheetspec_product = itertools.product(self.sheets.path_items.values(),
-                                              self.sheets.path_items.values())
-        for src_sheet, dest_sheet in sheetspec_product:
-
-            has_matchcondition = (dest_sheet.level in self.matchconditions)
-            conditions = (self.matchconditions.compute_conditions(
-                          dest_sheet.level, self,dest_sheet.properties)
-                          if has_matchcondition else {})
 
+        Rather than testing every combination with
+        _matchcondition_holds, the matchconditions of each dest_sheet
+        are computed once and resolved by lookup in a _PropertyIndex
+        of the SheetSpecs; the ProjectionSpecs are then created in the
+        same order as by looping over all (src_sheet, dest_sheet)
+        combinations.
+        """
+        sheet_specs = self.sheets.path_items.values()
+        index = _PropertyIndex(sheet_specs)
+
+        # For each src_sheet, the (dest_sheet, matchname) pairs it matches
+        matches = [[] for _ in sheet_specs]
+        for dest_sheet in sheet_specs:
+            if dest_sheet.level not in self.matchconditions:
+                continue
+            conditions = self.matchconditions.compute_conditions(
+                dest_sheet.level, self, dest_sheet.properties)
             for matchname, matchconditions in conditions.items():
-
-                if self._matchcondition_holds(matchconditions, src_sheet):
+                for i in index.matches(matchconditions):
+                    matches[i].append((dest_sheet, matchname))
+
+        for src_sheet, src_matches in zip(sheet_specs, matches):
+            for dest_sheet, matchname in src_matches:
+                paramsets = self.projection_labels[matchname](self, src_sheet.properties,
+                                                              dest_sheet.properties)
+                paramsets = [paramsets] if isinstance(paramsets, dict) else paramsets
+                for paramset in paramsets:
                     proj = ProjectionSpec(self.projection_types[matchname],
                                           src_sheet, dest_sheet)
+                    proj.update(**paramset)
+                    # Only used when time_dependent=False
+                    # (which is to be deprecated)
+                    proj.matchname = matchname
 
-                    paramsets = self.projection_labels[matchname](self, src_sheet.properties,
-                                                                  dest_sheet.properties)
-                    paramsets = [paramsets] if isinstance(paramsets, dict) else paramsets
-                    for paramset in paramsets:
-                        proj = ProjectionSpec(self.projection_types[matchname],
-                                              src_sheet, dest_sheet)
-                        proj.update(**paramset)
-                        # Only used when time_dependent=False
-                        # (which is to be deprecated)
-                        proj.matchname = matchname
-
-                        path = (str(dest_sheet), paramset['name'])
-                        self.projections.set_path(path, proj)
+                    path = (str(dest_sheet), paramset['name'])
+                    self.projections.set_path(path, proj)
 
 
     def __call__(self,instantiate_options=True, verbose=False):
@@ -677,10 +1034,73 @@ class Model(param.Parameterized):
                 sheet_spec()
 
         if 'projections' in instantiate_options:
-            for proj in sorted(self.projections):
-                msglevel('Match: ' + proj.matchname + ': Connection ' + str(proj.src) + \
-                             '->' + str(proj.dest) + ' ' + proj.parameters['name'])
-                proj()
+            projections = sorted(self.projections)
+            cache_files = self._weights_cache_files(projections)
+            cached = [f if f is not None and os.path.exists(f) else None for f in cache_files]
+
+            weights = [None]*len(projections)
+            if self.construction_processes > 1:
+                if not numbergen.TimeAware.time_dependent:
+                    self.warning("Instantiating projections serially, as weights "
+                                 "generated in parallel would differ unless time_dependent=True.")
+                elif not hasattr(os,'fork'):
+                    self.warning("Instantiating projections serially, as processes cannot be forked.")
+                else:
+                    weights = _generate_weights_in_parallel(
+                        [None if c else spec for spec,c in zip(projections,cached)],
+                        self.construction_processes)
+
+            try:
+                for proj,filename,cached_file,cache_file in zip(projections,weights,
+                                                               cached,cache_files):
+                    msglevel('Match: ' + proj.matchname + ': Connection ' + str(proj.src) + \
+                                 '->' + str(proj.dest) + ' ' + proj.parameters['name'])
+                    if cached_file is not None:
+                        msglevel('Using cached weights from ' + cached_file)
+                        _instantiate_with_weights(proj,cached_file)
+                        continue
+                    elif filename is None:
+                        proj()
+                    else:
+                        _instantiate_with_weights(proj,filename)
+
+                    if cache_file is not None:
+                        # Written under a temporary name and then renamed,
+                        # so that concurrent runs never see a partial file.
+                        tmp = _weights_file(os.path.dirname(cache_file))
+                        _save_weights(proj.resolve(),tmp)
+                        os.rename(tmp,cache_file)
+            finally:
+                for filename in weights:
+                    if filename is not None and os.path.exists(filename):
+                        os.remove(filename)
+
+
+    def _weights_cache_files(self, projections):
+        """
+        Return the weights_cache file for each of the given
+        ProjectionSpecs, or None for those whose weights are not
+        cached.
+        """
+        if self.weights_cache is None:
+            return [None]*len(projections)
+        if not numbergen.TimeAware.time_dependent:
+            self.warning("Not using weights_cache, as the weights depend on the order "
+                         "of instantiation unless time_dependent=True.")
+            return [None]*len(projections)
+
+        directory = os.path.abspath(os.path.expanduser(self.weights_cache))
+        if not os.path.isdir(directory):
+            try: os.makedirs(directory)
+            except OSError: pass   # Created simultaneously by another run
+        files = []
+        for spec in projections:
+            key = _weights_cache_key(spec) if _parallelizable(spec) else None
+            if key is None and _parallelizable(spec):
+                self.warning("Not caching the weights of %s, as its parameters differ "
+                             "between runs." % spec)
+            files.append(None if key is None else os.path.join(directory,key+'.npy'))
+        return files
 
     def summary(self, printed=True):
 
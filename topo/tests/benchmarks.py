@@ -0,0 +1,351 @@
+"""
+Benchmarks of the bundled models, with results tracked over time.
+
+Unlike the speed tests in test_script.py, which store one timing per
+script, each benchmark here records a breakdown of where the time
+goes for a model at several densities:
+
+ :'startup': seconds to import Topographica in a new process
+ :'construction': seconds to construct the model (execute the script)
+ :'iterations_per_second': simulation iterations per second
+ :'measurement': seconds to measure the model's maps (if any)
+ :'snapshot_save', 'snapshot_load': seconds to save and load a snapshot
+ :'snapshot_bytes': size of the snapshot
+ :'peak_rss': peak resident set size of the process, in bytes
+
+Each model and density is run in a separate process, so that the
+startup time and peak RSS of one do not depend on the others.  The
+results of each run are saved in JSON format, along with the commit
+and machine they were generated on, to
+MACHINETESTSDATADIR/benchmarks/, and compared against a baseline
+file in the same directory.  A metric counts as a regression if it
+is worse than in the baseline by more than its fraction in the
+thresholds dictionary (DEFAULT_THRESHOLDS, if not specified).
+
+E.g. to run all the benchmarks and compare them with the baseline:
+
+$ ./topographica -c "from topo.tests.benchmarks import run_benchmarks; run_benchmarks()"
+
+or to run only one of them, at one density:
+
+$ ./topographica -c "from topo.tests.benchmarks import run_benchmarks; run_benchmarks(['gcal_od'],densities=[24])"
+
+If there is no baseline yet, the results are saved as the baseline;
+to make the latest results the new baseline, call
+run_benchmarks(update_baseline=True).
+"""
+
+import __main__
+import os
+import sys
+import json
+import time
+import socket
+import platform
+import resource
+import tempfile
+import shutil
+import subprocess
+from collections import OrderedDict
+
+import param
+from param import normalize_path, resolve_path
+
+import topo
+
+
+TOPOGRAPHICAHOME = param.normalize_path.prefix
+BENCHMARKSDATADIR = os.path.join(TOPOGRAPHICAHOME,"tests",socket.gethostname(),"benchmarks")
+BASELINE_FILENAME = "baseline.json"
+
+
+# For each benchmark, the script to execute (or the name of a function
+# in this module that constructs the model), the cortex densities at
+# which to run it, the number of iterations to time, and the
+# plotgroups to measure.
+BENCHMARKS = OrderedDict()
+BENCHMARKS['lissom_oo_or'] = dict(script="models/lissom_oo_or.ty",densities=[24,48],
+                                  iterations=100,measure=[])
+BENCHMARKS['gcal_od'] = dict(script="models/gcal_od.ty",densities=[24,48],
+                             iterations=100,measure=[])
+BENCHMARKS['gcal_jn13'] = dict(script="models/stevens.jn13/gcal.ty",densities=[24,48],
+                               iterations=100,measure=[])
+BENCHMARKS['sparse'] = dict(script="_sparse_model",densities=[24,48],
+                            iterations=100,measure=[])
+BENCHMARKS['map_measurement'] = dict(script="models/lissom_oo_or.ty",densities=[8,24],
+                                     iterations=10,measure=['Orientation Preference'])
+
+
+# Fractional increase (or, for iterations_per_second, decrease) in
+# each metric that counts as a regression.
+DEFAULT_THRESHOLDS = {'startup':0.25,
+                      'construction':0.25,
+                      'iterations_per_second':0.10,
+                      'measurement':0.25,
+                      'snapshot_save':0.25,
+                      'snapshot_load':0.25,
+                      'snapshot_bytes':0.10,
+                      'peak_rss':0.10}
+
+# Metrics for which a larger value is better.
+HIGHER_IS_BETTER = ('iterations_per_second',)
+
+
+
+######################################################################################
+### Models without a script
+
+def _sparse_model(cortex_density=48.0,retina_density=24.0,area=1.0):
+    """
+    Construct a simple model with SparseCFProjections: a retina
+    presenting oriented Gaussians, connected to a V1 with afferent
+    and lateral excitatory and inhibitory sparse projections.
+    """
+    import numbergen
+    from math import pi
+    from topo import pattern, sheet, transferfn
+    from topo.base.boundingregion import BoundingBox
+    from topo.sparse.sparsecf import SparseCFProjection
+
+    inputs = pattern.Gaussian(x=numbergen.UniformRandom(lbound=-area/2.0,ubound=area/2.0,seed=12),
+                              y=numbergen.UniformRandom(lbound=-area/2.0,ubound=area/2.0,seed=34),
+                              orientation=numbergen.UniformRandom(lbound=-pi,ubound=pi,seed=56),
+                              size=0.088388,aspect_ratio=4.66667,scale=1.0)
+
+    topo.sim['Retina'] = sheet.GeneratorSheet(nominal_density=retina_density,
+        input_generator=inputs,period=1.0,phase=0.05,
+        nominal_bounds=BoundingBox(radius=area/2.0+0.25))
+
+    topo.sim['V1'] = sheet.SettlingCFSheet(nominal_density=cortex_density,
+        nominal_bounds=BoundingBox(radius=area/2.0),tsettle=9,
+        output_fns=[transferfn.PiecewiseLinear(lower_bound=0.083,upper_bound=0.633)])
+
+    topo.sim.connect('Retina','V1',delay=0.05,strength=1.0,name='Afferent',
+                     connection_type=SparseCFProjection,learning_rate=0.9590,
+                     nominal_bounds_template=BoundingBox(radius=0.27083),
+                     weights_generator=pattern.random.GaussianCloud(gaussian_size=2*0.27083))
+
+    topo.sim.connect('V1','V1',delay=0.05,strength=0.9,name='LateralExcitatory',
+                     connection_type=SparseCFProjection,learning_rate=2.55528,
+                     nominal_bounds_template=BoundingBox(radius=0.10417),
+                     weights_generator=pattern.random.GaussianCloud(gaussian_size=2*0.10417))
+
+    topo.sim.connect('V1','V1',delay=0.05,strength=-0.9,name='LateralInhibitory',
+                     connection_type=SparseCFProjection,learning_rate=1.80873,
+                     nominal_bounds_template=BoundingBox(radius=0.22917),
+                     weights_generator=pattern.random.GaussianCloud(gaussian_size=2*0.22917))
+
+
+
+######################################################################################
+### Running one benchmark (in its own process)
+
+def _peak_rss():
+    """Return the peak resident set size of this process, in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on OS X, but kilobytes elsewhere
+    return peak if sys.platform=='darwin' else peak*1024
+
+
+def _timed(fn, *args):
+    start = time.time()
+    fn(*args)
+    return time.time()-start
+
+
+def _measure(name, density, iterations, startup, results_file):
+    """
+    Construct, run, measure and snapshot the named benchmark's model
+    at the given cortex density, saving the metrics to results_file.
+    """
+    from topo.command import save_snapshot, load_snapshot
+
+    benchmark = BENCHMARKS[name]
+    script = benchmark['script']
+    metrics = OrderedDict(startup=startup)
+
+    if script in globals():
+        metrics['construction'] = _timed(globals()[script],density)
+    else:
+        __main__.__dict__['cortex_density'] = density
+        metrics['construction'] = _timed(execfile,resolve_path(script),__main__.__dict__)
+
+    topo.sim.run(1) # ensure compilations etc happen outside timing
+    metrics['iterations_per_second'] = iterations/_timed(topo.sim.run,iterations)
+
+    if benchmark['measure']:
+        from topo.plotting.plotgroup import plotgroups
+        import topo.command.analysis # pyflakes:ignore (registers the plotgroups)
+        metrics['measurement'] = sum(_timed(plotgroups[plotgroup]._exec_pre_plot_hooks)
+                                     for plotgroup in benchmark['measure'])
+
+    snapshot_dir = tempfile.mkdtemp()
+    try:
+        snapshot = os.path.join(snapshot_dir,name+".typ")
+        metrics['snapshot_save'] = _timed(save_snapshot,snapshot)
+        metrics['snapshot_bytes'] = os.path.getsize(snapshot)
+        metrics['snapshot_load'] = _timed(load_snapshot,snapshot)
+    finally:
+        shutil.rmtree(snapshot_dir)
+
+    metrics['peak_rss'] = _peak_rss()
+
+    with open(results_file,'w') as f:
+        json.dump(metrics,f)
+
+
+# Executed in a new Python process, so that startup includes the
+# import of Topographica.
+_benchmark_command = """
+import time
+start = time.time()
+import topo, topo.command
+startup = time.time()-start
+from topo.tests.benchmarks import _measure
+_measure(%(name)r,%(density)r,%(iterations)r,startup,%(results_file)r)
+"""
+
+def run_benchmark(name, density, iterations=None):
+    """
+    Run the named benchmark in a new process at the given cortex
+    density, returning its metrics (or None if it failed).
+    """
+    iterations = iterations or BENCHMARKS[name]['iterations']
+    print "Running benchmark %s (cortex_density=%s, %s iterations)"%(name,density,iterations)
+
+    handle,results_file = tempfile.mkstemp(suffix=".json")
+    os.close(handle)
+    try:
+        command = _benchmark_command%dict(name=name,density=density,iterations=iterations,
+                                          results_file=results_file)
+        # the new process must be able to import this copy of topo
+        env = dict(os.environ)
+        topo_path = os.path.dirname(os.path.dirname(os.path.abspath(topo.__file__)))
+        env['PYTHONPATH'] = os.pathsep.join(p for p in (topo_path,env.get('PYTHONPATH')) if p)
+        if subprocess.call([sys.executable,"-c",command],env=env)!=0:
+            print "Benchmark %s (cortex_density=%s) failed."%(name,density)
+            return None
+        with open(results_file) as f:
+            return json.load(f,object_pairs_hook=OrderedDict)
+    finally:
+        os.remove(results_file)
+
+
+
+######################################################################################
+### Results, baselines and comparison
+
+def machine_info():
+    """Return a dictionary describing the machine and Python in use."""
+    try:
+        import multiprocessing
+        cpus = multiprocessing.cpu_count()
+    except NotImplementedError:
+        cpus = None
+    return OrderedDict([('hostname',socket.gethostname()),
+                        ('platform',platform.platform()),
+                        ('processor',platform.processor() or platform.machine()),
+                        ('cpus',cpus),
+                        ('python',platform.python_version())])
+
+
+def _key(result):
+    return (result['benchmark'],result['density'])
+
+
+def compare_benchmarks(results, baseline, thresholds=None):
+    """
+    Compare the metrics in results with those in baseline (both as
+    returned by run_benchmarks), printing the change in each metric
+    and returning a list of (benchmark, density, metric, old value,
+    new value) for each metric that regressed by more than its
+    threshold.
+
+    Any metric missing from thresholds uses DEFAULT_THRESHOLDS.
+    """
+    limits = dict(DEFAULT_THRESHOLDS,**(thresholds or {}))
+    old_results = dict((_key(r),r['metrics']) for r in baseline['results'])
+
+    regressions = []
+    for result in results['results']:
+        old_metrics = old_results.get(_key(result))
+        if old_metrics is None:
+            continue
+        for metric,new in result['metrics'].items():
+            old = old_metrics.get(metric)
+            if not old or metric not in limits:
+                continue
+            change = (new-old)/float(old)
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            regressed = worse>limits[metric]
+            print "[%s density=%s] %-22s Before: %12.4g  Now: %12.4g  (%+.1f percent)%s"%\
+                  (result['benchmark'],result['density'],metric,old,new,100*change,
+                   "  REGRESSION" if regressed else "")
+            if regressed:
+                regressions.append((result['benchmark'],result['density'],metric,old,new))
+    return regressions
+
+
+def run_benchmarks(names=None, densities=None, iterations=None, thresholds=None,
+                   baseline=None, update_baseline=False):
+    """
+    Run the named benchmarks (all of BENCHMARKS by default) at the
+    given densities (each benchmark's own by default), save the
+    results, and compare them with the baseline.
+
+    The results are saved to a time-stamped file in BENCHMARKSDATADIR,
+    so that a history of results accumulates.  The baseline defaults
+    to BENCHMARKSDATADIR/BASELINE_FILENAME, which is created from the
+    results if it does not exist or if update_baseline is True.
+
+    Returns the number of regressions (and failed benchmarks), so
+    that it can be used as an exit status.
+    """
+    names = names or BENCHMARKS.keys()
+
+    results = OrderedDict([('commit',topo.commit),
+                           ('version',list(topo.version)),
+                           ('machine',machine_info()),
+                           ('date',time.strftime("%Y-%m-%dT%H:%M:%S")),
+                           ('results',[])])
+    failures = 0
+    for name in names:
+        for density in densities or BENCHMARKS[name]['densities']:
+            metrics = run_benchmark(name,density,iterations)
+            if metrics is None:
+                failures += 1
+            else:
+                results['results'].append(OrderedDict([('benchmark',name),('density',density),
+                                                       ('metrics',metrics)]))
+
+    if not os.path.exists(BENCHMARKSDATADIR):
+        os.makedirs(BENCHMARKSDATADIR)
+    results_file = os.path.join(BENCHMARKSDATADIR,"%s_%s.json"%(time.strftime("%Y%m%d-%H%M%S"),
+                                                               topo.commit))
+    save_results(results,results_file)
+    print "Saved results to %s"%results_file
+
+    baseline_file = normalize_path(baseline) if baseline else \
+                    os.path.join(BENCHMARKSDATADIR,BASELINE_FILENAME)
+    if update_baseline or not os.path.exists(baseline_file):
+        save_results(results,baseline_file)
+        print "Saved results as baseline %s"%baseline_file
+        return failures
+
+    baseline_results = load_results(baseline_file)
+    print "Comparing with baseline %s (commit %s on %s)"%\
+          (baseline_file,baseline_results['commit'],baseline_results['machine']['hostname'])
+    regressions = compare_benchmarks(results,baseline_results,thresholds)
+    if regressions:
+        print "%d metric(s) regressed by more than their threshold."%len(regressions)
+    return failures+len(regressions)
+
+
+def save_results(results, path):
+    with open(path,'w') as f:
+        json.dump(results,f,indent=1)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f,object_pairs_hook=OrderedDict)
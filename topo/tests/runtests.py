@@ -163,6 +163,10 @@ for script in STARTUPSPEEDSCRIPTS:
     speedtarget['startupspeedtests'].append(topographica_script +  ''' -c "from topo.tests.test_script import compare_startup_speed_data;compare_startup_speed_data(script=%(script_path)s)"'''%dict(script_path=repr(script_path)))
 
 
+# benchmarks of the bundled models, tracked over time (see benchmarks.py)
+speedtarget['benchmarks'] = [topographica_script + ''' -c "from topo.tests.benchmarks import run_benchmarks; import sys; sys.exit(run_benchmarks())"''']
+
+
 
 ##### snapshot-tests
 target['snapshots'] = []
@@ -227,6 +231,9 @@ target['gui'].append(topographica_script + ' -g -c "from topo.tests.gui_tests im
 target['batch'] = []
 target['batch'].append(topographica_script + ' -c "from topo.tests.test_script import test_runbatch; test_runbatch()"')
 
+target['startup'] = []
+target['startup'].append(topographica_script + ' -c "from topo.tests.test_script import test_startup_time; test_startup_time()"')
+
 
 # CEBALERT: should use lissom.ty and test more map types
 # pass a list of plotgroup names to test() instead of plotgroups_to_test to restrict the tests
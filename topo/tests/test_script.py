@@ -657,6 +657,50 @@ def test_runbatch():
     print "Deleting %s"%param.normalize_path.prefix
     shutil.rmtree(param.normalize_path.prefix)
     param.normalize_path.prefix=original_output_path
+
+
+# Modules that should only be imported when first used, not when
+# Topographica starts (whether interactively or in batch mode)
+LAZY_MODULES = ['matplotlib','IPython','Tkinter','lancet','featuremapper',
+                'topo.plotting','topo.analysis','topo.tkgui']
+
+# Startup commands, and the time (in seconds) each may take
+STARTUP_BUDGETS = [("pass",3.0),
+                   ("from topo.command import run_batch",4.0)]
+
+def _time_startup(command,repeats=3):
+    """
+    Return the shortest of repeats wall-clock times taken by a new
+    Topographica process running command, and the lazy modules that
+    process had imported by the end.
+    """
+    import subprocess, sys, time
+    topographica = os.path.join(topo._root_path,"topographica")
+    check = "import sys; print [m for m in %r if m in sys.modules]"%LAZY_MODULES
+    times = []
+    for i in range(repeats):
+        start = time.time()
+        output = subprocess.check_output([sys.executable,topographica,"-c",command,"-c",check])
+        times.append(time.time()-start)
+    return min(times),eval(output.strip().splitlines()[-1])
+
+
+@nottest
+def test_startup_time(budgets=STARTUP_BUDGETS):
+    """
+    Check that starting Topographica interactively (-c 'pass') and in
+    batch mode (importing run_batch) stays within the time budgets,
+    and does not import any of the LAZY_MODULES.
+    """
+    failures = []
+    for command,budget in budgets:
+        seconds,imported = _time_startup(command)
+        print "%-40s %6.2fs (budget %.2fs)"%(command,seconds,budget)
+        if seconds>budget:
+            failures.append("'%s' took %.2fs; budget is %.2fs"%(command,seconds,budget))
+        if imported:
+            failures.append("'%s' imported %s"%(command,", ".join(imported)))
+    assert not failures, "\n".join(failures)
 ###########################################################################
 
 
@@ -0,0 +1,96 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import numpy
+
+from topo.misc.asyncanalysis import AnalysisWorkers, fork_available
+
+
+results = []
+
+def _succeed():
+    print "analysed"
+
+def _fail():
+    raise ValueError("analysis failed")
+
+def _modify():
+    results.append(1)
+
+def _openmp_loop():
+    from topo.misc.inlinec import inline, c_decorators
+    x = numpy.zeros(1000)
+    code = """
+        %(cfs_loop_pragma)s
+        for (int i=0; i<1000; ++i) {
+            x[i] = i;
+        }
+    """ % c_decorators
+    inline(code,['x'],local_dict=locals())
+    assert x[999] == 999
+
+
+class TestAnalysisWorkers(unittest.TestCase):
+
+    def setUp(self):
+        if not fork_available():
+            from nose.plugins.skip import SkipTest
+            raise SkipTest("os.fork not available")
+        self.tmpdir = tempfile.mkdtemp()
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        shutil.rmtree(self.tmpdir)
+
+    def test_output_collected(self):
+        workers = AnalysisWorkers(2,self.tmpdir)
+        workers.start(_succeed,'at time 1')
+        workers.start(_succeed,'at time 2')
+        workers.join()
+        output = sys.stdout.getvalue()
+        self.assertEqual(output.count("analysed"),2)
+        self.assertTrue(output.index("time 1") < output.index("time 2"))
+        self.assertEqual(workers.errors,0)
+        self.assertEqual(os.listdir(self.tmpdir),[])
+
+    def test_errors_counted(self):
+        workers = AnalysisWorkers(1,self.tmpdir)
+        workers.start(_fail,'at time 1')
+        workers.start(_succeed,'at time 2')
+        workers.join()
+        self.assertEqual(workers.errors,1)
+        self.assertTrue("analysis failed" in sys.stdout.getvalue())
+
+    def test_parent_state_unchanged(self):
+        workers = AnalysisWorkers(1,self.tmpdir)
+        workers.start(_modify)
+        workers.join()
+        self.assertEqual(results,[])
+
+    def test_openmp_after_fork(self):
+        from topo.misc import inlinec
+        if not (inlinec.optimized and inlinec.c_decorators['cfs_loop_pragma']):
+            from nose.plugins.skip import SkipTest
+            raise SkipTest("OpenMP not enabled")
+        _openmp_loop() # start libgomp's threads in the parent
+        workers = AnalysisWorkers(1,self.tmpdir)
+        workers.start(_openmp_loop)
+        process = workers.running[0][0]
+        process.join(60)
+        hung = process.is_alive()
+        if hung:
+            process.terminate()
+        workers.join()
+        self.assertFalse(hung)
+        self.assertEqual(workers.errors,0)
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
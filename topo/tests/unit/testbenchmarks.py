@@ -0,0 +1,37 @@
+import unittest
+
+from topo.tests.benchmarks import compare_benchmarks
+
+
+def _results(**metrics):
+    return {'results':[{'benchmark':'gcal_od','density':24,'metrics':metrics}]}
+
+
+class TestCompareBenchmarks(unittest.TestCase):
+
+    def setUp(self):
+        self.baseline = _results(construction=2.0,iterations_per_second=10.0,peak_rss=1000)
+
+    def test_no_regressions(self):
+        results = _results(construction=2.1,iterations_per_second=11.0,peak_rss=1000)
+        self.assertEqual(compare_benchmarks(results,self.baseline),[])
+
+    def test_regressions(self):
+        results = _results(construction=3.0,iterations_per_second=8.0,peak_rss=1000)
+        regressions = compare_benchmarks(results,self.baseline)
+        self.assertEqual(sorted(r[2] for r in regressions),['construction','iterations_per_second'])
+
+    def test_thresholds(self):
+        results = _results(construction=3.0,iterations_per_second=8.0,peak_rss=1000)
+        regressions = compare_benchmarks(results,self.baseline,
+                                         thresholds={'construction':1.0,'iterations_per_second':0.5})
+        self.assertEqual(regressions,[])
+
+    def test_new_benchmark(self):
+        results = {'results':[{'benchmark':'sparse','density':24,'metrics':{'construction':5.0}}]}
+        self.assertEqual(compare_benchmarks(results,self.baseline),[])
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
@@ -12,7 +12,7 @@ classes.
 
 import topo
 from topo.plotting.bitmap import *
-from topo.plotting.bitmap import hsv_to_rgb
+from topo.plotting.bitmap import hsv_to_rgb, hsv_to_rgb_arrays
 import Image
 import numpy as np
 import unittest
@@ -69,6 +69,15 @@ class TestBitmap(unittest.TestCase):
         self.assertEqual(b,0.01)
 
 
+    def test_hsv_to_rgb_arrays(self):
+        h = np.array([[0.0,0.1,0.35],[0.5,0.8,1.0]])
+        s = np.array([[0.0,0.5,1.0],[0.3,0.9,1.0]])
+        v = np.array([[0.5,0.2,1.0],[0.7,0.4,0.9]])
+        r,g,b = hsv_to_rgb_arrays(h,s,v)
+        for i in range(h.shape[0]):
+            for j in range(h.shape[1]):
+                self.assertEqual((r[i,j],g[i,j],b[i,j]),hsv_to_rgb(h[i,j],s[i,j],v[i,j]))
+
 
     def test_RGBBitmap(self):
         rgb = RGBBitmap(self.ra,self.ga,self.ba)
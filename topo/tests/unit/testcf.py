@@ -67,6 +67,23 @@ class TestCFIter(unittest.TestCase):
             self.failUnless(cf is proj.flatcfs[24])
         self.failUnlessEqual(total,1)
 
+
+    def test_unit_indices_skip_inactive(self):
+        """
+        Test that only active units are listed when skipping inactive units,
+        and that the list is shared while the sheet is learning
+        """
+        dest = self.sim['Dest']
+        proj = dest.projections()['SrcToDest']
+        dest.activity.flat[[3,57]] = 1.0
+        iterator = self.iter_type(proj,active_units_mask=True)
+        self.failUnlessEqual(list(iterator.get_unit_indices()),[3,57])
+        self.failUnlessEqual(len(iterator.get_unit_indices(skip_inactive=False)),100)
+
+        dest._unit_indices_cache = {}
+        indices = iterator.get_unit_indices()
+        self.failUnless(self.iter_type(proj,active_units_mask=True).get_unit_indices() is indices)
+
 if __name__ == "__main__":
 	import nose
 	nose.runmodule()
\ No newline at end of file
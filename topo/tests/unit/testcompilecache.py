@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from topo.misc import compilecache
+
+
+class TestCompileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.saved = (compilecache.kernel_cache_dir,compilecache.compile_kernels,
+                      compilecache.precompiling,list(compilecache._missing))
+        compilecache.kernel_cache_dir = os.path.join(self.tmpdir,'cache')
+        compilecache.compile_kernels = False
+        compilecache.precompiling = False
+        compilecache._manifest = None
+        compilecache._available = None
+        compilecache._code_keys.clear()
+        compilecache._compiled_code.clear()
+        self.source = os.path.join(self.tmpdir,'kernel.py')
+        with open(self.source,'w') as f:
+            f.write("x = 1\n")
+
+    def tearDown(self):
+        (compilecache.kernel_cache_dir,compilecache.compile_kernels,
+         compilecache.precompiling,compilecache._missing[:]) = self.saved
+        compilecache._manifest = None
+        compilecache._available = None
+        compilecache._code_keys.clear()
+        compilecache._compiled_code.clear()
+        shutil.rmtree(self.tmpdir)
+
+    def test_versioned_directory(self):
+        path = compilecache.directory()
+        self.assertTrue(os.path.isdir(path))
+        self.assertEqual(os.path.basename(path),compilecache.version())
+
+    def test_missing_until_precompiled(self):
+        self.assertFalse(compilecache.weave_module_compiled(self.source))
+        self.assertTrue(compilecache._source_name(self.source) in compilecache.missing())
+
+        compilecache.precompiling = True
+        self.assertTrue(compilecache.weave_module_compiled(self.source))
+        compilecache.precompiling = False
+        compilecache._manifest = None # as in a new process
+        self.assertTrue(compilecache.weave_module_compiled(self.source))
+
+        # Changing the source makes it missing again
+        with open(self.source,'w') as f:
+            f.write("x = 2\n")
+        self.assertFalse(compilecache.weave_module_compiled(self.source))
+
+    def test_compile_kernels(self):
+        compilecache.compile_kernels = True
+        self.assertTrue(compilecache.weave_module_compiled(self.source))
+        # Reported, although it will be compiled on first use
+        self.assertTrue(compilecache._source_name(self.source) in compilecache.missing())
+        self.assertFalse(compilecache.weave_compiler_available())
+        self.assertTrue('weave' in compilecache.missing())
+        compilecache.test_compiler(lambda code: None)
+        compilecache._manifest = None
+        self.assertTrue(compilecache.weave_compiler_available())
+
+    def test_weave_inline_records_code(self):
+        calls = []
+        def inline(code,*args,**kw):
+            calls.append(code)
+        compilecache.weave_inline(inline,'double x=0.0;')
+        compilecache._manifest = None
+        self.assertEqual(len(compilecache.manifest()['weave_code']),1)
+        compilecache.weave_inline(inline,'double x=0.0;')
+        self.assertEqual(calls,['double x=0.0;']*2)
+        self.assertEqual(len(compilecache.manifest()['weave_code']),1)
+
+    def test_weave_inline_checks_manifest_once(self):
+        inline = lambda code,*args,**kw: None
+        compilecache.weave_inline(inline,'double x=0.0;')
+        def manifest(reload=False):
+            raise AssertionError("manifest consulted again")
+        saved = compilecache.manifest
+        compilecache.manifest = manifest
+        try:
+            compilecache.weave_inline(inline,'double x=0.0;')
+        finally:
+            compilecache.manifest = saved
+
+    def test_unusable_cache(self):
+        # A cache directory that cannot be created (its parent is a file)
+        blocker = os.path.join(self.tmpdir,'file')
+        open(blocker,'w').close()
+        compilecache.kernel_cache_dir = os.path.join(blocker,'cache')
+        self.assertFalse(compilecache.available())
+        self.assertEqual(compilecache.pyximport_build_dir(),None)
+        calls = []
+        compilecache.weave_inline(lambda code: calls.append(code),'double x=0.0;')
+        self.assertEqual(calls,['double x=0.0;'])
+        self.assertEqual(len(compilecache.manifest()['weave_code']),1)
+        self.assertFalse(os.path.exists(compilecache.kernel_cache_dir))
+
+    def _fake_run_setup(self):
+        """Replace distutils' run_setup, returning the list of build dirs it is run with."""
+        import distutils.core
+        runs = []
+        saved = distutils.core.run_setup
+        distutils.core.run_setup = lambda script,args: runs.append(args[-1])
+        self.addCleanup(setattr,distutils.core,'run_setup',saved)
+        return runs
+
+    def test_build_extension_once(self):
+        runs = self._fake_run_setup()
+        setup_script = os.path.join(self.tmpdir,'compile.py')
+        compilecache.compile_kernels = True
+        build_lib = compilecache.extension_dir('pkg.ext',setup_script,[self.source])
+        self.assertEqual(runs,[build_lib])
+        self.assertTrue(build_lib.startswith(compilecache.cache_path()))
+        # As for a process that waited for the lock while it was built
+        self.assertEqual(compilecache.build_extension('pkg.ext',setup_script,[self.source]),build_lib)
+        compilecache._manifest = None
+        self.assertEqual(compilecache.extension_dir('pkg.ext',setup_script,[self.source]),build_lib)
+        self.assertEqual(len(runs),1)
+
+    def test_extension_unusable_cache(self):
+        runs = self._fake_run_setup()
+        blocker = os.path.join(self.tmpdir,'file')
+        open(blocker,'w').close()
+        compilecache.kernel_cache_dir = os.path.join(blocker,'cache')
+        compilecache.compile_kernels = True
+        setup_script = os.path.join(self.tmpdir,'compile.py')
+        # Built beside its sources, as before the cache existed
+        self.assertEqual(compilecache.extension_dir('pkg.ext',setup_script,[self.source]),self.tmpdir)
+        self.assertEqual(runs,[self.tmpdir])
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
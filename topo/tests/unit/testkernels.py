@@ -0,0 +1,191 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+import param
+
+from topo.misc import kernels, compilecache
+from topo.base.cf import CFPOutputFn, CFPLearningFn, CFSheet, CFProjection
+from topo.base.boundingregion import BoundingBox
+from topo.base.simulation import Simulation
+
+
+class _SlowFn(param.Parameterized):
+    rate = param.Number(default=1.0)
+
+class _FastFn(_SlowFn):
+    pass
+
+class _IdentityOF(CFPOutputFn):
+    def __call__(self, iterator, **params):
+        pass
+
+class _ZeroOF(_IdentityOF):
+    def __call__(self, iterator, **params):
+        for cf,i in iterator():
+            cf.weights *= 0.0
+
+class _SlowLF(CFPLearningFn):
+    """Learning function whose state (the number of calls) must be kept."""
+    def __init__(self, **params):
+        super(_SlowLF,self).__init__(**params)
+        self.calls = 0
+
+    def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
+        time.sleep(0.01)
+        self.calls += 1
+
+class _FastLF(_SlowLF):
+    def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
+        self.calls += 1
+
+class _Projection(object):
+    def __init__(self,response_fn):
+        self.response_fn = response_fn
+        self.weights_output_fns = []
+
+
+class TestKernelRegistry(unittest.TestCase):
+
+    def setUp(self):
+        kernels.register('_TestKernel','python',_SlowFn)
+        kernels.register('_TestKernel','_fast',_FastFn)
+        kernels.set_backend_status('_fast',True)
+        self.preference = list(kernels.backend_preference)
+        kernels.backend_preference[:] = ['_fast','python']
+        # Self-test results are recorded in a temporary kernel cache
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = compilecache.kernel_cache_dir
+        compilecache.kernel_cache_dir = self.tmpdir
+        compilecache._manifest = None
+        compilecache._available = None
+
+    def tearDown(self):
+        compilecache.kernel_cache_dir = self.cache_dir
+        compilecache._manifest = None
+        compilecache._available = None
+        shutil.rmtree(self.tmpdir)
+        kernels.backend_preference[:] = self.preference
+        for kernel in ('_TestKernel','CFPOF_Test','CFPLF_Test'):
+            kernels._kernels.pop(kernel,None)
+            kernels._bindings.pop(kernel,None)
+            kernels.kernel_status.pop((kernel,'_fast'),None)
+            kernels._self_tested.discard((kernel,'_fast'))
+        del kernels.backend_status['_fast']
+        for impl in (_SlowFn,_FastFn,_IdentityOF,_ZeroOF,_SlowLF,_FastLF):
+            kernels._implementations.pop(impl,None)
+
+    def test_select_preferred(self):
+        self.assertTrue(kernels.select('_TestKernel') is _FastFn)
+        kernels.backend_preference[:] = ['python','_fast']
+        self.assertTrue(kernels.select('_TestKernel') is _SlowFn)
+
+    def test_select_unavailable(self):
+        kernels.set_backend_status('_fast',False,'not built')
+        self.assertTrue(kernels.select('_TestKernel') is _SlowFn)
+        self.assertRaises(KeyError,kernels.select,'_TestKernel','_fast')
+
+    def test_bind_without_self_test(self):
+        kernels.register('CFPOF_Test','python',_IdentityOF)
+        kernels.register('CFPOF_Test','_fast',_ZeroOF)
+        namespace = {}
+        self.assertTrue(kernels.bind('CFPOF_Test',namespace,'fn') is _ZeroOF)
+        self.assertFalse(('CFPOF_Test','_fast') in kernels.kernel_status)
+
+    def test_self_test_rebinds(self):
+        kernels.register('CFPOF_Test','python',_IdentityOF)
+        kernels.register('CFPOF_Test','_fast',_ZeroOF)
+        namespace = {}
+        kernels.bind('CFPOF_Test',namespace,'fn')
+        self.assertTrue(namespace['fn'] is _ZeroOF)
+        self.assertEqual(kernels.self_test(kernels=['CFPOF_Test']),[('CFPOF_Test','_fast')])
+        self.assertTrue(namespace['fn'] is _IdentityOF)
+
+    def test_self_test_recorded(self):
+        kernels.register('CFPOF_Test','python',_IdentityOF)
+        kernels.register('CFPOF_Test','_fast',_ZeroOF)
+        kernels.self_test(kernels=['CFPOF_Test'])
+        self.assertEqual(compilecache.self_test_result(
+            'CFPOF_Test (_fast)',kernels._sources('CFPOF_Test','_fast')),False)
+
+        # As in a new process: the recorded failure is applied on
+        # selection, without running the test again
+        kernels.kernel_status.pop(('CFPOF_Test','_fast'))
+        kernels._self_tested.discard(('CFPOF_Test','_fast'))
+        compilecache._manifest = None
+        compare = kernels._compare
+        def fail(*args):
+            self.fail("Self-test run again")
+        kernels._compare = fail
+        try:
+            self.assertTrue(kernels.select('CFPOF_Test') is _IdentityOF)
+            self.assertEqual(kernels.self_test(kernels=['CFPOF_Test']),[])
+        finally:
+            kernels._compare = compare
+
+    def test_self_test_used(self):
+        kernels.register('CFPOF_Test','python',_IdentityOF)
+        kernels.register('CFPOF_Test','_fast',_ZeroOF)
+        sim = Simulation(register=False)
+        sim['Src'] = CFSheet(nominal_density=5,nominal_bounds=BoundingBox(radius=0.5))
+        sim['Dest'] = CFSheet(nominal_density=5,nominal_bounds=BoundingBox(radius=0.5))
+        p = sim.connect('Src','Dest',connection_type=CFProjection,
+                        weights_output_fns=[_ZeroOF()])
+        self.assertEqual(kernels.self_test_used(sim),[('CFPOF_Test','_fast')])
+        self.assertTrue(type(p.weights_output_fns[0]) is _IdentityOF)
+
+    def test_backend_of(self):
+        self.assertEqual(kernels.backend_of(_FastFn()),('_TestKernel','_fast'))
+        self.assertEqual(kernels.backend_of(object()),(None,None))
+
+    def test_use_backend(self):
+        p = _Projection(_SlowFn(rate=0.5))
+        kernels.use_backend(p,'_fast')
+        self.assertTrue(type(p.response_fn) is _FastFn)
+        self.assertEqual(p.response_fn.rate,0.5)
+
+    def test_use_backend_keeps_state(self):
+        fn = _SlowFn(rate=0.5)
+        fn.averages = [0.1]
+        p = _Projection(fn)
+        kernels.use_backend(p,'_fast')
+        self.assertEqual(p.response_fn.averages,[0.1])
+
+    def test_autotune(self):
+        kernels.register('CFPLF_Test','python',_SlowLF)
+        kernels.register('CFPLF_Test','_fast',_FastLF)
+        sim = Simulation(register=False)
+        sim['Src'] = CFSheet(nominal_density=5,nominal_bounds=BoundingBox(radius=0.5))
+        sim['Dest'] = CFSheet(nominal_density=5,nominal_bounds=BoundingBox(radius=0.5))
+        p = sim.connect('Src','Dest',connection_type=CFProjection,
+                        learning_fn=_SlowLF(),learning_rate=0.3)
+        p.learning_fn.calls = 5
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir,'autotune.json')
+            choices = kernels.autotune(sim,iterations=2,cache_file=path)
+            self.assertTrue(('learning_fn','_fast') in choices[p.name])
+            self.assertTrue(type(p.learning_fn) is _FastLF)
+            # State is kept, and unchanged by the timing
+            self.assertEqual(p.learning_fn.calls,5)
+            self.assertTrue(os.path.exists(path))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_autotune_cache(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir,'autotune.json')
+            self.assertEqual(kernels._load_autotune_cache(path),{})
+            kernels._save_autotune_cache(path,{'_TestKernel src=2x2':'_fast'})
+            self.assertEqual(kernels._load_autotune_cache(path),{'_TestKernel src=2x2':'_fast'})
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
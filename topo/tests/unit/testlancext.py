@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+
+import param
+
+try:
+    from lancet import FileType
+    from dataviews.collector import AttrTree
+    from topo.misc.lancext import BatchCollator
+except ImportError:
+    from nose.plugins.skip import SkipTest
+    raise SkipTest("Lancet or DataViews not available")
+
+
+# Files read (in this process) by _TestFile
+reads = []
+
+class _TestFile(FileType):
+    """Files containing a single number, loaded as an AttrTree."""
+
+    extensions = param.List(default=['.test'], constant=True)
+
+    data_key = 'data'
+
+    def save(self, filename, metadata={}, **data):
+        raise NotImplementedError
+
+    def metadata(self, filename):
+        return {}
+
+    def data(self, filename):
+        reads.append(filename)
+        with open(filename) as f:
+            value = int(f.read())
+        tree = AttrTree()
+        tree.set_path(('Value','A'),value)
+        tree.set_path(('Value','B'),-value)
+        return {'data':tree}
+
+
+class TestBatchCollator(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        items = OrderedDict()
+        for i in range(10):
+            items[(i,)] = self._write(i,i)
+        self.collator = BatchCollator(items,filetype=_TestFile(),dimensions=['Index'],
+                                      processes=1)
+        del reads[:]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, i, value):
+        filename = os.path.join(self.tmpdir,'%d.test' % i)
+        with open(filename,'w') as f:
+            f.write(str(value))
+        return filename
+
+    def _values(self, loaded):
+        return [(key,sorted(tree.path_items.items())) for key,tree in loaded.items()]
+
+    def test_cache(self):
+        self.collator.cache_data = True
+        first = self._values(self.collator.load(merge=False))
+        self.assertEqual(len(reads),10)
+        # Filtering a second time reads nothing and leaves the cache unfiltered
+        filtered = self.collator.load(['Value.A'],merge=False)
+        self.assertEqual(len(reads),10)
+        self.assertEqual(filtered[3].path_items.keys(),[('Value','A')])
+        self.assertEqual(self._values(self.collator.load(merge=False)),first)
+        # A modified file is read again
+        self._write(3,30)
+        self.assertEqual(self.collator.load(merge=False)[3].path_items[('Value','A')],30)
+        self.assertEqual(len(reads),11)
+
+    def test_no_cache(self):
+        self.collator.load(merge=False)
+        self.collator.load(merge=False)
+        self.assertEqual(len(reads),20)
+
+    def test_parallel(self):
+        serial = self._values(self.collator.load(['Value.B'],merge=False))
+        self.collator.processes = 2
+        self.collator.parallel_min_files = 2
+        parallel = self._values(self.collator.load(['Value.B'],merge=False))
+        self.assertEqual(parallel,serial)
+        # Read by the workers, not by this process
+        self.assertEqual(len(reads),10)
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
@@ -0,0 +1,53 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from topo.misc.util import LazyModule, after_import, alias_module
+
+
+class TestLazyImport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        package = os.path.join(self.tmpdir,'_lazypkg')
+        os.mkdir(package)
+        open(os.path.join(package,'__init__.py'),'w').close()
+        with open(os.path.join(package,'mod.py'),'w') as f:
+            f.write("value = 42\n")
+        sys.path.insert(0,self.tmpdir)
+
+    def tearDown(self):
+        sys.path.remove(self.tmpdir)
+        for name in ['_lazypkg','_lazypkg.mod','_lazyalias']:
+            sys.modules.pop(name,None)
+        shutil.rmtree(self.tmpdir)
+
+    def test_after_import(self):
+        imported = []
+        after_import('_lazypkg.mod',imported.append)
+        self.assertEqual(imported,[])
+        import _lazypkg.mod
+        self.assertEqual(imported,[_lazypkg.mod])
+        # Already imported: called immediately
+        after_import('_lazypkg.mod',imported.append)
+        self.assertEqual(len(imported),2)
+
+    def test_alias_module(self):
+        alias_module('_lazyalias','_lazypkg.mod')
+        self.assertTrue('_lazypkg.mod' not in sys.modules)
+        import _lazyalias
+        self.assertTrue(_lazyalias is sys.modules['_lazypkg.mod'])
+        self.assertEqual(_lazyalias.value,42)
+
+    def test_lazy_module(self):
+        lazy = LazyModule('_lazypkg.mod')
+        self.assertTrue('_lazypkg.mod' not in sys.modules)
+        self.assertEqual(lazy.value,42)
+        self.assertTrue('_lazypkg.mod' in sys.modules)
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
@@ -0,0 +1,158 @@
+"""
+Tests comparing the optimized CF learning functions with their
+unoptimized equivalents.
+"""
+
+import unittest
+
+import numpy
+from numpy.testing import assert_array_almost_equal
+
+from topo.base.simulation import Simulation
+from topo.base.boundingregion import BoundingBox
+from topo.base.cf import CFSheet,CFProjection,CFIter
+from topo.sheet import JointNormalizingCFSheet
+from topo.learningfn import Oja,Covariance,CPCA
+from topo.learningfn.optimized import CFPLF_Hebbian
+from topo.transferfn.optimized import CFPOF_DivisiveNormalizeL1
+from topo.misc import kernels
+from topo.misc.inlinec import optimized
+
+# Registers the optimized learning functions
+import topo.learningfn.optimized  # pyflakes:ignore (kernels registered on import)
+
+if not optimized:
+    from nose.plugins.skip import SkipTest
+    raise SkipTest("Weave not available")
+
+
+class TestOptimizedLearningFns(unittest.TestCase):
+
+    def _learn(self, fn, mask=None, steps=2):
+        """
+        Apply fn (twice, so that any state it keeps is used) to a
+        small projection with random weights and activity, returning
+        the weights of every CF, including any excluded by the sheet
+        mask.
+        """
+        numpy.random.seed(1)
+        sim = Simulation(register=False)
+        sim['Src'] = CFSheet(nominal_density=10,nominal_bounds=BoundingBox(radius=0.5))
+        sim['Dest'] = CFSheet(nominal_density=10,nominal_bounds=BoundingBox(radius=0.5))
+        p = sim.connect('Src','Dest',connection_type=CFProjection,
+                        nominal_bounds_template=BoundingBox(radius=0.2))
+        dest = sim['Dest']
+        if mask is not None:
+            dest.mask.data = mask.copy()
+        for cf,i in CFIter(p,ignore_sheet_mask=True)():
+            cf.weights[:] = numpy.random.rand(*cf.weights.shape)*cf.mask
+        for step in range(steps):
+            input_activity = numpy.random.rand(*sim['Src'].activity.shape)
+            activity = numpy.random.rand(*dest.activity.shape)
+            # Some inactive units, which optimized functions may skip
+            activity[activity<0.3] = 0.0
+            dest.activity[:] = activity
+            fn(CFIter(p),input_activity,dest.activity,0.5)
+        return [cf.weights.copy() for cf,i in CFIter(p,ignore_sheet_mask=True)()]
+
+    def _mask(self):
+        mask = numpy.ones((10,10))
+        mask[:,:4] = 0.0
+        return mask
+
+    def _compare(self, kernel, mask=None, **params):
+        python,weave = [kernels._kernels[kernel][backend](**params)
+                        for backend in ('python','weave')]
+        for expected,weights in zip(self._learn(python,mask),self._learn(weave,mask)):
+            assert_array_almost_equal(weights,expected,4)
+
+    def test_euclidean_hebbian(self):
+        self._compare('CFPLF_EuclideanHebbian')
+
+    def test_euclidean_hebbian_masked(self):
+        # The unoptimized version ignores the sheet mask, while the
+        # optimized one leaves excluded units unchanged
+        mask = self._mask()
+        unlearned = self._learn(lambda *args: None,mask)
+        python = self._learn(kernels._kernels['CFPLF_EuclideanHebbian']['python'](),mask)
+        weave = self._learn(kernels._kernels['CFPLF_EuclideanHebbian']['weave'](),mask)
+        for i,included in enumerate(mask.flat):
+            expected = python[i] if included else unlearned[i]
+            assert_array_almost_equal(weave[i],expected,4)
+        self.assertTrue(any(not numpy.allclose(python[i],unlearned[i])
+                            for i in numpy.flatnonzero(mask==0)))
+
+    def test_outstar_hebbian(self):
+        self._compare('CFPLF_OutstarHebbian')
+        self._compare('CFPLF_OutstarHebbian',self._mask())
+
+    def test_homeosynaptic(self):
+        self._compare('HomeoSynaptic')
+        self._compare('HomeoSynaptic',self._mask())
+
+    def test_oja(self):
+        self._compare('CFPLF_Oja')
+        self._compare('CFPLF_Oja',self._mask(),single_cf_fn=Oja(alpha=0.5))
+
+    def test_covariance(self):
+        self._compare('CFPLF_Covariance')
+        self._compare('CFPLF_Covariance',self._mask())
+        # Inactive units are skipped when there is no unit threshold
+        self._compare('CFPLF_Covariance',self._mask(),
+                      single_cf_fn=Covariance(unit_threshold=0.0,input_threshold=0.2))
+
+    def test_cpca(self):
+        self._compare('CFPLF_CPCA')
+        self._compare('CFPLF_CPCA',self._mask(),single_cf_fn=CPCA())
+
+
+    def _hebbian_normalize_l1(self, iterator, input_activity, output_activity, learning_rate):
+        CFPLF_Hebbian()(iterator,input_activity,output_activity,learning_rate)
+        iterator.active_units_mask = True
+        CFPOF_DivisiveNormalizeL1()(iterator)
+
+    def test_hebbian_normalize_l1(self):
+        expected = self._learn(self._hebbian_normalize_l1,self._mask())
+        for backend in ('python','weave'):
+            fn = kernels._kernels['CFPLF_HebbianNormalizeL1'][backend]()
+            for e,weights in zip(expected,self._learn(fn,self._mask())):
+                assert_array_almost_equal(weights,e,4)
+
+    def _learn_jointly(self, learning_fn):
+        """
+        Apply learning_fn to two projections normalized jointly by
+        CFPOF_DivisiveNormalizeL1, returning the weights of both.
+        """
+        numpy.random.seed(1)
+        sim = Simulation(register=False)
+        sim['Src'] = CFSheet(nominal_density=10,nominal_bounds=BoundingBox(radius=0.5))
+        sim['Dest'] = JointNormalizingCFSheet(nominal_density=10,
+                                              nominal_bounds=BoundingBox(radius=0.5))
+        dest = sim['Dest']
+        projections = [sim.connect('Src','Dest',name=name,connection_type=CFProjection,
+                                   nominal_bounds_template=BoundingBox(radius=0.2),
+                                   dest_port=('Activity','JointNormalize','Afferent'),
+                                   learning_fn=learning_fn,learning_rate=0.5,
+                                   weights_output_fns=[CFPOF_DivisiveNormalizeL1()])
+                       for name in ('A','B')]
+        for p in projections:
+            for cf,i in CFIter(p)():
+                cf.weights[:] = numpy.random.rand(*cf.weights.shape)*cf.mask
+            p.input_buffer = numpy.random.rand(*sim['Src'].activity.shape)
+        activity = numpy.random.rand(*dest.activity.shape)
+        activity[activity<0.3] = 0.0
+        dest.activity[:] = activity
+        dest.learn()
+        return [cf.weights.copy() for p in projections for cf,i in CFIter(p)()]
+
+    def test_hebbian_normalize_l1_joint(self):
+        expected = self._learn_jointly(CFPLF_Hebbian())
+        for backend in ('python','weave'):
+            fn = kernels._kernels['CFPLF_HebbianNormalizeL1'][backend]()
+            for e,weights in zip(expected,self._learn_jointly(fn)):
+                assert_array_almost_equal(weights,e,4)
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
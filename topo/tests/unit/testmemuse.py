@@ -0,0 +1,37 @@
+import unittest
+
+import numpy
+
+from topo.misc import memuse
+
+
+class TestMemoryAccounting(unittest.TestCase):
+
+    def test_unique_nbytes(self):
+        a = numpy.zeros((10,10))
+        b = numpy.zeros(5)
+        self.assertEqual(memuse.unique_nbytes([a,a,None,b]),a.nbytes+b.nbytes)
+
+    def test_unique_nbytes_views(self):
+        a = numpy.zeros((10,10))
+        self.assertEqual(memuse.unique_nbytes([a[0:2],a[3:5],a]),a.nbytes)
+
+    def test_unique_nbytes_exclude(self):
+        a = numpy.zeros((10,10))
+        b = numpy.zeros(5)
+        self.assertEqual(memuse.unique_nbytes([a,b],exclude=[a]),b.nbytes)
+
+    def test_add_usage(self):
+        usage = memuse.add_usage({'weights':10},{'weights':5,'masks':2})
+        self.assertEqual(usage,{'weights':15,'masks':2})
+
+    def test_rss(self):
+        before = memuse.rss()
+        self.assertTrue(before > 0)
+        a = numpy.ones(50*1024*1024/8)
+        self.assertTrue(memuse.rss() > before+a.nbytes/2)
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
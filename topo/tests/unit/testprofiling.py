@@ -0,0 +1,74 @@
+import unittest
+
+from topo.pattern import Gaussian
+from topo.base.boundingregion import BoundingBox
+from topo.base.simulation import Simulation
+from topo.base.cf import CFSheet, CFProjection
+from topo.sheet import GeneratorSheet
+from topo.misc.profiling import ComponentProfiler
+
+
+class TestComponentProfiler(unittest.TestCase):
+
+    def test_timed(self):
+        profiler = ComponentProfiler(interval=1.0)
+        result = profiler.timed((('V1','Afferent'),'activate'),lambda: 100,pow,2,3)
+        self.assertEqual(result,8)
+        profiler.set_time(1.5)
+        profiler.timed((('V1','Afferent'),'activate'),lambda: 200,pow,2,4)
+        profiler.timed(('V1','process_current_time'),lambda: 0,abs,-1)
+
+        rows = dict([((r[0],r[1]),r) for r in profiler.rows()])
+        name,operation,calls,total,mean,nbytes = rows[('V1.Afferent','activate')]
+        self.assertEqual(calls,2)
+        self.assertEqual(nbytes,100)
+        self.assertAlmostEqual(mean,total/2)
+
+        series = profiler.series()
+        self.assertEqual([t for t,times in series],[0.0,1.0])
+        self.assertEqual(sorted(series[1][1].keys()),
+                         ['V1 process_current_time','V1.Afferent activate'])
+
+
+
+class TestSimulationProfiling(unittest.TestCase):
+
+    def _run(self, profile_components):
+        sim = Simulation(register=False,profile_components=profile_components)
+        sim['Retina'] = GeneratorSheet(input_generator=Gaussian(),nominal_density=10,
+                                       nominal_bounds=BoundingBox(radius=0.5))
+        sim['V1'] = CFSheet(nominal_density=10,nominal_bounds=BoundingBox(radius=0.5))
+        sim.connect('Retina','V1',name='Afferent',connection_type=CFProjection,delay=0.05,
+                    nominal_bounds_template=BoundingBox(radius=0.2),learning_rate=0.5)
+        sim.run(2)
+        return sim
+
+    def test_profile_components(self):
+        sim = self._run(True)
+        operations = [('Retina','process_current_time'),('V1','process_current_time'),
+                      ('V1.Afferent','activate'),('V1.Afferent','learn'),
+                      ('V1.Afferent','apply_learn_output_fns')]
+        recorded = sim.profiler.rows()
+        rows = dict([((r[0],r[1]),r) for r in recorded])
+        for operation in operations:
+            self.assertTrue(operation in rows,operation)
+            self.assertTrue(rows[operation][2] > 0)
+        self.assertTrue(rows[('V1.Afferent','activate')][5] > 0)
+        self.assertEqual(sim.profile_report(),recorded)
+
+        # Nothing more is recorded once profiling is switched off
+        sim.profile_components = False
+        sim.run(2)
+        self.assertTrue(sim._active_profiler is None)
+        self.assertEqual(sim.profiler.rows(),recorded)
+
+    def test_not_profiling(self):
+        sim = self._run(False)
+        self.assertTrue(sim._active_profiler is None)
+        self.assertTrue(sim.profiler is None)
+        self.assertEqual(sim.profile_report(),[])
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
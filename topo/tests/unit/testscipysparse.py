@@ -0,0 +1,69 @@
+import unittest
+import numpy
+from numpy.testing import assert_array_almost_equal
+
+from topo.sparse.scipysparse import csarray_float
+
+
+class TestScipySparse(unittest.TestCase):
+    """
+    Compare the scipy.sparse weights matrix with the equivalent
+    operations on a dense weights array.
+    """
+
+    def setUp(self):
+        numpy.random.seed(42)
+        self.src_shape = (4,5)
+        self.dest_shape = (3,2)
+        dense = numpy.random.rand(20,6).astype(numpy.float32)
+        dense[dense<0.5] = 0.0
+        self.dense = dense
+        rows,cols = dense.nonzero()
+        self.weights = csarray_float(self.src_shape,self.dest_shape)
+        self.weights.setTriplets(rows.astype(numpy.int32),cols.astype(numpy.int32),dense[rows,cols])
+        self.src_act = numpy.random.rand(*self.src_shape)
+        self.dest_act = numpy.random.rand(*self.dest_shape)
+
+    def test_triplets(self):
+        rows,cols,vals = self.weights.getTriplets()
+        self.assertEqual(self.weights.getnnz(),numpy.count_nonzero(self.dense))
+        assert_array_almost_equal(self.dense[rows,cols],vals)
+        assert_array_almost_equal(self.weights.toarray(),self.dense)
+
+    def test_dotproduct(self):
+        out = numpy.zeros(self.dest_shape)
+        self.weights.DotProduct(2.0,self.src_act,out)
+        assert_array_almost_equal(out.ravel(),2.0*numpy.dot(self.src_act.ravel(),self.dense),5)
+
+    def test_hebbian(self):
+        norm_total = numpy.zeros(self.dest_shape)
+        self.weights.Hebbian(self.src_act,self.dest_act,norm_total,0.1)
+        expected = self.dense + 0.1*numpy.outer(self.src_act.ravel(),self.dest_act.ravel())*(self.dense!=0)
+        assert_array_almost_equal(self.weights.toarray(),expected,5)
+        assert_array_almost_equal(norm_total.ravel(),expected.sum(axis=0),5)
+
+    def test_divisive_normalize_l1(self):
+        norm_total = numpy.zeros(self.dest_shape)
+        self.weights.CFWeightTotals(norm_total)
+        self.weights.DivisiveNormalizeL1(norm_total)
+        assert_array_almost_equal(self.weights.toarray().sum(axis=0),numpy.ones(6),5)
+
+    def test_compressed_roundtrip(self):
+        outer,inner,values = self.weights.getCompressed()
+        self.assertEqual(len(outer),7)
+        self.assertEqual(len(inner),numpy.count_nonzero(self.dense))
+        copied = csarray_float(self.src_shape,self.dest_shape)
+        copied.setCompressed(outer.copy(),inner.copy(),values.copy())
+        assert_array_almost_equal(copied.toarray(),self.dense)
+
+    def test_put_and_prune(self):
+        self.weights.put(numpy.array([0.0,0.25],dtype=numpy.float32),
+                         numpy.array([0,1],dtype=numpy.int32),numpy.array([0,0],dtype=numpy.int32))
+        self.assertEqual(self.weights[1,0],numpy.float32(0.25))
+        self.weights.prune()
+        self.assertEqual(self.weights.getnnz(),numpy.count_nonzero(self.weights.toarray()))
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
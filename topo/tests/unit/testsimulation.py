@@ -107,6 +107,33 @@ class TestSimulation(unittest.TestCase):
         self.assertEqual(len(s._events_stack),0)
 
 
+    def test_state_push_copy_on_write(self):
+        s = new_simulation(name="test_state_push_cow")
+        s.run(1)
+        sheet = s['S']
+        before = sheet.activity
+        before_values = before.copy()
+        s.state_push()
+        assert sheet.activity is before, 'state_push should not copy activity'
+        s.run(1)
+        assert sheet.activity is not before, 'activity should be copied on first write'
+        s.state_pop()
+        assert sheet.activity is before
+        assert np.array_equal(sheet.activity,before_values)
+
+
+    def test_periodic_event_not_modified(self):
+        s = new_simulation(name="test_periodic_event")
+        s.run(0)
+        queued = list(s.events)
+        times = [e.time for e in queued]
+        s.state_push()
+        s.run(2)
+        s.state_pop()
+        assert all(e is q for e,q in zip(s.events,queued))
+        assert [e.time for e in s.events] == times
+
+
     def test_event_cmp(self):
 
         e1 = Event(1)
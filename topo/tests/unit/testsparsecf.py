@@ -0,0 +1,44 @@
+import unittest
+import numpy
+
+from topo.sparse.sparsecf import CFSPOF_SproutRetract, _top_positive
+
+
+class TestSproutRetract(unittest.TestCase):
+    """
+    Compare the selection of connections to prune and to sprout for
+    all CFs at once with selecting them for each CF in turn.
+    """
+
+    def setUp(self):
+        numpy.random.seed(42)
+        self.n_cfs = 30
+        self.nnz = numpy.random.randint(0,20,self.n_cfs)
+        self.nnz[3] = 0
+        self.cols = numpy.repeat(numpy.arange(self.n_cfs),self.nnz)
+        self.vals = numpy.random.rand(len(self.cols)).astype(numpy.float32)
+        self.prune_count = numpy.random.randint(0,25,self.n_cfs)
+
+    def test_prune(self):
+        fn = CFSPOF_SproutRetract(batch_size=4)
+        keep = fn.prune(self.cols,self.vals,self.nnz,self.prune_count)
+        for c in range(self.n_cfs):
+            cf_vals = self.vals[self.cols==c]
+            if len(cf_vals):
+                threshold = numpy.sort(cf_vals)[min(self.prune_count[c],len(cf_vals)-1)]
+                self.assertTrue(numpy.array_equal(keep[self.cols==c],cf_vals>=threshold))
+
+    def test_sprout_candidates(self):
+        values = numpy.random.rand(self.n_cfs,25)
+        values[values<0.3] = 0.0
+        counts = numpy.random.randint(0,30,self.n_cfs)
+        rows,cols = _top_positive(values,counts)
+        for i in range(self.n_cfs):
+            best = numpy.argsort(values[i])[::-1][:counts[i]]
+            expected = sorted(best[values[i][best]>0])
+            self.assertEqual(sorted(cols[rows==i]),expected)
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
@@ -0,0 +1,213 @@
+import os
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+from collections import OrderedDict
+
+import numpy
+import param
+import topo
+from imagen import Gaussian
+from imagen.random import UniformRandom
+
+from topo.base.boundingregion import BoundingBox
+from topo.base.simulation import Simulation
+import topo.submodel
+from topo.submodel import Model, _PropertyIndex, _save_weights
+
+
+class _Spec(object):
+    def __init__(self, **properties):
+        self.properties = OrderedDict(sorted(properties.items()))
+
+
+class TestPropertyIndex(unittest.TestCase):
+    """
+    Check that _PropertyIndex finds the same SheetSpecs as testing
+    each one with Model._matchcondition_holds.
+    """
+
+    def setUp(self):
+        self.holds = Model.__dict__['_matchcondition_holds']
+        random.seed(1)
+        levels = ['Retina','LGN','V1','V2']
+        self.specs = [_Spec(level=random.choice(levels),
+                            **dict(random.sample([('eye','Left'),('eye','Right'),('polarity','On'),
+                                                  ('polarity','Off'),('SF',random.choice([1,2,3]))],2)))
+                      for i in range(40)]
+        self.index = _PropertyIndex(self.specs)
+
+    def check(self, matchconditions):
+        expected = [i for i,spec in enumerate(self.specs)
+                    if self.holds(None,matchconditions,spec)]
+        self.assertEqual(self.index.matches(matchconditions),expected)
+
+    def test_none(self):
+        self.check(None)
+
+    def test_empty(self):
+        self.check({})
+
+    def test_single(self):
+        self.check({'level':'LGN'})
+        self.check({'polarity':['On','Off']})
+        self.check({'level':'Retina','eye':'Left'})
+
+    def test_substring(self):
+        # values are matched as substrings, as in _matchcondition_holds
+        self.check({'level':'V1V2'})
+        self.check({'SF':12})
+
+    def test_missing_property(self):
+        self.check({'cone':'L'})
+
+
+
+class _TestModel(Model):
+
+    offset = param.Number(default=0.0)
+
+    weights_output_fns = param.List(default=None,doc="""
+        If not None, the weights_output_fns of the projections.""")
+
+    def setup_training_patterns(self):
+        return {'Retina':Gaussian()}
+
+    def setup_sheets(self):
+        sheets = OrderedDict()
+        sheets['Retina'] = [{}]
+        sheets['V1'] = [{}]
+        return sheets
+
+    @Model.GeneratorSheet
+    def Retina(self, properties):
+        return Model.GeneratorSheet.params(nominal_density=10,
+                                           input_generator=self.training_patterns['Retina'])
+
+    @Model.CFSheet
+    def V1(self, properties):
+        return Model.CFSheet.params(nominal_density=10)
+
+    @Model.matchconditions('V1', 'afferent')
+    def afferent_conditions(self, properties):
+        return {'level': 'Retina'}
+
+    def _projection_params(self):
+        if self.weights_output_fns is None:
+            return {}
+        return {'weights_output_fns':self.weights_output_fns}
+
+    @Model.CFProjection
+    def afferent(self, src_properties, dest_properties):
+        return Model.CFProjection.params(
+            name='Afferent',
+            nominal_bounds_template=BoundingBox(radius=0.2),
+            weights_generator=UniformRandom(name='AfferentWeights',offset=self.offset),
+            **self._projection_params())
+
+    @Model.matchconditions('V1', 'lateral')
+    def lateral_conditions(self, properties):
+        return {'level': 'V1'}
+
+    @Model.CFProjection
+    def lateral(self, src_properties, dest_properties):
+        return Model.CFProjection.params(
+            name='Lateral',
+            nominal_bounds_template=BoundingBox(radius=0.1),
+            weights_generator=UniformRandom(name='LateralWeights'),
+            **self._projection_params())
+
+
+class TestModelConstruction(unittest.TestCase):
+
+    def build(self, **params):
+        """Instantiate a _TestModel in a new simulation, returning its weights."""
+        Simulation()
+        model = _TestModel(register=False,
+                           setup_options=['attributes','training_patterns','sheets','projections'],
+                           **params)
+        model()
+        return dict((name,[cf.weights.copy() for cf in proj.flatcfs])
+                    for name,proj in topo.sim['V1'].projections().items())
+
+    def assertWeightsEqual(self, weights, expected):
+        self.assertEqual(sorted(weights),sorted(expected))
+        for name in expected:
+            for w,e in zip(weights[name],expected[name]):
+                self.assertTrue(numpy.array_equal(w,e))
+
+    def test_parallel_construction(self):
+        serial = self.build(construction_processes=1)
+        parallel = self.build(construction_processes=2)
+        self.assertWeightsEqual(parallel,serial)
+
+    def test_parallel_construction_after_openmp(self):
+        from topo.misc import inlinec
+        if not (inlinec.optimized and inlinec.c_decorators['cfs_loop_pragma']):
+            from nose.plugins.skip import SkipTest
+            raise SkipTest("OpenMP not enabled")
+        from topo.transferfn.optimized import CFPOF_DivisiveNormalizeL1_opt
+        normalize = [CFPOF_DivisiveNormalizeL1_opt()]
+        serial = self.build(construction_processes=1,weights_output_fns=normalize)
+
+        # Start libgomp's threads in this process before forking
+        x = numpy.zeros(1000)
+        inlinec.inline("""
+            %(cfs_loop_pragma)s
+            for (int i=0; i<1000; ++i) {
+                x[i] = i;
+            }""" % inlinec.c_decorators,['x'],local_dict=locals())
+
+        results = []
+        builder = threading.Thread(target=lambda: results.append(
+            self.build(construction_processes=2,weights_output_fns=normalize)))
+        builder.daemon = True
+        builder.start()
+        builder.join(120)
+        self.assertFalse(builder.is_alive(),"Parallel construction hung")
+        self.assertWeightsEqual(results[0],serial)
+
+    def test_weights_cache(self):
+        cache = tempfile.mkdtemp()
+        loaded = []
+        instantiate_with_weights = topo.submodel._instantiate_with_weights
+        def record(spec, filename):
+            loaded.append(spec.parameters['name'])
+            instantiate_with_weights(spec,filename)
+        topo.submodel._instantiate_with_weights = record
+        try:
+            first = self.build(weights_cache=cache)
+            self.assertEqual(loaded,[])
+            self.assertEqual(len(os.listdir(cache)),2)
+
+            # Same model: both projections hit the cache
+            self.assertWeightsEqual(self.build(weights_cache=cache),first)
+            self.assertEqual(sorted(loaded),['Afferent','Lateral'])
+
+            # Different afferent weights_generator: only Lateral hits
+            del loaded[:]
+            changed = self.build(weights_cache=cache,offset=1.0)
+            self.assertEqual(loaded,['Lateral'])
+            self.assertEqual(len(os.listdir(cache)),3)
+            self.assertFalse(numpy.array_equal(changed['Afferent'][0],first['Afferent'][0]))
+        finally:
+            topo.submodel._instantiate_with_weights = instantiate_with_weights
+            shutil.rmtree(cache)
+
+    def test_save_empty_projection(self):
+        class _Projection(object):
+            flatcfs = [None,None]
+        handle,filename = tempfile.mkstemp(suffix='.npy')
+        os.close(handle)
+        try:
+            _save_weights(_Projection(),filename)
+            self.assertEqual(numpy.load(filename,mmap_mode='r').size,0)
+        finally:
+            os.remove(filename)
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
@@ -0,0 +1,202 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy
+from numpy.testing import assert_array_equal
+
+import Image
+
+from topo.misc import trace
+from topo.misc.trace import InMemoryRecorder, DiskRecorder, RingBufferRecorder, ActivityMovie
+
+
+class TestInMemoryRecorder(unittest.TestCase):
+
+    def test_memory_usage(self):
+        recorder = InMemoryRecorder()
+        recorder.add_variable('Activity')
+        recorder.record_data('Activity',0,numpy.zeros((4,4)))
+        recorder.record_data('Activity',1,None)
+        self.assertEqual(recorder.memory_usage()['recorder'],4*4*8)
+
+    def test_restored_from_older_snapshot(self):
+        recorder = InMemoryRecorder()
+        recorder.add_variable('Activity')
+        del recorder._recorded_bytes
+        self.assertEqual(recorder.memory_usage()['recorder'],0)
+        recorder.record_data('Activity',0,numpy.zeros((4,4)))
+        self.assertEqual(recorder.memory_usage()['recorder'],4*4*8)
+
+
+
+class TestRingBufferRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.recorder = RingBufferRecorder(capacity=3)
+        self.recorder.add_variable('Activity')
+        for t in range(5):
+            self.recorder.record_data('Activity',t,numpy.ones((2,2))*t)
+
+    def _check(self,recorder):
+        self.assertEqual(recorder.get_times('Activity'),[2,3,4])
+        self.assertEqual(recorder.get_datum('Activity',3)[0,0],3)
+        self.assertEqual(recorder.get_datum('Activity',3.5)[0,0],3)
+        self.assertEqual(recorder.get_datum('Activity',10)[0,0],4)
+        times,data = recorder.get_data('Activity',(3,4))
+        self.assertEqual(times,[3,4])
+        self.assertEqual([d[0,0] for d in data],[3,4])
+        times,data = recorder.get_data('Activity',(3,6),fill_range=True)
+        self.assertEqual(times,[3,4,6])
+        self.assertEqual([d[0,0] for d in data],[3,4,4])
+
+    def test_wrap_around(self):
+        self._check(self.recorder)
+
+    def test_out_of_order(self):
+        self.assertRaises(ValueError,self.recorder.record_data,'Activity',3.5,numpy.zeros((2,2)))
+        self._check(self.recorder)
+
+    def test_reload(self):
+        recorder = pickle.loads(pickle.dumps(self.recorder,2))
+        self._check(recorder)
+        recorder.record_data('Activity',5,numpy.ones((2,2))*5)
+        self.assertEqual(recorder.get_times('Activity'),[3,4,5])
+        self.assertEqual(recorder.get_datum('Activity',5)[0,0],5)
+
+
+
+class TestDiskRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.recorder = DiskRecorder(directory=self.tmpdir,chunk_size=2)
+        self.recorder.add_variable('Activity')
+        # Recorded out of order, across several chunks
+        for t in [0,2,1,4,3]:
+            self.recorder.record_data('Activity',t,numpy.ones((2,2))*t)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _check(self,recorder,times=range(5)):
+        self.assertEqual(recorder.get_times('Activity'),times)
+        for t in times:
+            self.assertEqual(recorder.get_datum('Activity',t)[0,0],t)
+        self.assertEqual(recorder.get_datum('Activity',2.5)[0,0],2)
+        recorded,data = recorder.get_data('Activity',(1,3))
+        self.assertEqual(recorded,[1,2,3])
+        self.assertEqual([d[0,0] for d in data],[1,2,3])
+
+    def test_out_of_order(self):
+        self._check(self.recorder)
+
+    def _contents(self):
+        return dict((name,open(os.path.join(self.tmpdir,name),'rb').read())
+                    for name in os.listdir(self.tmpdir))
+
+    def test_chunk_reload(self):
+        saved = pickle.dumps(self.recorder,2)
+        contents = self._contents()
+        first,second = pickle.loads(saved),pickle.loads(saved)
+        try:
+            self._check(first)
+            # Recording continues in a new directory, in a copy of the
+            # partly filled last chunk and then in a new chunk
+            first.record_data('Activity',5,numpy.ones((2,2))*5)
+            first.record_data('Activity',6,numpy.ones((2,2))*6)
+            second.record_data('Activity',5,numpy.ones((2,2))*50)
+            self._check(first,range(7))
+            self.assertEqual(second.get_datum('Activity',5)[0,0],50)
+            self.assertNotEqual(first.directory,self.tmpdir)
+            self.assertNotEqual(first.directory,second.directory)
+            # The saved chunk files are unchanged
+            self.assertEqual(self._contents(),contents)
+
+            # Frames recorded by the original recorder after saving
+            # are not seen by (or overwritten by) the restored ones
+            self.recorder.record_data('Activity',5,numpy.ones((2,2))*500)
+            self.assertEqual(first.get_datum('Activity',5)[0,0],5)
+            self.assertEqual(self.recorder.get_datum('Activity',5)[0,0],500)
+        finally:
+            for recorder in (first,second):
+                if recorder.directory is not None:
+                    shutil.rmtree(recorder.directory)
+
+
+
+class _CountingMovie(ActivityMovie):
+    """ActivityMovie recording the times of the frames it renders."""
+
+    def __init__(self,**params):
+        super(_CountingMovie,self).__init__(**params)
+        self.rendered = []
+
+    def render_frame(self,t):
+        self.rendered.append(t)
+        return super(_CountingMovie,self).render_frame(t)
+
+
+class TestActivityMovie(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.recorder = InMemoryRecorder()
+        self.recorder.add_variable('Activity')
+        numpy.random.seed(1)
+        for t in range(6):
+            self.recorder.record_data('Activity',t,numpy.random.rand(4,4))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _movie(self,**params):
+        return _CountingMovie(name='movie',recorder=self.recorder,variables=['Activity'],
+                              frame_times=range(6),filetype='png',
+                              filename_prefix=self.tmpdir+os.sep,**params)
+
+    def _images(self,movie):
+        return [numpy.asarray(Image.open(os.path.join(self.tmpdir,'movie_%05.0f.png'%t)))
+                for t in movie.frame_times]
+
+    def test_frames_lazy(self):
+        movie = self._movie()
+        frames = movie.frames
+        self.assertEqual(movie.rendered,[])
+        frames.next()
+        self.assertEqual(movie.rendered,[0])
+        self.assertEqual(len(list(frames)),5)
+        self.assertEqual(movie.rendered,range(6))
+
+    def test_save(self):
+        movie = self._movie()
+        movie.save()
+        self.assertEqual(movie.rendered,range(6))
+        for t,image in zip(movie.frame_times,self._images(movie)):
+            frame = movie.render_frame(t)
+            assert_array_equal(image,numpy.asarray(frame.image))
+
+    def test_save_parallel(self):
+        if not hasattr(os,'fork'):
+            from nose.plugins.skip import SkipTest
+            raise SkipTest("Frames are only saved in parallel where os.fork is available")
+        movie = self._movie()
+        movie.save()
+        serial = self._images(movie)
+        for name in os.listdir(self.tmpdir):
+            os.remove(os.path.join(self.tmpdir,name))
+
+        movie = self._movie(processes=2)
+        movie.save()
+        # Rendered by the workers, from the movie in _movie_being_saved
+        self.assertEqual(movie.rendered,[])
+        self.assertTrue(trace._movie_being_saved is None)
+        for s,p in zip(serial,self._images(movie)):
+            assert_array_equal(p,s)
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
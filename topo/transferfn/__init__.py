@@ -33,7 +33,7 @@ from imagen.transferfn import BinaryThreshold,DivisiveNormalizeL1  # pyflakes:ig
 from imagen.transferfn import DivisiveNormalizeL2,DivisiveNormalizeLinf # pyflakes:ignore (API import)
 from imagen.transferfn import DivisiveNormalizeLp # pyflakes:ignore (API import)
 
-from featuremapper import PatternDrivenAnalysis
+from topo.misc.util import after_import
 
 # CEBHACKALERT: these need to respect the mask - which will be passed in.
 
@@ -592,7 +592,10 @@ class Hysteresis(TransferFnWithState):
         self.first_call = True
         self.__current_state_stack=[]
         self.old_a = 0
-        PatternDrivenAnalysis.pre_presentation_hooks.append(self.reset)
+        after_import('featuremapper',self._add_presentation_hook)
+
+    def _add_presentation_hook(self,featuremapper):
+        featuremapper.PatternDrivenAnalysis.pre_presentation_hooks.append(self.reset)
 
     def __call__(self,x):
         if self.first_call is True:
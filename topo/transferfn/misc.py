@@ -277,16 +277,22 @@ class HomeostaticResponse(TransferFnWithState):
             self._y_avg_prev = self.y_avg   # Copy only if not in continuous mode
 
         self._apply_threshold(x)            # Apply the threshold only after it is updated
-        self._x_prev[...,...] = x[...,...]  # Recording activity for the next periodic update
+        if self.__current_state_stack and self._x_prev is self.__current_state_stack[-1][5]:
+            self._x_prev = numpy.copy(x)    # Copy-on-write: _x_prev was saved by state_push
+        else:
+            self._x_prev[...,...] = x[...,...]  # Recording activity for the next periodic update
 
 
     def state_push(self):
-        self.__current_state_stack.append((copy.copy(self.t),
-                                           copy.copy(self.y_avg),
-                                           copy.copy(self.first_call),
+        # The threshold and average arrays are only ever replaced,
+        # never modified in place, and _x_prev is copied on its next
+        # write (in __call__), so references are enough here.
+        self.__current_state_stack.append((self.t,
+                                           self.y_avg,
+                                           self.first_call,
                                            copy.copy(self._next_update_timestamp),
-                                           copy.copy(self._y_avg_prev),
-                                           copy.copy(self._x_prev)))
+                                           self._y_avg_prev,
+                                           self._x_prev))
         super(HomeostaticResponse, self).state_push()
 
     def state_pop(self):
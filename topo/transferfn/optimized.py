@@ -37,12 +37,11 @@ class CFPOF_DivisiveNormalizeL1_opt(CFPOutputFn):
     def __call__(self, iterator, **params):
         cf_type=iterator.cf_type  # pyflakes:ignore (passed to weave C code)
         cfs = iterator.flatcfs  # pyflakes:ignore (passed to weave C code)
-        num_cfs = len(iterator.flatcfs)  # pyflakes:ignore (passed to weave C code)
 
-        # CB: for performance, it is better to process the masks in
-        # the C code (rather than combining them before).
-        active_units_mask = iterator.get_active_units_mask()  # pyflakes:ignore (passed to weave C code)
-        sheet_mask = iterator.get_sheet_mask()  # pyflakes:ignore (passed to weave C code)
+        # Only the units to be normalized are visited (the index list
+        # is shared with the sheet's other projections while learning).
+        unit_indices = iterator.get_unit_indices()
+        num_units = len(unit_indices)  # pyflakes:ignore (passed to weave C code)
 
         code = c_header + """
 
@@ -51,12 +50,13 @@ class CFPOF_DivisiveNormalizeL1_opt(CFPOutputFn):
             DECLARE_SLOT_OFFSET(_norm_total,cf_type);
             DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
             DECLARE_SLOT_OFFSET(mask,cf_type);
+            DECLARE_CF_ITEMS(cfs);
 
             %(cfs_loop_pragma)s
-            for (int r=0; r<num_cfs; ++r) {
-                if (active_units_mask[r] != 0 && sheet_mask[r] != 0) {
-                    PyObject *cf = PyList_GetItem(cfs,r);
-
+            for (int k=0; k<num_units; ++k) {
+                int r = unit_indices[k];
+                PyObject *cf = cfs_items[r];
+                if (cf != Py_None) {
                     LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
                     LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
                     LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
@@ -81,7 +81,7 @@ class CFPOF_DivisiveNormalizeL1_opt(CFPOutputFn):
                 }
             }
         """%c_decorators
-        inline(code, ['sheet_mask','active_units_mask','cfs','cf_type','num_cfs'],
+        inline(code, ['unit_indices','num_units','cfs','cf_type'],
                local_dict=locals(),
                headers=['<structmember.h>'])
 